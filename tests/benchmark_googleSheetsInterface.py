@@ -0,0 +1,90 @@
+"""API call benchmark for GoogleSheetsInterface against the in-process fake service.
+
+Reports the number of API calls, the wall time and the JSON bytes sent and
+received for the common interface methods, for sheets holding one to ten
+years of daily measurements. Every method is measured cold (fresh interface,
+nothing cached) and warm (second call on the same interface).
+
+Run with: python -m tests.benchmark_googleSheetsInterface [--latency 0.1]
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from tests import fake_sheets_service
+from weightloss_gadget import google_sheets_interface
+
+PERSON = "Testperson"
+START_DATE = date(2017, 1, 1)
+GAP_DAYS = 14
+
+
+def build_service(years, latency):
+    random.seed(years)
+    days = years * 365
+    weights = [round(100.0 - day * 0.01 + random.uniform(-0.5, 0.5), 1) for day in range(days - GAP_DAYS)]
+    weights += [None] * GAP_DAYS
+    service = fake_sheets_service.FakeSheetsService(latency=latency)
+    fake_sheets_service.build_weight_sheet(service, PERSON, START_DATE, weights)
+    return service, START_DATE + timedelta(days=days - 1)
+
+
+def benchmark_cases(last_day):
+    return [
+        ('read_row', lambda interface: interface.read_row(PERSON, 100)),
+        ('read_row_for_date', lambda interface: interface.read_row_for_date(PERSON, last_day - timedelta(days=30))),
+        ('read_last_saved_weight', lambda interface: interface.read_last_saved_weight(PERSON, last_day)),
+        ('read_last_updates', lambda interface: interface.read_last_updates(PERSON)),
+        ('write_weight', lambda interface: interface.write_weight(PERSON, 80.0, last_day)),
+    ]
+
+
+def measure(service, function, interface):
+    service.reset_calls()
+    start_time = time.perf_counter()
+    function(interface)
+    wall_time = time.perf_counter() - start_time
+    return {
+        'calls': len(service.calls),
+        'wall_time': wall_time,
+        'bytes': service.bytes_sent + service.bytes_received,
+    }
+
+
+def run_benchmarks(years_list=(1, 2, 5, 10), latency=0.0):
+    """Returns a list of result dicts, one per (years, method, cold/warm)."""
+    results = []
+    for years in years_list:
+        service, last_day = build_service(years, latency)
+        for method_name, function in benchmark_cases(last_day):
+            interface = google_sheets_interface.GoogleSheetsInterface(
+                client_secret_file=None,
+                application_name='benchmark',
+                sheet_id='fake',
+                service=service)
+            for state in ('cold', 'warm'):
+                result = measure(service, function, interface)
+                result.update({'years': years, 'method': method_name, 'state': state})
+                results.append(result)
+    return results
+
+
+def print_results(results):
+    print("%-5s %-24s %-5s %6s %10s %10s" % ('years', 'method', 'state', 'calls', 'wall ms', 'bytes'))
+    for result in results:
+        print("%-5i %-24s %-5s %6i %10.1f %10i" % (
+            result['years'], result['method'], result['state'],
+            result['calls'], result['wall_time'] * 1000, result['bytes']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per API request')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 2, 5, 10])
+    arguments = parser.parse_args()
+    print_results(run_benchmarks(arguments.years, arguments.latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Frame render benchmark: PIL's ImageDraw.text against the glyph atlas and text bitmap cache.
+
+Renders the frames of the watch and the weight screen the old way (new
+image, every string rasterized from the TrueType outlines) and with the
+TextRenderer on a reused Canvas, both with new text in every frame (the
+clock) and with repeated text (a weight screen).
+
+Run with: python -m tests.benchmark_textRendering [--frames 1000]
+"""
+import argparse
+import os
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from weightloss_gadget import text_rendering
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'resources', 'Roboto-Bold.ttf')
+FONT_SIZE = 14
+
+
+def frame_texts(frame_number):
+    seconds = frame_number % 86400
+    return [
+        ("%02i:%02i:%02i" % (seconds // 3600, seconds // 60 % 60, seconds % 60), "Wednesday", "2017-01-04"),
+        ("Testperson", "Yesterday", "Weight:  99.5", "Trend:  -0.4"),
+    ]
+
+
+def render_with_imagedraw(font, texts):
+    im = Image.new('1', (128, 64), color=1)
+    draw = ImageDraw.Draw(im)
+    for line, text in enumerate(texts):
+        draw.text((0, line * 14), text, font=font, fill=0)
+    return im
+
+
+def render_with_text_renderer(text_renderer, canvas, texts):
+    im = canvas.clear(1)
+    for line, text in enumerate(texts):
+        text_renderer.draw_text(im, (0, line * 14), text, 0)
+    return im
+
+
+def measure(render, frames, screen_index):
+    start_time = time.perf_counter()
+    for frame_number in range(frames):
+        render(frame_texts(frame_number)[screen_index])
+    return (time.perf_counter() - start_time) / frames
+
+
+def run_benchmarks(frames=1000):
+    """Returns a list of result dicts, one per (screen, renderer)."""
+    font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    text_renderer = text_rendering.TextRenderer(font)
+    canvas = text_rendering.Canvas(128, 64)
+    results = []
+    for screen_index, screen in enumerate(['watch', 'weight']):
+        for renderer, render in [
+                ('ImageDraw.text', lambda texts: render_with_imagedraw(font, texts)),
+                ('TextRenderer', lambda texts: render_with_text_renderer(text_renderer, canvas, texts))]:
+            results.append({'screen': screen, 'renderer': renderer,
+                            'frame_time': measure(render, frames, screen_index)})
+    return results
+
+
+def print_results(results):
+    print("%-8s %-16s %12s" % ('screen', 'renderer', 'us / frame'))
+    for result in results:
+        print("%-8s %-16s %12.1f" % (result['screen'], result['renderer'], result['frame_time'] * 1000000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=1000)
+    arguments = parser.parse_args()
+    print_results(run_benchmarks(arguments.frames))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import json
+import re
+import string
+import time
+from datetime import timedelta
+
+
+def column_id_to_nbr(column_id):
+    column_nbr = 0
+    for letter in column_id:
+        column_nbr = column_nbr * 26 + string.ascii_uppercase.index(letter) + 1
+    return column_nbr
+
+
+def column_nbr_to_id(column_nbr):
+    column_id = ""
+    while column_nbr > 0:
+        column_nbr, remainder = divmod(column_nbr - 1, 26)
+        column_id = string.ascii_uppercase[remainder] + column_id
+    return column_id
+
+
+class FakeResponse(dict):
+    """Minimal httplib2.Response: a dict of headers with a status."""
+    def __init__(self, status):
+        super().__init__()
+        self.status = status
+
+
+class FakeRequest(object):
+    def __init__(self, service, function, *args):
+        self.service = service
+        self.function = function
+        self.args = args
+
+    def execute(self):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        result = self.function(*self.args)
+        self.service.bytes_sent += len(json.dumps(self.args))
+        self.service.bytes_received += len(json.dumps(result))
+        return result
+
+
+class FakeValues(object):
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest(self.service, self.service.handle_get, range)
+
+    def batchGet(self, spreadsheetId, ranges):
+        return FakeRequest(self.service, self.service.handle_batch_get, ranges)
+
+    def batchUpdate(self, spreadsheetId, body):
+        return FakeRequest(self.service, self.service.handle_batch_update, body)
+
+
+class FakeSpreadsheets(object):
+    def __init__(self, service):
+        self.service = service
+
+    def values(self):
+        return FakeValues(self.service)
+
+
+class FakeSheetsService(object):
+    """In-process stand-in for discovery.build('sheets', 'v4').
+
+    Sheets are stored as lists of rows of strings, named ranges map a name
+    like "Testperson!StartDate" onto a plain A1 range. Every executed request
+    is appended to self.calls as (method, ranges) and the JSON size of
+    requests and responses is added up in bytes_sent / bytes_received.
+    Each request sleeps for latency seconds to imitate the network.
+    """
+    range_pattern = re.compile(r"^(?P<sheet_name>[^!]+)!(?P<start_column>[A-Z]*)(?P<start_row>[0-9]*)"
+                               r"(:(?P<end_column>[A-Z]*)(?P<end_row>[0-9]*))?$")
+
+    def __init__(self, latency=0.0):
+        self.sheets = {}
+        self.named_ranges = {}
+        self.latency = latency
+        self.reset_calls()
+
+    def spreadsheets(self):
+        return FakeSpreadsheets(self)
+
+    def reset_calls(self):
+        self.calls = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def set_cell(self, sheet_name, column_nbr, row_nbr, value):
+        rows = self.sheets.setdefault(sheet_name, [])
+        while len(rows) < row_nbr:
+            rows.append([])
+        row = rows[row_nbr - 1]
+        while len(row) < column_nbr:
+            row.append('')
+        row[column_nbr - 1] = value
+
+    def get_cell(self, sheet_name, column_nbr, row_nbr):
+        rows = self.sheets.get(sheet_name, [])
+        if row_nbr > len(rows) or column_nbr > len(rows[row_nbr - 1]):
+            return ''
+        return rows[row_nbr - 1][column_nbr - 1]
+
+    def resolve_range(self, range):
+        range = self.named_ranges.get(range, range)
+        result = self.range_pattern.match(range)
+        sheet_name = result.group('sheet_name')
+        rows = self.sheets.get(sheet_name, [])
+        max_columns = max([len(row) for row in rows] + [1])
+        start_column = column_id_to_nbr(result.group('start_column')) if result.group('start_column') else 1
+        start_row = int(result.group('start_row')) if result.group('start_row') else 1
+        if result.group('end_column') is None and result.group('end_row') is None:
+            end_column, end_row = start_column, start_row
+        else:
+            end_column = column_id_to_nbr(result.group('end_column')) if result.group('end_column') else max_columns
+            end_row = int(result.group('end_row')) if result.group('end_row') else max(len(rows), 1)
+        return sheet_name, start_column, start_row, end_column, end_row
+
+    def read_value_range(self, range):
+        sheet_name, start_column, start_row, end_column, end_row = self.resolve_range(range)
+        values = []
+        for row_nbr in range_inclusive(start_row, end_row):
+            row = [self.get_cell(sheet_name, column_nbr, row_nbr)
+                   for column_nbr in range_inclusive(start_column, end_column)]
+            while row and row[-1] == '':
+                row.pop()
+            values.append(row)
+        while values and not values[-1]:
+            values.pop()
+
+        value_range = {
+            'range': "%s!%s%i:%s%i" % (sheet_name, column_nbr_to_id(start_column), start_row,
+                                       column_nbr_to_id(end_column), end_row),
+            'majorDimension': 'ROWS',
+        }
+        if start_column == end_column and start_row == end_row:
+            value_range['range'] = "%s!%s%i" % (sheet_name, column_nbr_to_id(start_column), start_row)
+        if values:
+            value_range['values'] = values
+        return value_range
+
+    def handle_get(self, range):
+        self.calls.append(('get', [range]))
+        return self.read_value_range(range)
+
+    def handle_batch_get(self, ranges):
+        self.calls.append(('batchGet', list(ranges)))
+        return {'valueRanges': [self.read_value_range(range) for range in ranges]}
+
+    def handle_batch_update(self, body):
+        self.calls.append(('batchUpdate', [entry['range'] for entry in body['data']]))
+        for entry in body['data']:
+            sheet_name, start_column, start_row, _, _ = self.resolve_range(entry['range'])
+            for row_offset, row in enumerate(entry['values']):
+                for column_offset, value in enumerate(row):
+                    self.set_cell(sheet_name, start_column + column_offset, start_row + row_offset, str(value))
+        return {'totalUpdatedCells': sum(len(row) for entry in body['data'] for row in entry['values'])}
+
+
+def range_inclusive(first, last):
+    return range(first, last + 1)
+
+
+def build_weight_sheet(service, person, start_date, weights):
+    """Fills service with a weight sheet for person, one row per day from start_date.
+
+    weights is a list of floats or None for days without a measurement.
+    """
+    for column_nbr, header in enumerate(['Date', 'Weekday', 'Weight in kg', 'Trend', 'Variance'], start=1):
+        service.set_cell(person, column_nbr, 1, header)
+
+    trend = None
+    for offset, weight in enumerate(weights):
+        row_nbr = offset + 2
+        day = start_date + timedelta(days=offset)
+        service.set_cell(person, 1, row_nbr, day.isoformat())
+        service.set_cell(person, 2, row_nbr, day.strftime('%A'))
+        if weight is not None:
+            trend = weight if trend is None else trend + 0.1 * (weight - trend)
+            service.set_cell(person, 3, row_nbr, "%.1f" % weight)
+            service.set_cell(person, 4, row_nbr, "%.1f" % trend)
+            service.set_cell(person, 5, row_nbr, "%.1f" % (weight - trend))
+
+    service.named_ranges["%s!StartDate" % person] = "%s!A2" % person
+
+    filled_offsets = [offset for offset, weight in enumerate(weights) if weight is not None]
+    if filled_offsets:
+        last_row_nbr = filled_offsets[-1] + 2
+        last_updates = [
+            ('Last Set Day', service.get_cell(person, 1, last_row_nbr)),
+            ('Latest Measured Weight', service.get_cell(person, 3, last_row_nbr)),
+            ('Latest Trend Weight', service.get_cell(person, 4, last_row_nbr)),
+            ('Latest Variance', service.get_cell(person, 5, last_row_nbr)),
+        ]
+        for row_offset, (label, value) in enumerate(last_updates):
+            service.set_cell(person, 7, row_offset + 1, label)
+            service.set_cell(person, 8, row_offset + 1, value)
+        service.named_ranges["%s!LastUpdates" % person] = "%s!G1:H4" % person
+    return service
@@ -0,0 +1,81 @@
+import math
+from datetime import date
+from unittest import TestCase
+
+from weightloss_gadget import aggregate_index, weight_history
+
+NAN = float('nan')
+
+
+def bucket_contents(index):
+    return {period: {key: (stats.count, stats.total, stats.minimum, stats.maximum, stats.first_weight, stats.last_weight)
+                     for key, stats in buckets.items()}
+            for period, buckets in index.buckets.items()}
+
+
+class TestAggregateIndex(TestCase):
+    def setUp(self):
+        self.history = weight_history.WeightHistory("Testperson", date(2017, 1, 30))
+        for offset, weight in enumerate([NAN, 100.0, 99.0, NAN, 98.0, 97.0]):
+            self.history.set_values(offset, weight)
+        self.index = aggregate_index.AggregateIndex(self.history)
+
+    def test_window_queries(self):
+        self.assertEqual(self.index.starting_weight(), 100.0)
+        self.assertEqual(self.index.latest_weight(), 97.0)
+        self.assertAlmostEqual(self.index.mean(date(2017, 1, 30), date(2017, 2, 1)), 99.5)
+        self.assertEqual(self.index.weight_on_or_before(date(2017, 2, 2)), 99.0)
+        self.assertEqual(self.index.change(date(2017, 1, 31), date(2017, 2, 4), use_trend=False), -3.0)
+        self.assertAlmostEqual(self.index.change(date(2017, 1, 31), date(2017, 2, 1)), -0.1, places=4)
+        self.assertTrue(math.isnan(self.index.weight_on_or_before(date(2017, 1, 30))))
+
+    def test_buckets(self):
+        january = self.index.bucket('month', date(2017, 1, 1))
+        self.assertEqual((january.count, january.minimum, january.maximum), (1, 100.0, 100.0))
+        february = self.index.bucket('month', date(2017, 2, 15))
+        self.assertEqual((february.count, february.first_weight, february.last_weight), (3, 99.0, 97.0))
+        self.assertEqual(self.index.bucket('year', date(2017, 6, 1)).minimum, 97.0)
+        self.assertIsNone(self.index.bucket('year', date(2018, 1, 1)))
+
+    def test_add_weight_matches_rebuild(self):
+        self.index.add_weight(date(2017, 2, 8), 96.0)
+        self.assertEqual(self.index.latest_weight(), 96.0)
+        self.assertEqual(self.index.weight_on_or_before(date(2017, 2, 7)), 97.0)
+        self.assertEqual(self.index.bucket('month', date(2017, 2, 1)).minimum, 96.0)
+
+        rebuilt_index = aggregate_index.AggregateIndex(self.history)
+        self.assertEqual(list(rebuilt_index.trends)[1:], list(self.index.trends)[1:])
+        self.assertEqual(list(rebuilt_index.prefix_sums), list(self.index.prefix_sums))
+
+        self.index.add_weight(date(2017, 1, 30), 101.0)
+        self.assertEqual(self.index.starting_weight(), 101.0)
+
+    def assert_matches_rebuild(self):
+        rebuilt_index = aggregate_index.AggregateIndex(self.history)
+        self.assertEqual(list(rebuilt_index.prefix_sums), list(self.index.prefix_sums))
+        self.assertEqual(list(rebuilt_index.prefix_counts), list(self.index.prefix_counts))
+        self.assertEqual(list(rebuilt_index.last_measured_offsets), list(self.index.last_measured_offsets))
+        self.assertEqual(list(rebuilt_index.trends)[1:], list(self.index.trends)[1:])
+        self.assertEqual(rebuilt_index.first_measured_offset, self.index.first_measured_offset)
+        self.assertEqual(bucket_contents(rebuilt_index), bucket_contents(self.index))
+
+    def test_weighing_today_does_not_rebuild(self):
+        # read_weight_history leaves today without a weight until the person weighs themselves
+        self.history.set_values(6, NAN)
+        self.index = aggregate_index.AggregateIndex(self.history)
+
+        def fail_rebuild():
+            self.fail("weighing today rebuilt the index")
+        self.index.rebuild = fail_rebuild
+        self.index.add_weight(date(2017, 2, 5), 96.5)
+        self.assertEqual(self.index.latest_weight(), 96.5)
+        self.assertEqual(self.index.bucket('day', date(2017, 2, 5)).count, 1)
+        self.assert_matches_rebuild()
+
+    def test_changing_an_earlier_day_matches_rebuild(self):
+        self.index.add_weight(date(2017, 2, 1), 98.5)
+        self.assertEqual(self.index.bucket('month', date(2017, 2, 1)).first_weight, 98.5)
+        self.assert_matches_rebuild()
+        self.index.add_weight(date(2017, 1, 30), 101.0)
+        self.assertEqual(self.index.bucket('month', date(2017, 1, 1)).count, 2)
+        self.assert_matches_rebuild()
@@ -0,0 +1,202 @@
+import configparser
+from concurrent.futures import Future
+from datetime import date, timedelta
+from multiprocessing import Pipe
+from unittest import TestCase
+
+from PIL import Image
+
+from weightloss_gadget import controller, framebuffer, instrumentation, weight_history
+from weightloss_gadget.gui_actions import GuiActions
+
+LOGGING_CONFIG = """
+[loggers]
+keys=root
+
+[handlers]
+keys=consoleHandler
+
+[formatters]
+keys=simpleFormatter
+
+[logger_root]
+level=CRITICAL
+handlers=consoleHandler
+
+[handler_consoleHandler]
+class=StreamHandler
+level=CRITICAL
+formatter=simpleFormatter
+args=(sys.stdout,)
+
+[formatter_simpleFormatter]
+format=%(name)s - %(message)s
+"""
+
+LAST_UPDATES = {"Latest Measured Weight": 80.0, "Last Set Day": "2017-01-02",
+                "Latest Trend Weight": 80.2, "Latest Variance": -0.2}
+
+
+class FakeSheetsWorker(object):
+    """Completes every submitted call with the next of the given results; exceptions are raised."""
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def submit(self, method_name, *args, **kwargs):
+        self.calls.append(method_name)
+        future = Future()
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+        return future
+
+
+class ControllerTestCase(TestCase):
+    screens_config = ""
+
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_string("[weightloss_gadget]\nfrontend=TkInter\n" + LOGGING_CONFIG + self.screens_config)
+        self.frontend_end, controller_end = Pipe()
+        self.frame_buffer = framebuffer.SharedFramebuffer.create(128, 64)
+        self.controller = controller.Controller(controller_end, config, self.frame_buffer)
+
+    def tearDown(self):
+        self.frame_buffer.close()
+        self.frame_buffer.unlink()
+
+
+class TestLastUpdates(ControllerTestCase):
+    screens_config = "[WatchScreen]\n[WeightInputScreen]\nperson=Testperson\n"
+
+    def test_failed_read_is_retried(self):
+        self.controller.sheets_worker = FakeSheetsWorker([OSError("offline"), KeyError("Last Set Day"),
+                                                          {"Testperson": LAST_UPDATES}])
+        screen = self.controller.weight_input_screens()[0]
+        backoff = self.controller.last_updates_backoff
+
+        for failure in range(2):
+            self.controller.update_last_updates()
+            self.controller.update_last_updates()
+            self.assertTrue(screen.refresh_requested)
+            self.assertTrue(screen.is_pending())
+            self.assertIn(backoff.retry_time, self.controller.next_deadlines())
+            # Nothing is read again before the retry is due
+            self.controller.update_last_updates()
+            self.assertEqual(len(self.controller.sheets_worker.calls), failure + 1)
+            backoff.retry_time = 0.0
+        self.assertEqual(backoff.delay, 10.0)
+
+        self.controller.update_last_updates()
+        self.controller.update_last_updates()
+        self.assertFalse(screen.is_pending())
+        self.assertIsNone(backoff.retry_time)
+        self.assertIsNone(backoff.delay)
+
+
+class TestHistoryLoader(ControllerTestCase):
+    screens_config = "[WatchScreen]\n[WeightChartScreen]\nperson=Testperson\n"
+
+    def test_failed_load_is_retried(self):
+        self.controller.sheets_worker = FakeSheetsWorker([OSError("offline"), ValueError("bad weight"), "history"])
+        screen = self.controller.screens[1]
+        loader = screen.history_loader
+
+        for failure in range(2):
+            self.assertFalse(screen.does_need_update())
+            self.assertFalse(screen.does_need_update())
+            self.assertTrue(loader.refresh_requested)
+            self.assertEqual(screen.next_update_deadline(), loader.backoff.retry_time)
+            self.assertFalse(screen.does_need_update())
+            self.assertEqual(len(self.controller.sheets_worker.calls), failure + 1)
+            loader.backoff.retry_time = 0.0
+
+        self.assertTrue(screen.does_need_update())
+        self.assertEqual(loader.history, "history")
+        self.assertIsNone(screen.next_update_deadline())
+
+
+class TestFrameSending(ControllerTestCase):
+    def test_unchanged_frame_keeps_input_time(self):
+        self.controller.rotate_screen = False
+        picture = Image.new('1', (128, 64))
+        self.controller.send_picture_to_controller(picture)
+        self.assertIsNone(self.frontend_end.recv().input_time)
+
+        self.controller.instrumentation.record_input(instrumentation.InputEvent(GuiActions.RIGHT, 99.99))
+        self.controller.send_picture_to_controller(picture)
+        self.assertFalse(self.frontend_end.poll())
+        picture.putpixel((0, 0), 1)
+        self.controller.send_picture_to_controller(picture)
+        self.assertEqual(self.frontend_end.recv().input_time, 99.99)
+
+
+class TestScreenSwitching(ControllerTestCase):
+    screens_config = "[WatchScreen]\n[WeightInputScreen]\nperson=Testperson\n[WeightChartScreen]\nperson=Testperson\n"
+
+    def setUp(self):
+        super().setUp()
+        history = weight_history.WeightHistory("Testperson", date.today() - timedelta(days=2))
+        for offset in range(3):
+            history.set_values(offset, 80.0 - offset, 80.5 - offset)
+        self.controller.sheets_worker = FakeSheetsWorker([OSError("offline"), history])
+        self.controller.current_screen_index = 0
+        self.input_screen, self.chart_screen = self.controller.screens[1:]
+
+    def sent_picture(self):
+        return self.frame_buffer.read_image().tobytes()
+
+    def test_switch_shows_prerendered_frame(self):
+        self.controller.prerender_neighbours()
+        render_inputs, prerendered_picture = self.controller.prerendered_frames[1]
+        self.assertEqual(render_inputs, ('pending', 'Testperson'))
+        self.controller.render_screen = None
+
+        self.controller.switch_current_screen(1)
+        self.assertEqual(self.sent_picture(), prerendered_picture.tobytes())
+        self.assertFalse(self.controller.redraw_requested)
+        self.assertTrue(self.controller.prerender_requested)
+        self.assertEqual(self.controller.prerendered_frames, {})
+
+    def test_outdated_prerendered_frame_is_redrawn(self):
+        self.controller.prerender_neighbours()
+        self.input_screen.set_last_updates(LAST_UPDATES)
+        self.controller.switch_current_screen(1)
+        self.assertTrue(self.controller.redraw_requested)
+
+    def test_chart_is_prerendered_once_loaded(self):
+        self.controller.prerender_neighbours()
+        # The failed load leaves the chart out instead of pre-rendering "Loading..."
+        self.assertNotIn(2, self.controller.prerendered_frames)
+        self.assertTrue(self.controller.prerender_requested)
+
+        self.chart_screen.history_loader.backoff.retry_time = 0.0
+        self.controller.prerender_neighbours()
+        self.assertIn(2, self.controller.prerendered_frames)
+        self.assertFalse(self.controller.prerender_requested)
+
+        self.controller.switch_current_screen(-1)
+        self.assertIs(self.controller.get_current_screen(), self.chart_screen)
+        self.assertEqual(self.sent_picture(), self.chart_screen.render_frame().tobytes())
+
+    def test_unprepared_neighbour_is_skipped(self):
+        self.input_screen.is_prepared = False
+        self.controller.prerender_neighbours()
+        self.assertNotIn(1, self.controller.prerendered_frames)
+
+    def test_switch_latency_report(self):
+        self.assertEqual(self.controller.switch_latency_report(), {'count': 0, 'mean': None, 'max': None})
+        self.controller.switch_current_screen(1)
+        for latency in (0.01, 0.03):
+            self.controller.record_switch_latency(latency)
+        report = self.controller.switch_latency_report()
+        self.assertEqual(report['count'], 3)
+        self.assertAlmostEqual(report['max'], 0.03)
+        self.assertGreater(report['mean'], 0.01 / 3)
+
+        with self.assertLogs('Controller', 'WARNING'):
+            self.controller.record_switch_latency(self.controller.max_switch_latency * 2)
+        self.assertEqual(self.controller.switch_latency_report()['count'], 4)
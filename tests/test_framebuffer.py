@@ -0,0 +1,247 @@
+import random
+import threading
+from multiprocessing import Process
+from unittest import TestCase
+
+from PIL import Image, ImageDraw
+
+from weightloss_gadget import framebuffer
+
+
+def create_frame(text):
+    picture = Image.new('1', (128, 64), color=0)
+    ImageDraw.Draw(picture).text((0, 0), text, fill=1)
+    return picture
+
+
+class TestFrameDeduplicator(TestCase):
+    def setUp(self):
+        self.deduplicator = framebuffer.FrameDeduplicator()
+
+    def test_identical_frames_are_skipped(self):
+        self.assertTrue(self.deduplicator.is_new_frame(create_frame("12:00:00")))
+        self.assertFalse(self.deduplicator.is_new_frame(create_frame("12:00:00")))
+        self.assertTrue(self.deduplicator.is_new_frame(create_frame("12:00:01")))
+        self.assertEqual(self.deduplicator.counters(), {'rendered': 3, 'sent': 2, 'skipped': 1})
+
+    def test_returning_to_earlier_frame_is_sent(self):
+        self.deduplicator.is_new_frame(create_frame("A"))
+        self.deduplicator.is_new_frame(create_frame("B"))
+        self.assertTrue(self.deduplicator.is_new_frame(create_frame("A")))
+
+    def test_fingerprint_includes_size(self):
+        self.assertNotEqual(framebuffer.frame_fingerprint(Image.new('1', (128, 64))),
+                            framebuffer.frame_fingerprint(Image.new('1', (64, 128))))
+
+
+def write_frame(frame_buffer_name, text):
+    frame_buffer = framebuffer.SharedFramebuffer.attach(frame_buffer_name)
+    frame_buffer.write_image(create_frame(text))
+    frame_buffer.close()
+
+
+def write_alternating_frames(frame_buffer_name, count):
+    frame_buffer = framebuffer.SharedFramebuffer.attach(frame_buffer_name)
+    for frame in range(count):
+        frame_buffer.write(bytes([0x00 if frame % 2 else 0xFF]) * frame_buffer.frame_size)
+    frame_buffer.close()
+
+
+def reference_pages(picture):
+    """Page layout as computed pixel by pixel in Adafruit_SSD1306.image()."""
+    width, height = picture.size
+    pages = []
+    for page in range(height // 8):
+        for x in range(width):
+            bits = 0
+            for bit in range(8):
+                bits = bits << 1
+                bits |= 0 if picture.getpixel((x, page * 8 + 7 - bit)) == 0 else 1
+            pages.append(bits)
+    return bytes(pages)
+
+
+class TestSharedFramebuffer(TestCase):
+    def setUp(self):
+        self.frame_buffer = framebuffer.SharedFramebuffer.create(128, 64)
+
+    def tearDown(self):
+        self.frame_buffer.close()
+        self.frame_buffer.unlink()
+
+    def test_round_trip(self):
+        picture = create_frame("99.5 kg")
+        self.assertEqual(self.frame_buffer.write_image(picture), 1)
+        self.assertEqual(self.frame_buffer.write_image(create_frame("99.4 kg")), 2)
+        self.assertEqual(self.frame_buffer.write_image(picture), 3)
+        sequence, packed_pixels = self.frame_buffer.read()
+        self.assertEqual(sequence, 3)
+        self.assertEqual(len(packed_pixels), 1024)
+        self.assertEqual(self.frame_buffer.read_image().tobytes(), picture.tobytes())
+
+    def test_frame_from_other_process(self):
+        process = Process(target=write_frame, args=(self.frame_buffer.name, "Hello"))
+        process.start()
+        process.join()
+        self.assertEqual(self.frame_buffer.read_image().tobytes(), create_frame("Hello").tobytes())
+
+    def test_reads_during_writes_are_never_torn(self):
+        process = Process(target=write_alternating_frames, args=(self.frame_buffer.name, 20000))
+        process.start()
+        last_sequence = 0
+        while process.is_alive():
+            sequence, packed_pixels = self.frame_buffer.read()
+            self.assertIn(packed_pixels, (bytes(1024), b'\xff' * 1024))
+            self.assertEqual(packed_pixels[0], 0xFF if sequence % 2 else 0x00)
+            self.assertGreaterEqual(sequence, last_sequence)
+            last_sequence = sequence
+        process.join()
+
+    def test_slot_being_written_is_not_read(self):
+        self.frame_buffer.write(b'\x01' * 1024)
+        slot_offset = self.frame_buffer.slot_offset(1)
+        # A writer stopped in the middle of the copy leaves the slot counter odd
+        self.frame_buffer.SLOT_SEQUENCE.pack_into(self.frame_buffer.shared_memory.buf, slot_offset, 3)
+        reader = threading.Thread(target=self.frame_buffer.read, daemon=True)
+        reader.start()
+        reader.join(0.05)
+        self.assertTrue(reader.is_alive())
+        self.frame_buffer.SLOT_SEQUENCE.pack_into(self.frame_buffer.shared_memory.buf, slot_offset, 2)
+        reader.join(5)
+        self.assertFalse(reader.is_alive())
+
+    def test_rejects_wrong_size(self):
+        with self.assertRaises(ValueError):
+            self.frame_buffer.write_image(Image.new('1', (64, 32)))
+
+    def test_pages_match_per_pixel_conversion(self):
+        random.seed(1)
+        picture = Image.frombytes('1', (128, 64), bytes(random.getrandbits(8) for byte in range(1024)))
+        self.assertEqual(framebuffer.packed_rows_to_pages(picture.tobytes(), 128, 64), reference_pages(picture))
+
+
+class TestFrameCache(TestCase):
+    def setUp(self):
+        self.frame_cache = framebuffer.FrameCache(max_frames=2)
+        self.created = []
+
+    def creator(self, text):
+        def create_image():
+            self.created.append(text)
+            return create_frame(text)
+        return create_image
+
+    def test_blinking_frames_are_rendered_once(self):
+        for tick in range(6):
+            text = "99.5" if tick % 2 else "99. "
+            frame = self.frame_cache.get_frame(('input', text), self.creator(text))
+            self.assertEqual(frame.tobytes(), create_frame(text).tobytes())
+        self.assertEqual(self.created, ["99. ", "99.5"])
+        self.assertEqual((self.frame_cache.hits, self.frame_cache.misses), (4, 2))
+
+    def test_frames_are_copies(self):
+        canvas = create_frame("A")
+        frame = self.frame_cache.get_frame(('A',), lambda: canvas)
+        canvas.paste(1, (0, 0) + canvas.size)
+        self.assertEqual(frame.tobytes(), create_frame("A").tobytes())
+
+    def test_least_recently_used_frame_is_dropped(self):
+        for text in ["A", "B", "A", "C", "A", "B"]:
+            self.frame_cache.get_frame((text,), self.creator(text))
+        self.assertEqual(self.created, ["A", "B", "C", "B"])
+
+
+class FakeGpio(object):
+    def __init__(self):
+        self.levels = {}
+
+    def set_low(self, pin):
+        self.levels[pin] = False
+
+    def set_high(self, pin):
+        self.levels[pin] = True
+
+
+class FakeSsd1306Spi(object):
+    """SPI device recording the bytes transferred and emulating the display memory of an SSD1306.
+
+    Data fills the window of the last column and page address commands in
+    the horizontal addressing mode.
+    """
+    DC = 15
+
+    def __init__(self, gpio, width=128, height=64):
+        self.gpio = gpio
+        self.width = width
+        self.memory = bytearray(width * height // 8)
+        self.window = (0, height // 8 - 1, 0, width - 1)
+        self.transferred = 0
+
+    def write(self, data):
+        self.transferred += len(data)
+        if not self.gpio.levels[self.DC]:
+            self.command(data)
+            return
+        first_page, last_page, first_column, last_column = self.window
+        columns = last_column - first_column + 1
+        for index, value in enumerate(data):
+            page, column = first_page + index // columns, first_column + index % columns
+            self.memory[page * self.width + column] = value
+
+    def command(self, data):
+        first_page, last_page, first_column, last_column = self.window
+        for index in range(0, len(data), 3):
+            command, start, end = data[index:index + 3]
+            if command == framebuffer.SSD1306_COLUMNADDR:
+                first_column, last_column = start, end
+            elif command == framebuffer.SSD1306_PAGEADDR:
+                first_page, last_page = start, end
+        self.window = (first_page, last_page, first_column, last_column)
+
+
+class TestSsd1306PageWriter(TestCase):
+    def setUp(self):
+        gpio = FakeGpio()
+        self.spi = FakeSsd1306Spi(gpio)
+        self.writer = framebuffer.Ssd1306PageWriter(self.spi, gpio, FakeSsd1306Spi.DC, 128, 64)
+
+    def write(self, picture):
+        transferred_before = self.spi.transferred
+        bytes_sent = self.writer.write_frame(picture.tobytes())
+        self.assertEqual(self.spi.transferred - transferred_before, bytes_sent)
+        self.assertEqual(bytes(self.spi.memory), reference_pages(picture))
+        return bytes_sent
+
+    def test_first_frame_is_written_completely(self):
+        self.assertEqual(self.write(create_frame("12:00:00")), 6 + 1024)
+
+    def test_only_changed_digits_are_written(self):
+        self.write(create_frame("12:00:00"))
+        # The last digit of the seconds lies within the first two pages and a few columns
+        self.assertLess(self.write(create_frame("12:00:01")), 40)
+        self.assertEqual(self.write(create_frame("12:00:01")), 0)
+
+    def test_cleared_display(self):
+        self.writer.mark_cleared()
+        self.assertLess(self.write(create_frame("A")), 100)
+        self.writer.invalidate()
+        self.assertEqual(self.write(create_frame("A")), 6 + 1024)
+
+    def test_random_changes(self):
+        random_generator = random.Random(4)
+        picture = create_frame("")
+        self.write(picture)
+        for frame in range(20):
+            for pixel in range(random_generator.randrange(1, 30)):
+                picture.putpixel((random_generator.randrange(128), random_generator.randrange(64)),
+                                 random_generator.randrange(2))
+            self.write(picture)
+
+    def test_windows(self):
+        previous_pages = bytes(1024)
+        pages = bytearray(previous_pages)
+        pages[5] = pages[130] = 1
+        # Two narrow windows on adjacent pages cost less than one spanning columns 2 to 5
+        self.assertEqual(framebuffer.dirty_windows(previous_pages, bytes(pages), 128), [(0, 0, 5, 5), (1, 1, 2, 2)])
+        pages[5 + 128] = pages[2] = 1
+        self.assertEqual(framebuffer.dirty_windows(previous_pages, bytes(pages), 128), [(0, 1, 2, 5)])
@@ -1,6 +1,12 @@
-from datetime import date
+import json
+import math
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
 from unittest import TestCase
 
+from tests import benchmark_googleSheetsInterface, fake_sheets_service
 from weightloss_gadget import google_sheets_interface
 
 
@@ -145,4 +151,318 @@ class TestGoogleSheetsInterface(TestCase):
         self.interface.write_weight(person=self.testperson, date_object = original_date, weight=original_weight)
         row = self.interface.read_weight_row(self.testperson, 2)
         self.assertEqual(row['Weight in kg'], original_weight)
-        self.assertEqual(row['Date'], original_date)
\ No newline at end of file
+        self.assertEqual(row['Date'], original_date)
+
+class TestGoogleSheetsInterfaceApiCalls(TestCase):
+    def setUp(self):
+        self.service = fake_sheets_service.FakeSheetsService()
+        fake_sheets_service.build_weight_sheet(self.service, "Testperson", date(2017, 1, 1),
+                                               [100.0, 99.9, None, 99.5] + [99.0] * 40)
+        self.interface = google_sheets_interface.GoogleSheetsInterface(
+            client_secret_file=None,
+            application_name='dailycalories',
+            sheet_id='fake',
+            service=self.service
+        )
+        self.testperson = "Testperson"
+
+    def test_read_row_is_single_call(self):
+        row = self.interface.read_row(self.testperson, 2)
+        self.assertEqual(row['Date'], '2017-01-01')
+        self.assertEqual(row['Weight in kg'], '100.0')
+        self.assertEqual(len(self.service.calls), 1)
+
+        self.service.reset_calls()
+        row = self.interface.read_row(self.testperson, 3)
+        self.assertEqual(row['Date'], '2017-01-02')
+        self.assertEqual(row['Weight in kg'], '99.9')
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_read_row_with_empty_cells(self):
+        row = self.interface.read_row(self.testperson, 4)
+        self.assertEqual(row['Date'], '2017-01-03')
+        self.assertEqual(row['Weight in kg'], None)
+        self.assertEqual(row['Variance'], None)
+
+    def test_read_rows_block_is_single_call(self):
+        rows = self.interface.read_rows(self.testperson, 2, 11)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['Date'], '2017-01-01')
+        self.assertEqual(rows[9]['Date'], '2017-01-10')
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_collect_header_columns_is_single_call(self):
+        header_columns = self.interface.collect_header_columns(self.testperson)
+        self.assertEqual(header_columns, ['Date', 'Weekday', 'Weight in kg', 'Trend', 'Variance'])
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_read_row_for_date_call_count(self):
+        row = self.interface.read_row_for_date(self.testperson, date(2017, 1, 4))
+        self.assertEqual(row['Weight in kg'], '99.5')
+        self.assertEqual(len(self.service.calls), 2)
+
+        self.service.reset_calls()
+        row = self.interface.read_row_for_date(self.testperson, date(2017, 1, 5))
+        self.assertEqual(row['Weight in kg'], '99.0')
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_schema_is_cached_per_person(self):
+        self.service.sheets["Otherperson"] = [['Date', 'Weight in kg'], ['2018-01-01', '80.0']]
+        self.service.named_ranges["Otherperson!StartDate"] = "Otherperson!A2"
+
+        self.assertEqual(self.interface.read_row(self.testperson, 2)['Weight in kg'], '100.0')
+        self.assertEqual(self.interface.read_row_for_date("Otherperson", date(2018, 1, 1)),
+                         {'Date': '2018-01-01', 'Weight in kg': '80.0'})
+        self.assertEqual(self.interface.get_schema(self.testperson).start_date, date(2017, 1, 1))
+        self.assertEqual(self.interface.get_schema("Otherperson").start_date, date(2018, 1, 1))
+
+    def test_schema_invalidation_and_max_age(self):
+        self.interface.get_schema(self.testperson)
+        self.service.reset_calls()
+        self.interface.get_schema(self.testperson)
+        self.assertEqual(len(self.service.calls), 0)
+
+        self.interface.invalidate_schema(self.testperson)
+        self.interface.get_schema(self.testperson)
+        self.assertEqual(len(self.service.calls), 1)
+
+        self.interface.schema_max_age = 0
+        self.interface.get_schema(self.testperson)
+        self.assertEqual(len(self.service.calls), 2)
+
+    def test_read_last_saved_weight_call_count(self):
+        self.interface.get_schema(self.testperson)
+        self.service.reset_calls()
+        row = self.interface.read_last_saved_weight(self.testperson, date(2017, 1, 3))
+        self.assertEqual(row['Weight in kg'], 99.9)
+        self.assertEqual(row['Date'], '2017-01-02')
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_read_last_saved_weight_over_long_gap(self):
+        self.interface.get_schema(self.testperson)
+        self.service.reset_calls()
+        row = self.interface.read_last_saved_weight(self.testperson, date(2017, 12, 31))
+        self.assertEqual(row['Date'], '2017-02-13')
+        self.assertEqual(row['Weight in kg'], 99.0)
+        self.assertEqual(len(self.service.calls), 2)
+
+        self.service.reset_calls()
+        row = self.interface.read_last_saved_weight(self.testperson, date(2017, 12, 31))
+        self.assertEqual(row['Date'], '2017-02-13')
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_write_weight_updates_last_filled_row(self):
+        self.interface.write_weight(self.testperson, 98.5, date(2017, 6, 1))
+        self.service.reset_calls()
+        row = self.interface.read_last_saved_weight(self.testperson, date(2017, 12, 31))
+        self.assertEqual(row['Weight in kg'], 98.5)
+        self.assertEqual(len(self.service.calls), 1)
+
+    def test_read_last_updates_for_persons_is_single_call(self):
+        for person in ["Otherperson", "Thirdperson"]:
+            fake_sheets_service.build_weight_sheet(self.service, person, date(2017, 1, 1), [80.0, 79.5])
+
+        all_last_updates = self.interface.read_last_updates_for_persons([self.testperson, "Otherperson", "Thirdperson"])
+        self.assertEqual(len(self.service.calls), 1)
+        self.assertEqual(all_last_updates[self.testperson]["Latest Measured Weight"], 99.0)
+        self.assertEqual(all_last_updates["Otherperson"]["Last Set Day"], "2017-01-02")
+        self.assertEqual(all_last_updates["Thirdperson"]["Latest Measured Weight"], 79.5)
+
+    def test_read_weight_history_pages(self):
+        self.interface.get_schema(self.testperson)
+        self.service.reset_calls()
+        history = self.interface.read_weight_history(self.testperson, end_date=date(2017, 3, 1), page_size=20)
+        self.assertEqual(len(self.service.calls), 3)
+        self.assertEqual(len(history), 60)
+        self.assertEqual(history.weights[0], 100.0)
+        self.assertTrue(math.isnan(history.weights[2]))
+        self.assertTrue(math.isnan(history.weights[59]))
+
+        first_date, weights, trends = history.window(3, date(2017, 1, 4))
+        self.assertEqual(first_date, date(2017, 1, 2))
+        self.assertEqual(len(weights), 3)
+        self.assertAlmostEqual(weights[2], 99.5, places=4)
+
+    def test_read_weight_history_update_only_reads_tail(self):
+        history = self.interface.read_weight_history(self.testperson, end_date=date(2017, 3, 1))
+        self.service.set_cell(self.testperson, 3, 50, '97.0')
+        self.service.reset_calls()
+
+        history = self.interface.read_weight_history(self.testperson, end_date=date(2017, 3, 1), history=history)
+        self.assertEqual(self.service.calls, [('get', ['Testperson!C38:D61'])])
+        self.assertEqual(history.weights[48], 97.0)
+        self.assertEqual(len(history), 60)
+
+    def test_read_cells_is_single_call(self):
+        cells = [google_sheets_interface.CellReference(self.testperson, column_nbr, row_nbr)
+                 for column_nbr, row_nbr in [(1, 1), (2, 1), (3, 2), (3, 3), (5, 5), (1, 40)]]
+        values = self.interface.read_cells(cells)
+        self.assertEqual(len(self.service.calls), 1)
+        self.assertEqual(len(self.service.calls[0][1]), 2)
+        self.assertEqual(values['Testperson!A1'], 'Date')
+        self.assertEqual(values['Testperson!C3'], '99.9')
+        self.assertEqual(values['Testperson!E5'], '-0.4')
+        self.assertEqual(values['Testperson!A40'], '2017-02-08')
+
+
+class TestSheetsRange(TestCase):
+    def test_multi_letter_columns(self):
+        cell = google_sheets_interface.CellReference.FromSheetsRange("Testperson!AB12")
+        self.assertEqual(cell.column_nbr, 28)
+        self.assertEqual(cell.column_id, "AB")
+        self.assertEqual(cell.add_delta(column_delta=-2).sheets_range, "Testperson!Z12")
+
+    def test_parse_ranges(self):
+        rectangle = google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!B2:D10")
+        self.assertEqual((rectangle.kind(), rectangle.size()), ('rectangle', 27))
+        rows = google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!2:5")
+        self.assertEqual((rows.kind(), rows.first_row, rows.last_row), ('rows', 2, 5))
+        columns = google_sheets_interface.SheetsRange.FromSheetsRange("'Test person'!C:D")
+        self.assertEqual((columns.sheet_name, columns.kind(), columns.sheets_range),
+                         ('Test person', 'columns', 'Test person!C:D'))
+        self.assertIsNone(google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!StartDate"))
+        self.assertFalse(rows.contains(rectangle))
+        self.assertTrue(google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!1:20").contains(rectangle))
+
+    def test_extract(self):
+        rows = google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!1:3")
+        values = [['Date', 'Weight'], ['2017-01-01', '100.0'], ['2017-01-02']]
+        self.assertEqual(rows.extract(values, google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!B2:B3")),
+                         [['100.0']])
+        self.assertEqual(rows.extract(values, google_sheets_interface.SheetsRange.FromSheetsRange("Testperson!3:3")),
+                         [['2017-01-02']])
+
+    def test_planner_coalesces(self):
+        planner = google_sheets_interface.RequestPlanner()
+        fetch_ranges, assignments = planner.plan([
+            "Testperson!StartDate", "Testperson!1:1", "Testperson!2:2", "Testperson!A5:E5",
+            "Testperson!C3", "Testperson!C4", "Otherperson!A1", "Testperson!A900:E900"])
+        self.assertEqual([str(fetch_range) for fetch_range in fetch_ranges], [
+            "SheetsRange(Testperson!1:2)", "SheetsRange(Testperson!A3:E5)", "SheetsRange(Otherperson!A1:A1)",
+            "SheetsRange(Testperson!A900:E900)", "Testperson!StartDate"])
+        self.assertEqual(assignments, [4, 0, 0, 1, 1, 1, 2, 3])
+
+
+class TestGoogleSheetsInterfaceBenchmark(TestCase):
+    def test_call_counts_do_not_grow_with_sheet_size(self):
+        results = benchmark_googleSheetsInterface.run_benchmarks(years_list=(1, 10))
+        calls = {}
+        for result in results:
+            calls.setdefault((result['method'], result['state']), set()).add(result['calls'])
+
+        for (method, state), call_counts in calls.items():
+            self.assertEqual(len(call_counts), 1, "%s (%s) depends on the sheet size" % (method, state))
+            self.assertLessEqual(max(call_counts), 2 if state == 'cold' else 1, "%s (%s)" % (method, state))
+
+
+class FakeHttp(object):
+    def __init__(self):
+        self.requests = []
+
+    def request(self, uri):
+        self.requests.append(uri)
+        return fake_sheets_service.FakeResponse(200), b'{"name": "sheets", "version": "v4"}'
+
+
+class TestDiscoveryCache(TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temporary_directory.name, 'discovery.json')
+        self.http = FakeHttp()
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_document_is_downloaded_once(self):
+        first_document = google_sheets_interface.DiscoveryCache(self.cache_path).load(self.http)
+        second_document = google_sheets_interface.DiscoveryCache(self.cache_path).load(self.http)
+        self.assertEqual(first_document, second_document)
+        self.assertEqual(self.http.requests, [google_sheets_interface.DISCOVERY_URL])
+
+    def test_other_version_invalidates_cache(self):
+        cache = google_sheets_interface.DiscoveryCache(self.cache_path)
+        cache.load(self.http)
+        with open(self.cache_path) as cache_file:
+            cached = json.load(cache_file)
+        cached['key']['library_version'] = '0.0.1'
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump(cached, cache_file)
+
+        cache.load(self.http)
+        self.assertEqual(len(self.http.requests), 2)
+
+    def test_expired_cache_is_refreshed(self):
+        google_sheets_interface.DiscoveryCache(self.cache_path).load(self.http)
+        google_sheets_interface.DiscoveryCache(self.cache_path, max_age=0).load(self.http)
+        self.assertEqual(len(self.http.requests), 2)
+
+
+class FakeCredentials(object):
+    """Credentials whose refresh hands out a token of the given lifetime, or raises the given error."""
+    def __init__(self, lifetime, error=None):
+        self.lifetime = lifetime
+        self.error = error
+        self.refreshes = 0
+        self.refreshed = threading.Event()
+        self.token_expiry = datetime.utcnow() + self.lifetime
+
+    def refresh(self, http):
+        self.refreshes += 1
+        self.refreshed.set()
+        if self.error is not None:
+            raise self.error
+        self.token_expiry = datetime.utcnow() + self.lifetime
+
+
+class TestTokenRefresher(TestCase):
+    def run_refresher(self, refresher, seconds):
+        refresher.start()
+        self.assertTrue(refresher.credentials.refreshed.wait(5))
+        threading.Event().wait(seconds)
+        refresher.stop()
+        refresher.join()
+
+    def test_refresh_before_expiry(self):
+        refresher = google_sheets_interface.TokenRefresher(FakeCredentials(timedelta(hours=1)), 10)
+        self.assertAlmostEqual(refresher.seconds_until_refresh(), 3300, delta=1)
+        # A token living shorter than the margin is refreshed halfway
+        refresher.credentials.token_expiry = datetime.utcnow() + timedelta(seconds=120)
+        self.assertAlmostEqual(refresher.seconds_until_refresh(), 60, delta=1)
+        refresher.credentials.token_expiry = datetime.utcnow() - timedelta(seconds=10)
+        self.assertEqual(refresher.seconds_until_refresh(), 0)
+
+    def test_short_lived_token_is_not_refreshed_in_a_loop(self):
+        credentials = FakeCredentials(timedelta(seconds=-10))
+        refresher = google_sheets_interface.TokenRefresher(credentials, 10, min_refresh_interval=0.5)
+        self.run_refresher(refresher, 0.2)
+        self.assertEqual(credentials.refreshes, 1)
+
+    def test_failed_refresh_backs_off(self):
+        credentials = FakeCredentials(timedelta(seconds=-10), error=OSError("offline"))
+        refresher = google_sheets_interface.TokenRefresher(credentials, 10, retry_interval=0.05)
+        refresher.logger.disabled = True
+        self.run_refresher(refresher, 0.3)
+        # 0.05, 0.1 and 0.2 s between the attempts
+        self.assertLessEqual(credentials.refreshes, 4)
+        self.assertGreaterEqual(refresher.backoff.delay, 0.1)
+
+
+class TestCredentials(TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.home = os.environ.get('HOME')
+        os.environ['HOME'] = self.temporary_directory.name
+
+    def tearDown(self):
+        if self.home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self.home
+        self.temporary_directory.cleanup()
+
+    def test_missing_credentials_raise_instead_of_prompting(self):
+        interface = google_sheets_interface.GoogleSheetsInterface(
+            client_secret_file='client_secret.json', application_name='dailycalories', sheet_id='fake', service=object())
+        with self.assertRaisesRegex(google_sheets_interface.CredentialsError, "--authorize"):
+            interface.get_credentials()
+        self.assertTrue(interface.get_credential_path('dailycalories').startswith(self.temporary_directory.name))
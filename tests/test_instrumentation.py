@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from weightloss_gadget import instrumentation
+from weightloss_gadget.gui_actions import GuiActions
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLatencyHistogram(TestCase):
+    def test_summary(self):
+        histogram = instrumentation.LatencyHistogram()
+        for duration in [0.003, 0.004, 0.004, 0.015, 0.3]:
+            histogram.record(duration)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 5)
+        self.assertAlmostEqual(summary['mean'], 0.0652)
+        self.assertEqual((summary['min'], summary['max']), (0.003, 0.3))
+        self.assertEqual(summary['p50'], 0.005)
+        self.assertEqual(summary['p95'], 0.3)
+        self.assertEqual(sum(summary['buckets']), 5)
+
+    def test_overflow_bucket_reports_maximum(self):
+        histogram = instrumentation.LatencyHistogram()
+        histogram.record(12.0)
+        self.assertEqual(histogram.percentile(0.5), 12.0)
+
+    def test_empty(self):
+        self.assertIsNone(instrumentation.LatencyHistogram().summary()['p95'])
+
+
+class TestPipelineInstrumentation(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.instrumentation = instrumentation.PipelineInstrumentation(summary_interval=60, clock=self.clock)
+
+    def test_input_to_photon(self):
+        self.instrumentation.record_input(instrumentation.InputEvent(GuiActions.RIGHT, 99.99))
+        self.instrumentation.record_input(instrumentation.InputEvent(GuiActions.RIGHT, 99.995))
+        # The frame sent next reflects both inputs and is measured from the first one
+        input_time = self.instrumentation.take_input_time()
+        self.assertEqual(input_time, 99.99)
+        self.assertIsNone(self.instrumentation.take_input_time())
+        self.instrumentation.record_frame_shown(instrumentation.FrameShown(1, 100.002, input_time, 100.004, 100.01))
+
+        report = self.instrumentation.report()
+        self.assertEqual(report['input_queue']['count'], 2)
+        self.assertAlmostEqual(report['transport']['mean'], 0.002)
+        self.assertAlmostEqual(report['display']['mean'], 0.006)
+        self.assertAlmostEqual(report['input_to_photon']['mean'], 0.02)
+
+    def test_frame_without_input(self):
+        self.instrumentation.record_frame_shown(instrumentation.FrameShown(1, 100.0, None, 100.001, 100.002))
+        self.assertNotIn('input_to_photon', self.instrumentation.report())
+
+    def test_periodic_summary(self):
+        self.instrumentation.record('render:WatchScreen', 0.004)
+        self.assertFalse(self.instrumentation.summary_due())
+        self.clock.now += 60
+        self.assertTrue(self.instrumentation.summary_due())
+        with self.assertLogs('PipelineInstrumentation', level='INFO') as logs:
+            self.instrumentation.log_summary()
+        self.assertIn('render:WatchScreen: 1', logs.output[0])
+        self.assertFalse(self.instrumentation.summary_due())
+
+    def test_dump(self):
+        self.instrumentation.record('send', 0.001)
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            dump_path = os.path.join(temporary_directory, 'instrumentation.json')
+            self.instrumentation.dump(dump_path)
+            with open(dump_path) as dump_file:
+                self.assertEqual(json.load(dump_file)['send']['count'], 1)
+
+
+class TestStartupProfiler(TestCase):
+    def test_phases(self):
+        clock = FakeClock()
+        profiler = instrumentation.StartupProfiler(clock=clock)
+        with profiler.phase('read configuration'):
+            clock.now += 0.002
+        profiler.record('first frame', 0.05)
+        self.assertEqual([name for name, seconds in profiler.timings], ['read configuration', 'first frame'])
+        self.assertAlmostEqual(profiler.timings[0][1], 0.002)
+        report_lines = profiler.report().splitlines()
+        self.assertEqual(len(report_lines), 2)
+        self.assertIn('50.0 ms', report_lines[-1])
+
+    def test_disabled(self):
+        profiler = instrumentation.StartupProfiler(enabled=False)
+        with profiler.phase('read configuration'):
+            pass
+        profiler.record('first frame', 0.05)
+        self.assertEqual(profiler.timings, [])
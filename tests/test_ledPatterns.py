@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+from weightloss_gadget import led_patterns
+
+RED = led_patterns.solid(255, 0, 0)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestKeyframeTable(TestCase):
+    def test_interpolation(self):
+        table = led_patterns.KeyframeTable([(0.0, led_patterns.OFF), (1.0, RED)], loop=False, frame_rate=10)
+        self.assertEqual(table.frame_count, 11)
+        self.assertEqual(len(table.frames), 11 * led_patterns.FRAME_SIZE)
+        self.assertEqual(table.frame(0), led_patterns.OFF)
+        self.assertEqual(table.frame(5)[:3], bytes((128, 0, 0)))
+        self.assertEqual(table.frame(10), RED)
+        # Without a loop the last keyframe stays
+        self.assertEqual(table.frame_at(50), RED)
+        self.assertIsNone(table.next_change(10))
+
+    def test_easing(self):
+        table = led_patterns.KeyframeTable([(0.0, led_patterns.OFF), (1.0, RED)], easing=led_patterns.ease_in_out,
+                                           loop=False, frame_rate=10)
+        self.assertLess(table.frame(2)[0], 51)
+        self.assertEqual(table.frame(5)[0], 128)
+
+    def test_loop_changes(self):
+        table = led_patterns.BLINKING
+        self.assertEqual(table.change_indexes, [0, 50])
+        self.assertEqual(table.frame_at(0), led_patterns.solid(0, 255, 0))
+        self.assertEqual(table.frame_at(60), led_patterns.OFF)
+        self.assertEqual(table.frame_at(110), led_patterns.solid(0, 255, 0))
+        self.assertEqual(table.next_change(10), 50)
+        self.assertEqual(table.next_change(60), 100)
+
+    def test_spinner(self):
+        colors = led_patterns.led_colors(led_patterns.SYNCING.frame(0))
+        self.assertEqual(colors[0], '#0000FF')
+        self.assertEqual(colors[1:6], ['#000000'] * 5)
+
+
+class TestLedAnimation(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.animation = led_patterns.LedAnimation(led_patterns.BLINKING, clock=self.clock)
+
+    def test_sends_only_changed_frames(self):
+        self.assertEqual(self.animation.next_update_deadline(), 100.0)
+        self.assertTrue(self.animation.does_need_update())
+        self.assertEqual(self.animation.create_led_pattern(), led_patterns.solid(0, 255, 0))
+
+        self.clock.now += 1.0
+        self.assertFalse(self.animation.does_need_update())
+        self.assertEqual(self.animation.next_update_deadline(), 102.0)
+
+        self.clock.now += 1.0
+        self.assertTrue(self.animation.does_need_update())
+        self.assertEqual(self.animation.create_led_pattern(), led_patterns.OFF)
+        self.assertEqual(self.animation.next_update_deadline(), 104.0)
+
+    def test_stop(self):
+        self.animation.stop()
+        self.assertFalse(self.animation.does_need_update())
+        self.assertIsNone(self.animation.next_update_deadline())
+        self.assertEqual(self.animation.end_led_pattern(), led_patterns.OFF)
+
+    def test_finished_animation_has_no_deadline(self):
+        animation = led_patterns.LedAnimation(led_patterns.WEIGHT_GAIN, clock=self.clock)
+        self.clock.now += 10.0
+        self.assertTrue(animation.does_need_update())
+        self.assertEqual(animation.create_led_pattern(), led_patterns.OFF)
+        self.assertIsNone(animation.next_update_deadline())
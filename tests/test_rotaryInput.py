@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from weightloss_gadget import instrumentation, rotary_input
+from weightloss_gadget.gui_actions import GuiActions
+
+
+def event(action, created_time):
+    return instrumentation.InputEvent(action, created_time)
+
+
+class TestCoalesceTurns(TestCase):
+    def test_runs_are_merged(self):
+        frame_shown = instrumentation.FrameShown(1, 0.0, None, 0.0, 0.0)
+        received_objects = [event(GuiActions.RIGHT, 1.0), event(GuiActions.RIGHT, 1.01), frame_shown,
+                            event(GuiActions.LEFT, 1.02), event(GuiActions.RIGHT, 1.03),
+                            event(GuiActions.ACTION, 1.04), event(GuiActions.LEFT, 1.05)]
+        self.assertEqual(rotary_input.coalesce_turns(received_objects), [
+            rotary_input.RotaryTurn(2, 2, 1.0, 1.01),
+            frame_shown,
+            rotary_input.RotaryTurn(0, 2, 1.02, 1.03),
+            event(GuiActions.ACTION, 1.04),
+            rotary_input.RotaryTurn(-1, 1, 1.05, 1.05),
+        ])
+
+    def test_other_objects_are_kept(self):
+        received_objects = [event(GuiActions.EXIT_PROGRAM, 1.0)]
+        self.assertEqual(rotary_input.coalesce_turns(received_objects), received_objects)
+
+
+class TestRotaryAcceleration(TestCase):
+    def setUp(self):
+        self.acceleration = rotary_input.RotaryAcceleration()
+
+    def test_slow_detents(self):
+        self.assertAlmostEqual(self.acceleration.change(rotary_input.RotaryTurn(1, 1, 10.0, 10.0)), 0.1)
+        self.assertAlmostEqual(self.acceleration.change(rotary_input.RotaryTurn(-1, 1, 10.2, 10.2)), -0.1)
+
+    def test_fast_burst(self):
+        # Ten detents within 100 ms, drained in one go
+        self.assertAlmostEqual(self.acceleration.change(rotary_input.RotaryTurn(10, 10, 10.0, 10.1)), 10.0)
+
+    def test_speed_carries_over_between_turns(self):
+        self.acceleration.change(rotary_input.RotaryTurn(1, 1, 10.0, 10.0))
+        self.assertAlmostEqual(self.acceleration.change(rotary_input.RotaryTurn(-1, 1, 10.05, 10.05)), -1.0)
+        # After a pause the next detent is slow again
+        self.assertAlmostEqual(self.acceleration.change(rotary_input.RotaryTurn(1, 1, 11.0, 11.0)), 0.1)
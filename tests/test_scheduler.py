@@ -0,0 +1,48 @@
+import threading
+import time
+from multiprocessing import Pipe
+from unittest import TestCase
+
+from weightloss_gadget import scheduler
+
+
+class TestDeadlineScheduler(TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.DeadlineScheduler()
+        self.controller_end, self.frontend_end = Pipe()
+
+    def test_earliest_deadline(self):
+        self.assertEqual(scheduler.earliest_deadline([None, 5.0, 3.0]), 3.0)
+        self.assertIsNone(scheduler.earliest_deadline([None, None]))
+
+    def test_waits_until_deadline(self):
+        start_time = time.monotonic()
+        ready = self.scheduler.wait([self.controller_end], [None, start_time + 0.05])
+        self.assertEqual(ready, [])
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.04)
+
+    def test_past_deadline_does_not_block(self):
+        start_time = time.monotonic()
+        self.scheduler.wait([self.controller_end], [start_time - 1.0])
+        self.assertLess(time.monotonic() - start_time, 0.05)
+
+    def test_input_ends_wait_before_deadline(self):
+        timer = threading.Timer(0.01, self.frontend_end.send, ["input"])
+        timer.start()
+        start_time = time.monotonic()
+        ready = self.scheduler.wait([self.controller_end], [start_time + 10.0])
+        timer.join()
+        self.assertEqual(ready, [self.controller_end])
+        self.assertLess(time.monotonic() - start_time, 1.0)
+        self.assertEqual(self.controller_end.recv(), "input")
+
+    def test_wake_up_from_other_thread(self):
+        timer = threading.Timer(0.01, self.scheduler.wake_up)
+        timer.start()
+        start_time = time.monotonic()
+        # Without any deadline only the wake up ends the wait
+        ready = self.scheduler.wait([self.controller_end], [None])
+        timer.join()
+        self.assertEqual(ready, [])
+        self.assertLess(time.monotonic() - start_time, 1.0)
+        self.assertFalse(self.scheduler.wakeup_reader.poll())
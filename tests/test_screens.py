@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from weightloss_gadget import screens
+
+
+class FakeController(object):
+    def wake_up(self):
+        pass
+
+
+class FakeSocket(object):
+    """Stands in for the socket module and counts the blocking lookups."""
+    def __init__(self):
+        self.lookups = 0
+
+    def gethostname(self):
+        return 'gadget'
+
+    def gethostbyname(self, hostname):
+        self.lookups += 1
+        return '192.168.1.23'
+
+
+class TestScreenPreparation(TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        cache_path = os.path.join(self.temporary_directory.name, 'weather_cache.json')
+        # A reading from before a restart, so prepare() does not need the network
+        with open(cache_path, 'w') as cache_file:
+            json.dump({'place': '8000,ch', 'fetched_at': time.time() - 150,
+                       'data': {'name': 'Zurich', 'main': {'temp': 21.5}}}, cache_file)
+        config = {'api_key': 'key', 'zip_code': '8000', 'country_code': 'ch', 'cache_path': cache_path}
+        self.screen = screens.WeatherScreen(FakeController(), config)
+
+    def tearDown(self):
+        if self.screen.weather_refresher is not None:
+            self.screen.weather_refresher.stop()
+        self.temporary_directory.cleanup()
+
+    def test_placeholder_until_prepared(self):
+        self.assertFalse(self.screen.is_prepared)
+        self.assertIsNone(self.screen.frame_inputs())
+        self.assertIsNone(self.screen.next_update_deadline())
+        placeholder = self.screen.render_frame().copy()
+        self.assertEqual(placeholder.tobytes(), self.screen.placeholder_image().tobytes())
+
+        self.screen.prepare()
+        self.screen.is_prepared = True
+        self.assertEqual(self.screen.frame_inputs(), ('Zurich', '21.5 C', '2 min ago'))
+        self.assertNotEqual(self.screen.render_frame().tobytes(), placeholder.tobytes())
+
+    def test_redraws_when_age_changes(self):
+        self.screen.prepare()
+        self.screen.is_prepared = True
+        self.assertTrue(self.screen.does_need_update())
+        self.assertFalse(self.screen.does_need_update())
+        # The age shown changes at the next full minute, 30 s after the 150 s old reading
+        self.assertAlmostEqual(self.screen.next_update_deadline() - time.monotonic(), 30, delta=1)
+
+    def test_shows_missing_reading_until_refresher_fetched_one(self):
+        os.remove(self.screen.weather_cache.cache_path)
+        # Nothing listens there, so every fetch fails at once
+        self.screen.weather_cache.query_url = "http://127.0.0.1:1/data/2.5/weather"
+        self.screen.prepare()
+        self.screen.is_prepared = True
+        self.assertTrue(self.screen.weather_refresher.is_alive())
+        self.assertEqual(self.screen.frame_inputs(), ('Weather', 'No reading yet', ''))
+        self.assertIsNone(self.screen.next_update_deadline())
+        self.screen.render_frame()
+
+        with self.screen.weather_cache.lock:
+            self.screen.weather_cache.data = {'name': 'Zurich', 'main': {'temp': 21.5}}
+            self.screen.weather_cache.fetched_at = time.time()
+        self.assertTrue(self.screen.does_need_update())
+        self.assertEqual(self.screen.frame_inputs(), ('Zurich', '21.5 C', 'just now'))
+
+    def test_screens_without_preparation(self):
+        self.assertFalse(screens.AbstractScreen.needs_preparation)
+        self.assertTrue(screens.IpAddressScreen(None, {}).is_prepared)
+
+
+class TestIpAddressScreen(TestCase):
+    def setUp(self):
+        self.fake_socket = FakeSocket()
+        self.addCleanup(setattr, screens, 'socket', screens.socket)
+        screens.socket = self.fake_socket
+        self.screen = screens.IpAddressScreen(None, {})
+
+    def test_address_is_resolved_once(self):
+        self.assertIsNone(self.screen.render_inputs())
+        self.assertTrue(self.screen.does_need_update())
+        self.assertFalse(self.screen.does_need_update())
+        self.assertEqual(self.screen.render_inputs(), ('192.168.1.23', 'gadget'))
+        self.screen.render_frame()
+        self.screen.render_frame()
+        self.assertEqual(self.fake_socket.lookups, 1)
+
+    def test_preload_resolves_address(self):
+        self.assertTrue(self.screen.preload())
+        self.assertEqual(self.screen.frame_inputs(), ('192.168.1.23', 'gadget'))
+        self.assertEqual(self.fake_socket.lookups, 1)
@@ -0,0 +1,93 @@
+from datetime import date
+from unittest import TestCase
+
+from tests import fake_sheets_service
+from weightloss_gadget import google_sheets_interface, sheet_mirror
+
+
+class TestSheetMirror(TestCase):
+    def setUp(self):
+        self.service = fake_sheets_service.FakeSheetsService()
+        fake_sheets_service.build_weight_sheet(self.service, "Testperson", date(2017, 1, 1),
+                                               [100.0, 99.9, None, 99.5] + [99.0] * 20)
+        self.interface = google_sheets_interface.GoogleSheetsInterface(
+            client_secret_file=None,
+            application_name='dailycalories',
+            sheet_id='fake',
+            service=self.service
+        )
+        self.mirror = sheet_mirror.SheetMirror(self.interface, ':memory:', max_age=300)
+        self.interface.mirror = self.mirror
+        self.testperson = "Testperson"
+
+    def test_reads_are_served_locally_once_loaded(self):
+        row = self.interface.read_row_for_date(self.testperson, date(2017, 1, 2))
+        self.assertEqual(row['Weight in kg'], '99.9')
+        self.assertEqual(len(self.service.calls), 2)
+
+        self.service.reset_calls()
+        row = self.interface.read_row_for_date(self.testperson, date(2017, 1, 4))
+        self.assertEqual(row['Weight in kg'], '99.5')
+        row = self.interface.read_last_saved_weight(self.testperson, date(2017, 1, 3))
+        self.assertEqual(row['Weight in kg'], 99.9)
+        self.assertEqual(len(self.service.calls), 0)
+
+    def test_sync_only_rereads_recent_rows(self):
+        self.mirror.load(self.testperson)
+        self.service.set_cell(self.testperson, 3, 25, '98.0')
+        self.service.reset_calls()
+
+        self.assertEqual(self.mirror.sync(self.testperson), 1)
+        self.assertEqual(self.service.calls, [('get', ['Testperson!A18:E'])])
+        self.assertEqual(self.mirror.read_last_saved_row(self.testperson, date(2017, 2, 1))['Weight in kg'], '98.0')
+
+    def test_stale_rows_are_served_when_offline(self):
+        self.mirror.load(self.testperson)
+        self.mirror.invalidate(self.testperson)
+
+        def raise_network_error(range):
+            raise OSError("Network is unreachable")
+        self.service.handle_get = raise_network_error
+
+        row = self.interface.read_row_for_date(self.testperson, date(2017, 1, 1))
+        self.assertEqual(row['Weight in kg'], '100.0')
+
+    def test_write_weight_updates_mirror(self):
+        self.mirror.load(self.testperson)
+        self.interface.write_weight(self.testperson, 97.5, date(2017, 1, 3))
+        self.assertFalse(self.mirror.is_fresh(self.testperson))
+        self.assertEqual(self.interface.read_row_for_date(self.testperson, date(2017, 1, 3))['Weight in kg'], '97.5')
+
+    def go_offline(self):
+        def raise_network_error(*args):
+            raise OSError("Network is unreachable")
+        self.service.handle_get = raise_network_error
+        self.service.handle_batch_get = raise_network_error
+
+    def test_last_updates_are_served_when_offline(self):
+        last_updates = self.interface.read_last_updates_for_persons([self.testperson])
+        self.go_offline()
+        self.assertEqual(self.interface.read_last_updates_for_persons([self.testperson]), last_updates)
+        self.assertEqual(last_updates[self.testperson]["Latest Measured Weight"], 99.0)
+
+    def test_last_updates_never_read_are_not_served(self):
+        self.go_offline()
+        with self.assertRaises(OSError):
+            self.interface.read_last_updates_for_persons([self.testperson])
+
+    def test_weight_history_is_served_from_mirror(self):
+        end_date = date(2017, 2, 5)
+        history = self.interface.read_weight_history(self.testperson, end_date=end_date)
+        self.interface.mirror = None
+        self.interface.invalidate_schema(self.testperson)
+        read_history = self.interface.read_weight_history(self.testperson, end_date=end_date)
+        self.assertEqual(len(history), len(read_history))
+        self.assertEqual(str(history.weights), str(read_history.weights))
+        self.assertEqual(str(history.trends), str(read_history.trends))
+
+        self.interface.mirror = self.mirror
+        self.mirror.invalidate(self.testperson)
+        self.go_offline()
+        self.assertEqual(str(self.interface.read_weight_history(self.testperson, end_date=end_date).weights),
+                         str(history.weights))
+
@@ -0,0 +1,56 @@
+import threading
+from datetime import date
+from unittest import TestCase
+
+from tests import fake_sheets_service
+from weightloss_gadget import google_sheets_interface, sheets_worker
+
+
+class TestSheetsWorker(TestCase):
+    def setUp(self):
+        self.service = fake_sheets_service.FakeSheetsService()
+        fake_sheets_service.build_weight_sheet(self.service, "Testperson", date(2017, 1, 1), [100.0, 99.9])
+        self.creating_threads = []
+        self.worker = sheets_worker.SheetsWorker(self.create_interface)
+
+    def tearDown(self):
+        self.worker.shutdown()
+
+    def create_interface(self):
+        self.creating_threads.append(threading.current_thread())
+        return google_sheets_interface.GoogleSheetsInterface(
+            client_secret_file=None,
+            application_name='dailycalories',
+            sheet_id='fake',
+            service=self.service
+        )
+
+    def test_calls_run_on_worker_thread(self):
+        future = self.worker.submit('read_row', "Testperson", 3)
+        self.assertEqual(future.result(timeout=5)['Weight in kg'], '99.9')
+        self.assertEqual(len(self.creating_threads), 1)
+        self.assertIsNot(self.creating_threads[0], threading.current_thread())
+
+    def test_blocking_proxy(self):
+        proxy = sheets_worker.BlockingInterfaceProxy(self.worker)
+        proxy.write_weights([("Testperson", 98.0, date(2017, 1, 3))])
+        self.assertEqual(proxy.read_startdate("Testperson"), date(2017, 1, 1))
+        self.assertEqual(self.service.get_cell("Testperson", 3, 4), '98.0')
+
+
+class TestRetryBackoff(TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.backoff = sheets_worker.RetryBackoff(retry_interval=5.0, max_retry_interval=12.0, clock=lambda: self.now)
+
+    def test_delay_grows_until_success(self):
+        self.assertTrue(self.backoff.is_due())
+        self.assertEqual([self.backoff.failed() for attempt in range(3)], [5.0, 10.0, 12.0])
+        self.assertEqual(self.backoff.retry_time, 112.0)
+        self.assertFalse(self.backoff.is_due())
+        self.now = 112.0
+        self.assertTrue(self.backoff.is_due())
+        self.backoff.started()
+        self.assertIsNone(self.backoff.retry_time)
+        self.backoff.succeeded()
+        self.assertEqual(self.backoff.failed(), 5.0)
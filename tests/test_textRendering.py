@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from PIL import Image, ImageDraw, ImageFont
+
+from tests import benchmark_textRendering
+from weightloss_gadget import text_rendering
+
+
+class TestTextRenderer(TestCase):
+    def setUp(self):
+        self.font = ImageFont.truetype(benchmark_textRendering.FONT_PATH, benchmark_textRendering.FONT_SIZE)
+        self.text_renderer = text_rendering.TextRenderer(self.font, cache_size=4)
+
+    def render_with_imagedraw(self, text):
+        im = Image.new('1', (128, 20), color=0)
+        ImageDraw.Draw(im).text((3, 2), text, font=self.font, fill=1)
+        return im
+
+    def render_with_text_renderer(self, text):
+        im = Image.new('1', (128, 20), color=0)
+        self.text_renderer.draw_text(im, (3, 2), text, 1)
+        return im
+
+    def test_matches_imagedraw(self):
+        for text in ["12:34:56", "Wednesday", "Weight:  99.5", "Trend:  -0.4", "Loading...", "jgq", "Testperson",
+                     "Yesterday", "a b"]:
+            self.assertEqual(self.render_with_text_renderer(text).tobytes(),
+                             self.render_with_imagedraw(text).tobytes(), text)
+
+    def test_composed_text_is_cached(self):
+        self.render_with_text_renderer("Today")
+        self.render_with_text_renderer("Today")
+        cache_info = self.text_renderer.text_bitmap.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (1, 1))
+
+    def test_glyphs_outside_atlas_are_added(self):
+        self.assertNotIn('ü', self.text_renderer.atlas.glyphs)
+        self.assertEqual(self.render_with_text_renderer("Zürich").tobytes(),
+                         self.render_with_imagedraw("Zürich").tobytes())
+        self.assertIn('ü', self.text_renderer.atlas.glyphs)
+
+    def test_text_without_ink(self):
+        self.assertEqual(self.render_with_text_renderer("   ").getbbox(), None)
+
+    def test_canvas_is_reused(self):
+        canvas = text_rendering.Canvas(128, 64)
+        first_image = canvas.clear(1)
+        self.text_renderer.draw_text(first_image, (0, 0), "Hello", 0)
+        second_image = canvas.clear(1)
+        self.assertIs(first_image, second_image)
+        self.assertEqual(second_image.tobytes(), Image.new('1', (128, 64), color=1).tobytes())
+
+
+class TestTextRenderingBenchmark(TestCase):
+    def test_renderers_draw_the_same_frames(self):
+        # Timings vary too much between machines for the unit suite, only the output is compared here
+        font = ImageFont.truetype(benchmark_textRendering.FONT_PATH, benchmark_textRendering.FONT_SIZE)
+        text_renderer = text_rendering.TextRenderer(font)
+        canvas = text_rendering.Canvas(128, 64)
+        for frame_number in (0, 1, 3599, 86399):
+            for texts in benchmark_textRendering.frame_texts(frame_number):
+                self.assertEqual(
+                    benchmark_textRendering.render_with_text_renderer(text_renderer, canvas, texts).tobytes(),
+                    benchmark_textRendering.render_with_imagedraw(font, texts).tobytes(), texts)
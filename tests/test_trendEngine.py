@@ -0,0 +1,44 @@
+import math
+from array import array
+from datetime import date
+from unittest import TestCase
+
+from weightloss_gadget import trend_engine
+
+NAN = float('nan')
+
+
+class TestTrendEngine(TestCase):
+    def setUp(self):
+        self.engine = trend_engine.TrendEngine(smoothing=0.1)
+
+    def test_compute(self):
+        trends, variances = self.engine.compute(array('f', [100.0, 99.0, 98.0]))
+        self.assertAlmostEqual(trends[0], 100.0, places=4)
+        self.assertAlmostEqual(trends[1], 99.9, places=4)
+        self.assertAlmostEqual(trends[2], 99.71, places=4)
+        self.assertAlmostEqual(variances[2], 98.0 - 99.71, places=4)
+
+    def test_gaps_keep_trend(self):
+        trends, variances = self.engine.compute(array('f', [NAN, 100.0, NAN, NAN, 90.0]))
+        self.assertTrue(math.isnan(trends[0]))
+        self.assertAlmostEqual(trends[3], 100.0, places=4)
+        self.assertTrue(math.isnan(variances[3]))
+        self.assertAlmostEqual(trends[4], 99.0, places=4)
+
+    def test_incremental_matches_full_computation(self):
+        weights = array('f', [100.0, 99.5, NAN, 99.0, 98.7])
+        trends, variances = self.engine.compute(weights)
+
+        person_trend = trend_engine.PersonTrend(self.engine, date(2017, 1, 4), weights[3], trends[3])
+        trend, variance = person_trend.add_weight(date(2017, 1, 5), weights[4])
+        self.assertAlmostEqual(trend, trends[4], places=4)
+        self.assertAlmostEqual(variance, variances[4], places=4)
+
+    def test_same_day_entry_replaces_measurement(self):
+        person_trend = trend_engine.PersonTrend(self.engine, date(2017, 1, 4), 99.0, 99.5)
+        first_trend, _ = person_trend.add_weight(date(2017, 1, 5), 98.0)
+        corrected_trend, _ = person_trend.add_weight(date(2017, 1, 5), 99.0)
+        self.assertAlmostEqual(corrected_trend, 99.5 + 0.1 * (99.0 - 99.5))
+        self.assertNotAlmostEqual(first_trend, corrected_trend)
+        self.assertIsNone(person_trend.add_weight(date(2017, 1, 1), 99.0))
@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from weightloss_gadget import led_patterns, user_interface
+
+
+class FakeWidget(object):
+    def __init__(self):
+        self.options = {}
+
+    def configure(self, **options):
+        self.options.update(options)
+
+
+class FakeTk(object):
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay_ms, callback):
+        self.scheduled.append(callback)
+
+
+class FakePipe(object):
+    def __init__(self, received_objects):
+        self.received_objects = list(received_objects)
+
+    def poll(self):
+        return bool(self.received_objects)
+
+    def recv(self):
+        return self.received_objects.pop(0)
+
+
+class TestTkinterApp(TestCase):
+    def setUp(self):
+        # Without a display only the pipe handling is tested, the widgets are fakes
+        self.app = user_interface.TkinterApp.__new__(user_interface.TkinterApp)
+        self.app.top = FakeTk()
+        self.app.leds = [FakeWidget() for led in range(led_patterns.NUMBER_OF_LEDS)]
+        self.app.poll_interval_ms = 10
+
+    def test_led_frame_from_pipe(self):
+        self.app.pipe = FakePipe([led_patterns.solid(255, 0, 0), led_patterns.SYNCING.frame(0)])
+        self.app.check_pipe_poll()
+        self.assertEqual(self.app.leds[0].options['bg'], '#0000FF')
+        self.assertEqual([led.options['bg'] for led in self.app.leds[1:6]], ['#000000'] * 5)
+        # The spinner's tail, the red frame before it is overwritten
+        self.assertEqual(self.app.leds[7].options['bg'], '#00007F')
+        # The poll keeps running after an LED frame
+        self.assertEqual(self.app.top.scheduled, [self.app.check_pipe_poll])
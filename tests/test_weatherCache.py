@@ -0,0 +1,168 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from weightloss_gadget import weather_cache
+
+WEATHER_RESPONSE = {'name': 'Zurich', 'main': {'temp': 21.5}}
+
+
+class FakeWeatherHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        time.sleep(self.server.delay)
+        body = json.dumps(self.server.response).encode('utf-8')
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeWeatherServer(ThreadingHTTPServer):
+    """Local stand-in for the OpenWeatherMap current weather endpoint."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeWeatherHandler)
+        self.requests = []
+        self.response = WEATHER_RESPONSE
+        self.status = 200
+        self.delay = 0.0
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%i/data/2.5/weather?zip=8000,ch" % self.server_address[1]
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1500000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWeatherCache(TestCase):
+    def setUp(self):
+        self.server = FakeWeatherServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.server_thread.start()
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temporary_directory.name, 'weather_cache.json')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temporary_directory.cleanup()
+
+    def create_cache(self, place='8000,ch', **kwargs):
+        return weather_cache.WeatherCache(self.server.url, place, cache_path=self.cache_path, clock=self.clock,
+                                          **kwargs)
+
+    def test_refresh(self):
+        cache = self.create_cache(ttl=600)
+        self.assertIsNone(cache.age())
+        self.assertEqual(cache.seconds_until_stale(), 0.0)
+        self.assertEqual(cache.refresh(), WEATHER_RESPONSE)
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.clock.now += 90
+        self.assertEqual(cache.age(), 90)
+        self.assertEqual(cache.seconds_until_stale(), 510)
+
+    def test_reading_survives_restart(self):
+        self.create_cache().refresh()
+        self.clock.now += 120
+
+        cache = self.create_cache()
+        cache.load()
+        self.assertEqual(cache.reading(), (WEATHER_RESPONSE, self.clock.now - 120))
+        self.assertEqual(cache.age(), 120)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_reading_of_other_place_is_ignored(self):
+        self.create_cache().refresh()
+        cache = self.create_cache(place='55424,US')
+        cache.load()
+        self.assertIsNone(cache.age())
+
+    def test_damaged_cache_file_is_ignored(self):
+        with open(self.cache_path, 'w') as cache_file:
+            cache_file.write('{"place": "8000,ch", "fet')
+        cache = self.create_cache()
+        cache.load()
+        self.assertIsNone(cache.age())
+
+    def test_cache_file_of_wrong_shape_is_ignored(self):
+        for cached in (['8000,ch'], {'place': '8000,ch'}, {'place': '8000,ch', 'data': {}, 'fetched_at': None}):
+            with open(self.cache_path, 'w') as cache_file:
+                json.dump(cached, cache_file)
+            cache = self.create_cache()
+            cache.load()
+            self.assertIsNone(cache.age())
+
+    def test_unwritable_cache_file_keeps_new_reading(self):
+        self.cache_path = os.path.join(self.temporary_directory.name, 'missing', 'weather_cache.json')
+        cache = self.create_cache()
+        self.assertEqual(cache.refresh(), WEATHER_RESPONSE)
+        self.assertEqual(cache.age(), 0)
+
+    def test_failed_refresh_keeps_reading(self):
+        cache = self.create_cache()
+        cache.refresh()
+        self.server.status = 500
+        with self.assertRaises(OSError):
+            cache.refresh()
+        self.server.status = 200
+        self.server.response = {'cod': 401, 'message': 'Invalid API key'}
+        with self.assertRaises(ValueError):
+            cache.refresh()
+        self.assertEqual(cache.reading()[0], WEATHER_RESPONSE)
+
+    def test_timeout(self):
+        self.server.delay = 0.5
+        cache = self.create_cache(http_timeout=0.1)
+        start_time = time.monotonic()
+        with self.assertRaises(OSError):
+            cache.refresh()
+        self.assertLess(time.monotonic() - start_time, 0.4)
+
+    def test_refresher_fetches_stale_reading(self):
+        updated = threading.Event()
+        cache = self.create_cache(ttl=600)
+        refresher = weather_cache.WeatherRefresher(cache, on_update=updated.set)
+        refresher.start()
+        try:
+            self.assertTrue(updated.wait(5))
+            self.assertEqual(cache.reading()[0], WEATHER_RESPONSE)
+            # The fresh reading is not fetched again before it turns stale
+            time.sleep(0.05)
+            self.assertEqual(len(self.server.requests), 1)
+        finally:
+            refresher.stop()
+            refresher.join()
+
+    def test_refresher_reports_reading_it_could_not_write(self):
+        updated = threading.Event()
+        self.cache_path = os.path.join(self.temporary_directory.name, 'missing', 'weather_cache.json')
+        refresher = weather_cache.WeatherRefresher(self.create_cache(), retry_interval=60.0, on_update=updated.set)
+        refresher.start()
+        try:
+            self.assertTrue(updated.wait(5))
+        finally:
+            refresher.stop()
+            refresher.join()
+
+    def test_format_age(self):
+        self.assertEqual(weather_cache.format_age(5), "just now")
+        self.assertEqual(weather_cache.format_age(150), "2 min ago")
+        self.assertEqual(weather_cache.format_age(7300), "2 h ago")
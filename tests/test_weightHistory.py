@@ -0,0 +1,32 @@
+from datetime import date
+from unittest import TestCase
+
+from weightloss_gadget import weight_history
+
+
+class TestWeightHistory(TestCase):
+    def setUp(self):
+        self.history = weight_history.WeightHistory("Testperson", date(2017, 1, 1))
+        for offset in range(5):
+            self.history.set_values(offset, 100.0 - offset, 100.5 - offset)
+
+    def test_window(self):
+        first_date, weights, trends = self.history.window(2, date(2017, 1, 3))
+        self.assertEqual(first_date, date(2017, 1, 2))
+        self.assertEqual(list(weights), [99.0, 98.0])
+        self.assertEqual(list(trends), [99.5, 98.5])
+
+    def test_window_after_end_is_cut(self):
+        first_date, weights, trends = self.history.window(3, date(2017, 2, 1))
+        self.assertEqual(first_date, date(2017, 1, 3))
+        self.assertEqual(list(weights), [98.0, 97.0, 96.0])
+
+    def test_window_before_start_is_empty(self):
+        for days in (None, 3):
+            first_date, weights, trends = self.history.window(days, date(2016, 12, 30))
+            self.assertEqual(len(weights), 0)
+            self.assertEqual(len(trends), 0)
+
+    def test_window_of_empty_history(self):
+        first_date, weights, trends = weight_history.WeightHistory("Testperson", date(2017, 1, 1)).window(30)
+        self.assertEqual((len(weights), len(trends)), (0, 0))
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+from datetime import date
+from unittest import TestCase
+
+from tests import fake_sheets_service
+from weightloss_gadget import google_sheets_interface, write_journal
+
+
+class TestWriteJournal(TestCase):
+    def setUp(self):
+        self.service = fake_sheets_service.FakeSheetsService()
+        fake_sheets_service.build_weight_sheet(self.service, "Testperson", date(2017, 1, 1), [100.0] * 10)
+        fake_sheets_service.build_weight_sheet(self.service, "Otherperson", date(2017, 1, 1), [80.0] * 10)
+        self.interface = google_sheets_interface.GoogleSheetsInterface(
+            client_secret_file=None,
+            application_name='dailycalories',
+            sheet_id='fake',
+            service=self.service
+        )
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.journal = write_journal.WriteJournal(os.path.join(self.temporary_directory.name, 'journal.jsonl'))
+        self.flusher = write_journal.JournalFlusher(self.journal, self.interface)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_entries_survive_reopening(self):
+        self.journal.append("Testperson", 99.5, date(2017, 1, 11))
+        self.journal.append("Testperson", 99.4, date(2017, 1, 12))
+
+        reopened_journal = write_journal.WriteJournal(self.journal.journal_path)
+        self.assertEqual(reopened_journal.depth(), 2)
+        self.assertEqual(reopened_journal.pending_entries()[1]['weight'], 99.4)
+
+    def test_flush_coalesces_into_one_batch_update(self):
+        self.interface.get_schema("Testperson")
+        self.interface.get_schema("Otherperson")
+        self.service.reset_calls()
+
+        self.journal.append("Testperson", 99.5, date(2017, 1, 11))
+        self.journal.append("Testperson", 99.6, date(2017, 1, 11))
+        self.journal.append("Testperson", 99.4, date(2017, 1, 12))
+        self.journal.append("Otherperson", 79.5, date(2017, 1, 11))
+
+        self.assertEqual(self.flusher.flush(), 3)
+        self.assertEqual(self.service.calls,
+                         [('batchUpdate', ['Testperson!C12', 'Testperson!C13', 'Otherperson!C12'])])
+        self.assertEqual(self.service.get_cell("Testperson", 3, 12), '99.6')
+        self.assertEqual(self.journal.depth(), 0)
+
+    def test_failed_flush_keeps_entries(self):
+        self.journal.append("Testperson", 99.5, date(2017, 1, 11))
+
+        def raise_network_error(body):
+            raise OSError("Network is unreachable")
+        self.service.handle_batch_update = raise_network_error
+
+        with self.assertRaises(OSError):
+            self.flusher.flush()
+        self.assertEqual(self.flusher.journal_depth(), 1)
+
+    def test_failing_entries_are_quarantined(self):
+        self.flusher.max_failures = 2
+        self.journal.append("Testperson", 99.5, date(2017, 1, 11))
+        self.journal.append("Nobody", 70.0, date(2017, 1, 11))
+        with open(self.journal.journal_path, 'a') as journal_file:
+            journal_file.write('{"id": "cut short by a power lo\n')
+
+        # The unknown person fails the batch, the other entry is still written
+        with self.assertRaises(write_journal.JournalFlushError):
+            self.flusher.flush()
+        self.assertEqual(self.service.get_cell("Testperson", 3, 12), '99.5')
+        self.assertEqual(self.journal.pending_entries()[0]['person'], "Nobody")
+
+        self.assertEqual(self.flusher.flush(), 0)
+        self.assertEqual(self.journal.depth(), 0)
+        with open(self.journal.quarantine_path()) as quarantine_file:
+            quarantined_lines = quarantine_file.read().splitlines()
+        self.assertEqual(len(quarantined_lines), 2)
+        self.assertIn('cut short', quarantined_lines[0])
+        self.assertIn('Nobody', quarantined_lines[1])
+
+    def test_flusher_survives_unexpected_errors(self):
+        flushed = []
+        self.flusher = write_journal.JournalFlusher(self.journal, self.interface, retry_interval=0.01,
+                                                    on_flush=flushed.append)
+        self.journal.append("Testperson", 99.5, date(2017, 1, 11))
+        write_weights = self.interface.write_weights
+        failures = []
+
+        def fail_once(writes):
+            if not failures:
+                failures.append(writes)
+                raise RuntimeError("unexpected")
+            return write_weights(writes)
+        self.interface.write_weights = fail_once
+
+        self.flusher.start()
+        self.flusher.wake_up()
+        try:
+            for attempt in range(500):
+                if flushed:
+                    break
+                time.sleep(0.01)
+        finally:
+            self.flusher.stop()
+            self.flusher.join()
+        self.assertEqual(flushed, [{"Testperson"}])
+        self.assertEqual(self.journal.depth(), 0)
@@ -0,0 +1,180 @@
+import math
+from array import array
+from datetime import timedelta
+
+from weightloss_gadget import trend_engine
+
+NAN = float('nan')
+PERIODS = ('day', 'week', 'month', 'year')
+
+
+def bucket_key(period, date_object):
+    if period == 'day':
+        return date_object
+    elif period == 'week':
+        return date_object.isocalendar()[:2]
+    elif period == 'month':
+        return (date_object.year, date_object.month)
+    elif period == 'year':
+        return date_object.year
+    raise ValueError("Unknown period %s" % period)
+
+
+class BucketStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = NAN
+        self.maximum = NAN
+        self.first_weight = NAN
+        self.last_weight = NAN
+
+    def add(self, weight):
+        if self.count == 0:
+            self.minimum = self.maximum = self.first_weight = weight
+        else:
+            self.minimum = min(self.minimum, weight)
+            self.maximum = max(self.maximum, weight)
+        self.count += 1
+        self.total += weight
+        self.last_weight = weight
+
+    def mean(self):
+        return self.total / self.count if self.count else NAN
+
+
+class AggregateIndex(object):
+    """Summary statistics of a person's weight history that answer window queries in constant time.
+
+    Per day the index keeps prefix sums and counts of the measured weights,
+    the offset of the last measurement up to that day and the smoothed
+    trend. Day, week, month and year buckets keep count, sum, min, max and
+    the first and last weight. All of it is built once from a WeightHistory
+    and extended in O(1) when a weight for a new day, or for the last day
+    while it has none, is added.
+    """
+    def __init__(self, history, engine=None):
+        self.history = history
+        self.engine = engine if engine is not None else trend_engine.TrendEngine()
+        self.rebuild()
+
+    def rebuild(self):
+        self.prefix_sums = array('d', [0.0])
+        self.prefix_counts = array('l', [0])
+        self.last_measured_offsets = array('l')
+        self.trends, variances = self.engine.compute(self.history.weights)
+        self.buckets = {period: {} for period in PERIODS}
+        self.first_measured_offset = None
+        for offset, weight in enumerate(self.history.weights):
+            self.index_day(offset, weight)
+
+    def append_day(self, offset, weight):
+        previous_trend = self.trends[-1] if self.trends else NAN
+        self.trends.append(self.engine.day_trend(previous_trend, weight))
+        self.index_day(offset, weight)
+
+    def index_day(self, offset, weight):
+        """Adds everything but the trend of the day at offset, which is the next day indexed."""
+        measured = not math.isnan(weight)
+        self.prefix_sums.append(self.prefix_sums[-1] + (weight if measured else 0.0))
+        self.prefix_counts.append(self.prefix_counts[-1] + (1 if measured else 0))
+        previous_measured = self.last_measured_offsets[-1] if self.last_measured_offsets else -1
+        self.last_measured_offsets.append(offset if measured else previous_measured)
+        if measured:
+            if self.first_measured_offset is None:
+                self.first_measured_offset = offset
+            date_object = self.date_for(offset)
+            for period in PERIODS:
+                self.buckets[period].setdefault(bucket_key(period, date_object), BucketStats()).add(weight)
+
+    def date_for(self, offset):
+        return self.history.start_date + timedelta(days=offset)
+
+    def truncate(self, offset):
+        """Drops the indexed days from offset on, append_day() adds them again.
+
+        Only the buckets holding a dropped measurement are touched, so
+        dropping days that have no weight (like today before weighing) is
+        O(1).
+        """
+        dropped_offsets = [day for day in range(offset, len(self.last_measured_offsets))
+                           if not math.isnan(self.history.weights[day])]
+        if dropped_offsets:
+            for period in PERIODS:
+                for day in dropped_offsets:
+                    self.buckets[period].pop(bucket_key(period, self.date_for(day)), None)
+                self.refill_bucket(period, bucket_key(period, self.date_for(offset)), offset)
+        del self.prefix_sums[offset + 1:]
+        del self.prefix_counts[offset + 1:]
+        del self.last_measured_offsets[offset:]
+        del self.trends[offset:]
+        if self.first_measured_offset is not None and self.first_measured_offset >= offset:
+            self.first_measured_offset = None
+
+    def refill_bucket(self, period, key, end_offset):
+        """Collects the measurements before end_offset that fall into the bucket key again."""
+        if key in self.buckets[period]:
+            return
+        first_offset = end_offset
+        while first_offset > 0 and bucket_key(period, self.date_for(first_offset - 1)) == key:
+            first_offset -= 1
+        for day in range(first_offset, end_offset):
+            weight = self.history.weights[day]
+            if not math.isnan(weight):
+                self.buckets[period].setdefault(key, BucketStats()).add(weight)
+
+    def add_weight(self, date_object, weight):
+        """Adds a measurement; O(1) for the last indexed day while it has no weight and for later days.
+
+        Changing an earlier day drops the index from that day on and appends
+        the days again.
+        """
+        offset = self.history.offset_for_date(date_object)
+        indexed_days = len(self.last_measured_offsets)
+        if offset < indexed_days:
+            self.truncate(offset)
+        self.history.set_day(date_object, weight)
+        for day in range(len(self.last_measured_offsets), max(offset + 1, indexed_days)):
+            self.append_day(day, self.history.weights[day])
+
+    def clamp_offset(self, date_object):
+        return min(self.history.offset_for_date(date_object), len(self.last_measured_offsets) - 1)
+
+    def weight_on_or_before(self, date_object):
+        offset = self.clamp_offset(date_object)
+        if offset < 0 or self.last_measured_offsets[offset] < 0:
+            return NAN
+        return self.history.weights[self.last_measured_offsets[offset]]
+
+    def trend_on(self, date_object):
+        offset = self.clamp_offset(date_object)
+        return self.trends[offset] if offset >= 0 else NAN
+
+    def mean(self, first_date, last_date):
+        first_offset = max(0, self.history.offset_for_date(first_date))
+        last_offset = self.clamp_offset(last_date)
+        if last_offset < first_offset:
+            return NAN
+        count = self.prefix_counts[last_offset + 1] - self.prefix_counts[first_offset]
+        if count == 0:
+            return NAN
+        return (self.prefix_sums[last_offset + 1] - self.prefix_sums[first_offset]) / count
+
+    def change(self, first_date, last_date, use_trend=True):
+        """Change of the trend (or of the last measured weight) between two days."""
+        if use_trend:
+            return self.trend_on(last_date) - self.trend_on(first_date)
+        return self.weight_on_or_before(last_date) - self.weight_on_or_before(first_date)
+
+    def starting_weight(self):
+        if self.first_measured_offset is None:
+            return NAN
+        return self.history.weights[self.first_measured_offset]
+
+    def latest_weight(self):
+        if not self.last_measured_offsets or self.last_measured_offsets[-1] < 0:
+            return NAN
+        return self.history.weights[self.last_measured_offsets[-1]]
+
+    def bucket(self, period, date_object):
+        return self.buckets[period].get(bucket_key(period, date_object))
@@ -1,23 +1,54 @@
 from multiprocessing import Process, Pipe
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import collections
 import configparser
 import logging
+import logging.config
 import re
+import signal
+import threading
 import time
-from weightloss_gadget import user_interface, screens, gui_actions
+IMPORT_START_TIME = time.perf_counter()
+# The Google API client, the Sheets modules and the frontends are imported where
+# they are first needed, so a gadget without them configured never loads them
+from weightloss_gadget import screens, gui_actions, sheets_worker, scheduler, framebuffer, instrumentation, rotary_input
+IMPORT_TIME = time.perf_counter() - IMPORT_START_TIME
 
 GuiActions = gui_actions.GuiActions
 
 class Controller(Process):
-    def __init__(self, pipe, config):
+    def __init__(self, pipe, config, frame_buffer, startup_profiler=None):
         super().__init__()
         self.config = config
+        self.frame_buffer = frame_buffer
         logging.config.fileConfig(self.config, disable_existing_loggers=False)
 
         self.get_logger()
         self.pipe = pipe
+        self.sheets_interface = None
+        self.sheets_worker = None
+        self.write_journal = None
+        self.journal_flusher = None
+        self.last_updates_future = None
+        self.last_updates_backoff = sheets_worker.RetryBackoff()
+        self.scheduler = None
+        self.redraw_requested = False
+        self.frame_deduplicator = framebuffer.FrameDeduplicator()
+        self.prerendered_frames = {}
+        self.prerender_requested = True
+        self.switch_latencies = collections.deque(maxlen=100)
+        self.max_switch_latency = self.config.getfloat('weightloss_gadget', 'max_switch_latency', fallback=0.05)
+        self.instrumentation = instrumentation.PipelineInstrumentation(
+            summary_interval=self.config.getfloat('weightloss_gadget', 'instrumentation_summary_interval', fallback=300))
+        self.instrumentation_dump_path = self.config.get(
+            'weightloss_gadget', 'instrumentation_dump_path', fallback='../instrumentation.json')
+        self.startup_profiler = startup_profiler or instrumentation.StartupProfiler(enabled=False)
+        self.startup_reported = not self.startup_profiler.enabled
+        self.preparation_executor = None
+        self.preparation_futures = {}
 
         self.screens = self.setup_screens_from_config()
-        self.update_frequency = 0.1
         self.rotate_screen = self.config.getboolean('weightloss_gadget', 'rotate_screen', fallback=False)
 
         self.led_pattern = None
@@ -45,6 +76,166 @@ class Controller(Process):
 
         return screen_instances
 
+    def get_sheets_interface(self):
+        from weightloss_gadget import google_sheets_interface, sheet_mirror
+        if self.sheets_interface is None:
+            sheets_config = self.config['GoogleSheetsInterface']
+            self.sheets_interface = google_sheets_interface.GoogleSheetsInterface(
+                client_secret_file=sheets_config['client_secret_file'],
+                application_name=sheets_config['application_name'],
+                sheet_id=sheets_config['sheet_id'],
+                schema_max_age=sheets_config.getfloat('schema_max_age', fallback=3600),
+                http_timeout=sheets_config.getfloat('http_timeout', fallback=10))
+            mirror_path = sheets_config.get('mirror_path')
+            if mirror_path:
+                self.sheets_interface.mirror = sheet_mirror.SheetMirror(
+                    self.sheets_interface, mirror_path,
+                    max_age=sheets_config.getfloat('mirror_max_age', fallback=300))
+        return self.sheets_interface
+
+    def get_sheets_worker(self):
+        if self.sheets_worker is None:
+            self.sheets_worker = sheets_worker.SheetsWorker(self.get_sheets_interface, on_done=self.wake_up)
+        return self.sheets_worker
+
+    def get_write_journal(self):
+        from weightloss_gadget import write_journal
+        if self.write_journal is None:
+            journal_path = self.config.get('GoogleSheetsInterface', 'journal_path', fallback='../write_journal.jsonl')
+            self.write_journal = write_journal.WriteJournal(journal_path)
+        return self.write_journal
+
+    def start_journal_flusher(self):
+        from weightloss_gadget import write_journal
+        retry_interval = self.config.getfloat('GoogleSheetsInterface', 'journal_retry_interval', fallback=5.0)
+        self.journal_flusher = write_journal.JournalFlusher(
+            self.get_write_journal(), sheets_worker.BlockingInterfaceProxy(self.get_sheets_worker()),
+            retry_interval=retry_interval, on_flush=self.on_journal_flushed)
+        self.journal_flusher.start()
+        # Entries left over from before a restart are written right away
+        self.journal_flusher.wake_up()
+
+    def save_weight(self, person, weight, date_object):
+        self.get_write_journal().append(person, weight, date_object)
+        for screen in self.screens:
+            if getattr(screen, 'person', None) == person and hasattr(screen, 'record_weight'):
+                screen.record_weight(weight, date_object)
+        if self.journal_flusher is not None:
+            self.journal_flusher.wake_up()
+
+    def weight_input_screens(self):
+        return [screen for screen in self.screens if isinstance(screen, screens.WeightInputScreen)]
+
+    def on_journal_flushed(self, persons):
+        for screen in self.screens:
+            if getattr(screen, 'person', None) in persons:
+                screen.refresh_current_data()
+        self.wake_up()
+
+    def wake_up(self):
+        """Makes the loop re-check the screens; may be called from any thread."""
+        if self.scheduler is not None:
+            self.scheduler.wake_up()
+
+    def update_last_updates(self):
+        """Refreshes the LastUpdates of all weight screens with one batched request.
+
+        Called on every loop iteration: submits the request as soon as any
+        screen asks for a refresh, and hands the results to the screens once
+        the request has completed. A failed request is retried with a
+        growing delay.
+        """
+        weight_input_screens = self.weight_input_screens()
+        if self.last_updates_future is None:
+            if any(screen.refresh_requested for screen in weight_input_screens) and self.last_updates_backoff.is_due():
+                for screen in weight_input_screens:
+                    screen.refresh_requested = False
+                persons = sorted(set(screen.person for screen in weight_input_screens))
+                self.last_updates_backoff.started()
+                self.last_updates_future = self.get_sheets_worker().submit('read_last_updates_for_persons', persons)
+            return
+
+        if not self.last_updates_future.done():
+            return
+
+        # Already imported by the worker that read the last updates
+        from weightloss_gadget import google_sheets_interface
+        future, self.last_updates_future = self.last_updates_future, None
+        try:
+            all_last_updates = future.result()
+            for screen in weight_input_screens:
+                if screen.person in all_last_updates:
+                    screen.set_last_updates(all_last_updates[screen.person])
+        except google_sheets_interface.NETWORK_ERRORS as exception:
+            self.logger.warning("Could not read last updates, retrying in %.0f s: %s",
+                                self.last_updates_backoff.failed(), exception)
+        except Exception:
+            # A changed sheet or configuration, logged with its traceback
+            self.logger.exception("Could not read last updates, retrying in %.0f s", self.last_updates_backoff.failed())
+        else:
+            self.last_updates_backoff.succeeded()
+            return
+        for screen in weight_input_screens:
+            screen.refresh_requested = True
+
+    def start_screen_preparation(self):
+        """Submits prepare() of all screens that need it, the current screen and its neighbours first."""
+        current_screen_index = self.screens.index(self.get_current_screen())
+
+        def distance_to_current_screen(screen_index):
+            distance = abs(screen_index - current_screen_index)
+            return min(distance, len(self.screens) - distance)
+
+        for screen_index in sorted(range(len(self.screens)), key=distance_to_current_screen):
+            if not self.screens[screen_index].is_prepared:
+                self.prepare_screen(self.screens[screen_index])
+
+    def prepare_screen(self, screen):
+        if screen in self.preparation_futures.values():
+            return
+        if self.preparation_executor is None:
+            self.preparation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ScreenPreparation')
+        future = self.preparation_executor.submit(self.timed_preparation, screen)
+        future.add_done_callback(lambda future: self.wake_up())
+        self.preparation_futures[future] = screen
+
+    @staticmethod
+    def timed_preparation(screen):
+        start_time = time.perf_counter()
+        screen.prepare()
+        return time.perf_counter() - start_time
+
+    def check_screen_preparation(self):
+        """Marks the screens whose prepare() has finished as prepared, called on every loop iteration."""
+        for future in [future for future in self.preparation_futures if future.done()]:
+            screen = self.preparation_futures.pop(future)
+            screen_name = screen.__class__.__name__
+            try:
+                duration = future.result()
+            except Exception as exception:
+                # The placeholder stays, the next switch to the screen tries again
+                self.logger.warning("Could not prepare %s: %s", screen_name, exception)
+                continue
+            screen.is_prepared = True
+            self.instrumentation.record('prepare:' + screen_name, duration)
+            self.startup_profiler.record('prepare ' + screen_name, duration)
+            self.prerendered_frames.pop(self.screens.index(screen), None)
+            if screen is self.get_current_screen():
+                self.redraw_requested = True
+            else:
+                self.prerender_requested = True
+
+    def report_startup(self):
+        """Prints the --profile-startup report once the first frame is sent and all screens are prepared.
+
+        The profiler was copied into this process after main() timed its
+        phases, so the report covers the whole startup.
+        """
+        if self.startup_reported or self.frame_deduplicator.sent == 0 or self.preparation_futures:
+            return
+        self.startup_reported = True
+        print("Startup:\n" + self.startup_profiler.report())
+
     def get_logger(self):
         logging.config.fileConfig(self.config, disable_existing_loggers=False)
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -58,41 +249,146 @@ class Controller(Process):
         self.__dict__.update(state)
         self.get_logger()
 
+    def dump_instrumentation(self, signal_number=None, frame=None):
+        """Writes the instrumentation report as JSON; also the handler of SIGUSR1."""
+        self.instrumentation.dump(self.instrumentation_dump_path)
+        self.logger.info("Instrumentation written to %s", self.instrumentation_dump_path)
+
+    def render_screen(self, screen):
+        render_start_time = time.perf_counter()
+        picture = screen.render_frame()
+        self.instrumentation.record('render:' + screen.__class__.__name__, time.perf_counter() - render_start_time)
+        return picture
+
     def run(self):
+        run_start_time = time.perf_counter()
+        self.scheduler = scheduler.DeadlineScheduler()
+        # kill -USR1 <pid> dumps the instrumentation; signals can only be handled on the main thread
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self.dump_instrumentation)
+        # Slow screens show a placeholder until they are prepared in the background
+        self.start_screen_preparation()
+        if self.config.has_section('GoogleSheetsInterface'):
+            with self.startup_profiler.phase('start journal flusher'):
+                self.start_journal_flusher()
+
+        # The first frame is drawn right away, a placeholder if the current screen is not prepared yet
+        self.redraw_requested = True
         process_running = True
         while process_running:
-            if self.get_current_screen().does_need_update():
-                picture = self.get_current_screen().create_image()
+            self.check_screen_preparation()
+            self.update_last_updates()
+
+            # does_need_update() is always asked, screens advance their deadlines in it
+            if self.get_current_screen().does_need_update() or self.redraw_requested:
+                self.redraw_requested = False
+                picture = self.render_screen(self.get_current_screen())
                 self.send_picture_to_controller(picture)
+                if run_start_time is not None:
+                    self.startup_profiler.record('first frame', time.perf_counter() - run_start_time)
+                    run_start_time = None
+            self.report_startup()
 
             if self.is_led_pattern_set() and self.led_pattern.does_need_update():
                 current_leds_state = self.led_pattern.create_led_pattern()
                 self.send_leds_state_to_controller(current_leds_state)
-                self.logger.debug("current_leds_state: {}", current_leds_state)
-
-            if self.pipe.poll():
-                received_object = self.pipe.recv()
-                self.logger.info ("Controller: Received object: %s (type %s)"%(received_object, type(received_object)))
-                if received_object.value == GuiActions.EXIT_PROGRAM.value:
-                    self.logger.debug("Controller: shutting down")
-                    process_running = False
-                if self.get_current_screen().handles_input() and self.get_current_screen().input_mode:
-                    self.get_current_screen().handle_input(received_object)
-                else:
-                    if received_object.value == GuiActions.LEFT.value:
-                        self.switch_current_screen(-1)
-                    elif received_object.value == GuiActions.RIGHT.value:
-                        self.switch_current_screen(1)
-                    elif received_object.value == GuiActions.ACTION.value:
-                        if self.get_current_screen().handles_input():
-                            self.get_current_screen().set_input_mode(not self.get_current_screen().input_mode)
-
-            time.sleep(self.update_frequency)
+                self.logger.debug("current_leds_state: %s", current_leds_state)
+
+            if self.instrumentation.summary_due():
+                self.instrumentation.log_summary()
+
+            # Idle time goes into the screens a LEFT or RIGHT switches to
+            if self.prerender_requested and not self.pipe.poll():
+                self.prerender_neighbours()
+
+            if self.scheduler.wait([self.pipe], self.next_deadlines()):
+                process_running = self.handle_received_objects(self.drain_pipe())
+
+        self.logger.info("Frames: %s, screen switches: %s", self.frame_counters(), self.switch_latency_report())
+        self.instrumentation.log_summary()
+        if self.journal_flusher is not None:
+            self.journal_flusher.stop()
+        if self.sheets_worker is not None:
+            self.sheets_worker.shutdown()
+        if self.preparation_executor is not None:
+            self.preparation_executor.shutdown(wait=False)
+
+    def next_deadlines(self):
+        deadlines = [self.get_current_screen().next_update_deadline(), self.instrumentation.next_summary_time,
+                     self.last_updates_backoff.retry_time]
+        if self.is_led_pattern_set():
+            deadlines.append(self.led_pattern.next_update_deadline())
+        return deadlines
+
+    def drain_pipe(self):
+        received_objects = []
+        while self.pipe.poll():
+            received_objects.append(self.pipe.recv())
+        return received_objects
+
+    def handle_received_objects(self, received_objects):
+        """Handles everything received in one go, a quick spin of the rotary encoder as a single turn.
+
+        Returns False once the program should exit.
+        """
+        for received_object in rotary_input.coalesce_turns(received_objects):
+            if not self.handle_received_object(received_object):
+                return False
+        return True
+
+    def handle_received_object(self, received_object):
+        """Handles one input event, returns False once the program should exit."""
+        if isinstance(received_object, instrumentation.FrameShown):
+            self.instrumentation.record_frame_shown(received_object)
+            return True
+        if isinstance(received_object, rotary_input.RotaryTurn):
+            self.instrumentation.record_input(received_object)
+            self.handle_turn(received_object)
+            return True
+        if isinstance(received_object, instrumentation.InputEvent):
+            self.instrumentation.record_input(received_object)
+            received_object = received_object.action
+        self.logger.info("Controller: Received object: %s (type %s)"%(received_object, type(received_object)))
+        if received_object.value == GuiActions.EXIT_PROGRAM.value:
+            self.logger.debug("Controller: shutting down")
+            return False
+        if self.get_current_screen().handles_input() and self.get_current_screen().input_mode:
+            self.get_current_screen().handle_input(received_object)
+            self.redraw_requested = True
+        else:
+            if received_object.value == GuiActions.LEFT.value:
+                self.switch_current_screen(-1)
+            elif received_object.value == GuiActions.RIGHT.value:
+                self.switch_current_screen(1)
+            elif received_object.value == GuiActions.ACTION.value:
+                if self.get_current_screen().handles_input():
+                    self.get_current_screen().set_input_mode(not self.get_current_screen().input_mode)
+                    self.redraw_requested = True
+        return True
+
+    def handle_turn(self, turn):
+        self.logger.info("Controller: Received turn by %i detents (net %+i)", turn.detents, turn.delta)
+        if self.get_current_screen().handles_input() and self.get_current_screen().input_mode:
+            self.get_current_screen().handle_input(turn)
+            self.redraw_requested = True
+        elif turn.delta:
+            self.switch_current_screen(turn.delta)
 
     def send_picture_to_controller(self, picture):
         if self.rotate_screen:
             picture = picture.rotate(180)
-        self.pipe.send(picture)
+        if self.frame_deduplicator.is_new_frame(picture):
+            send_start_time = time.monotonic()
+            # An unchanged frame leaves the input time for the frame that shows the input
+            input_time = self.instrumentation.take_input_time()
+            # Only the small notification is pickled, the pixels go through shared memory
+            sequence = self.frame_buffer.write_image(picture)
+            self.pipe.send(framebuffer.FrameReady(sequence, time.monotonic(), input_time))
+            self.instrumentation.record('send', time.monotonic() - send_start_time)
+
+    def frame_counters(self):
+        """Number of frames rendered, sent to the frontend and skipped as unchanged."""
+        return self.frame_deduplicator.counters()
 
     def send_leds_state_to_controller(self, leds_state):
         self.pipe.send(leds_state)
@@ -104,24 +400,68 @@ class Controller(Process):
         return self.screens[self.current_screen_index]
 
     def switch_current_screen(self, delta):
-        min_allowed_index = 0
-        max_allowed_index = len(self.screens)-1
-
-        self.current_screen_index += delta
-
-        if self.current_screen_index < min_allowed_index:
-            self.current_screen_index = max_allowed_index
-
-        if self.current_screen_index > max_allowed_index:
-            self.current_screen_index = min_allowed_index
-
-        picture = self.get_current_screen().create_image()
+        switch_start_time = time.perf_counter()
+        self.get_current_screen()
+        # A fast turn moves by several screens, wrapping around at both ends
+        self.current_screen_index = (self.current_screen_index + delta) % len(self.screens)
+
+        screen = self.get_current_screen()
+        if not screen.is_prepared:
+            self.prepare_screen(screen)
+        prerendered_frame = self.prerendered_frames.get(self.current_screen_index)
+        self.prerendered_frames = {}
+        if prerendered_frame is None:
+            picture = self.render_screen(screen)
+        else:
+            # Shown right away and replaced on the next loop iteration if it is outdated
+            render_inputs, picture = prerendered_frame
+            if render_inputs is None or render_inputs != screen.frame_inputs():
+                self.redraw_requested = True
         self.send_picture_to_controller(picture)
         if self.led_pattern:
             self.led_pattern.stop()
             self.send_leds_state_to_controller(self.led_pattern.end_led_pattern())
             self.led_pattern = None
 
+        self.record_switch_latency(time.perf_counter() - switch_start_time)
+        self.prerender_requested = True
+
+    def prerender_neighbours(self):
+        """Renders the screens next to the current one, so switching to them shows a frame at once.
+
+        Screens still being prepared are left to check_screen_preparation(),
+        which asks for another pre-render once they are ready. A screen whose
+        data is still loading is tried again on the next loop iteration, the
+        worker loading it wakes the loop when it is done.
+        """
+        self.prerender_requested = False
+        current_screen_index = self.screens.index(self.get_current_screen())
+        for delta in (-1, 1):
+            screen_index = (current_screen_index + delta) % len(self.screens)
+            if screen_index == current_screen_index or screen_index in self.prerendered_frames:
+                continue
+            screen = self.screens[screen_index]
+            if not screen.is_prepared:
+                continue
+            if not screen.preload():
+                self.prerender_requested = True
+                continue
+            self.prerendered_frames[screen_index] = (screen.frame_inputs(), self.render_screen(screen).copy())
+
+    def record_switch_latency(self, latency):
+        self.switch_latencies.append(latency)
+        if latency > self.max_switch_latency:
+            self.logger.warning("Switching to %s took %.0f ms", self.get_current_screen().__class__.__name__,
+                                latency * 1000)
+
+    def switch_latency_report(self):
+        """Count, mean and maximum of the last screen switch latencies in seconds."""
+        if not self.switch_latencies:
+            return {'count': 0, 'mean': None, 'max': None}
+        return {'count': len(self.switch_latencies),
+                'mean': sum(self.switch_latencies) / len(self.switch_latencies),
+                'max': max(self.switch_latencies)}
+
     def is_led_pattern_set(self):
         return self.led_pattern is not None
 
@@ -131,21 +471,43 @@ class Controller(Process):
         else:
             self.led_pattern = None
 
-def main():
-    config = configparser.ConfigParser()
-    config.read(r"../config.ini") # @TODO: find the correct file once this is all packaged nicely
-
-    logging.config.fileConfig(config, disable_existing_loggers=False)
-    logger = logging.getLogger(__name__)
-    logger.info("Loaded Logging Configuration")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weightloss gadget")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print the time spent in each phase of the startup")
+    parser.add_argument('--authorize', action='store_true',
+                        help="store the Google Sheets credentials interactively and exit")
+    args = parser.parse_args(argv)
+    startup_profiler = instrumentation.StartupProfiler(enabled=args.profile_startup)
+    startup_profiler.record('import modules', IMPORT_TIME)
+
+    with startup_profiler.phase('read configuration'):
+        config = configparser.ConfigParser()
+        config.read(r"../config.ini") # @TODO: find the correct file once this is all packaged nicely
+
+    with startup_profiler.phase('configure logging'):
+        logging.config.fileConfig(config, disable_existing_loggers=False)
+        logger = logging.getLogger(__name__)
+        logger.info("Loaded Logging Configuration")
+
+    if args.authorize:
+        from weightloss_gadget import google_sheets_interface
+        sheets_config = config['GoogleSheetsInterface']
+        google_sheets_interface.authorize(sheets_config['client_secret_file'], sheets_config['application_name'])
+        return
 
     parent_conn, child_conn = Pipe()
+    frame_buffer = framebuffer.SharedFramebuffer.create(screens.SCREEN_WIDTH, screens.SCREEN_HEIGHT)
 
-    controller_process = Controller(child_conn, config)
+    with startup_profiler.phase('create controller and screens'):
+        controller_process = Controller(child_conn, config, frame_buffer, startup_profiler)
 
     frontend = config['weightloss_gadget']['frontend']
+    with startup_profiler.phase('import frontend'):
+        from weightloss_gadget import user_interface
     if frontend == 'TkInter':
-        tkinter_app = user_interface.TkinterApp(parent_conn)
+        with startup_profiler.phase('create frontend'):
+            tkinter_app = user_interface.TkinterApp(parent_conn, frame_buffer)
         controller_process.start()
         tkinter_app.top.mainloop()
         controller_process.join()
@@ -154,11 +516,15 @@ def main():
         import Adafruit_SSD1306
         import RPi.GPIO as GPIO
 
-        ssd1306_app = user_interface.Ssd1306App(parent_conn)
+        with startup_profiler.phase('create frontend'):
+            ssd1306_app = user_interface.Ssd1306App(parent_conn, frame_buffer)
         ssd1306_app.start()
         controller_process.start()
         controller_process.join()
         ssd1306_app.join()
 
+    frame_buffer.close()
+    frame_buffer.unlink()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,286 @@
+import struct
+from collections import OrderedDict, namedtuple
+from multiprocessing.shared_memory import SharedMemory
+
+from PIL import Image
+
+# Byte with its bits in reverse order, for bytes.translate
+BIT_REVERSAL = bytes(int('{:08b}'.format(byte)[::-1], 2) for byte in range(256))
+
+# Column and page address commands, each followed by the first and the last address of the window
+SSD1306_COLUMNADDR = 0x21
+SSD1306_PAGEADDR = 0x22
+SSD1306_WINDOW_COMMANDS = (SSD1306_COLUMNADDR, 0, 0, SSD1306_PAGEADDR, 0, 0)
+
+
+def frame_fingerprint(picture):
+    """Mode, size and packed pixels of a PIL image; equal fingerprints show the same frame.
+
+    For the 128x64 1-bit display the packed pixels are only 1024 bytes, so
+    they are kept as they are instead of a hash that could collide.
+    """
+    return picture.mode, picture.size, picture.tobytes()
+
+
+class FrameDeduplicator(object):
+    """Remembers the last frame delivered to the frontend and counts rendered, sent and skipped frames."""
+    def __init__(self):
+        self.last_fingerprint = None
+        self.rendered = 0
+        self.sent = 0
+        self.skipped = 0
+
+    def is_new_frame(self, picture):
+        """Counts a rendered frame, returns False if it equals the last frame sent."""
+        self.rendered += 1
+        fingerprint = frame_fingerprint(picture)
+        if fingerprint == self.last_fingerprint:
+            self.skipped += 1
+            return False
+        self.last_fingerprint = fingerprint
+        self.sent += 1
+        return True
+
+    def counters(self):
+        return {'rendered': self.rendered, 'sent': self.sent, 'skipped': self.skipped}
+
+
+class FrameCache(object):
+    """The last few finished frames of a screen, keyed by the inputs they were rendered from.
+
+    Frames are stored as copies, as screens draw every frame on the same
+    Canvas. The least recently used frame is dropped once more than
+    max_frames are stored.
+    """
+    def __init__(self, max_frames=4):
+        self.max_frames = max_frames
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_frame(self, render_inputs, create_image):
+        """Returns the frame for render_inputs, calling create_image() only if it is not cached."""
+        if render_inputs in self.frames:
+            self.frames.move_to_end(render_inputs)
+            self.hits += 1
+            return self.frames[render_inputs]
+        self.misses += 1
+        frame = create_image().copy()
+        self.frames[render_inputs] = frame
+        if len(self.frames) > self.max_frames:
+            self.frames.popitem(last=False)
+        return frame
+
+    def clear(self):
+        self.frames.clear()
+
+
+class FrameReady(namedtuple('FrameReady', ['sequence', 'sent_time', 'input_time'])):
+    """Pipe notification that frame number sequence is in the SharedFramebuffer.
+
+    sent_time is the time.monotonic() it was sent at, input_time the time of
+    the earliest input event it reflects (None if there was none); the
+    frontend returns both in an instrumentation.FrameShown.
+    """
+
+
+class SharedFramebuffer(object):
+    """Double buffered 1-bit framebuffer in shared memory.
+
+    Layout: a header with the sequence number of the latest frame and the
+    frame size, followed by two slots. Each slot starts with its own
+    sequence counter, followed by the packed pixels as produced by
+    Image.tobytes() for mode '1' (rows of width / 8 bytes, most significant
+    bit first).
+
+    Every slot is a seqlock: frame n is written into slot n % 2 with the
+    slot counter set to the odd 2n - 1 during the copy and to the even 2n
+    after it, and only then the header is updated. A reader copies the
+    slot of the frame n named in the header and retries unless the counter
+    was 2n before and after its copy, so it never returns a mix of two
+    frames, nor a frame newer than the header which the next read would
+    go back from.
+
+    The controller writes the frames and sends a FrameReady over the pipe,
+    the frontends read the pixels straight from the shared memory instead of
+    unpickling a PIL image per frame.
+    """
+    HEADER = struct.Struct('<QHH')
+    SLOT_SEQUENCE = struct.Struct('<Q')
+
+    def __init__(self, shared_memory):
+        self.shared_memory = shared_memory
+        sequence, self.width, self.height = self.HEADER.unpack_from(shared_memory.buf, 0)
+        self.frame_size = self.width * self.height // 8
+
+    @classmethod
+    def create(cls, width, height):
+        if width % 8:
+            raise ValueError("Width %i is not a multiple of 8" % width)
+        slot_size = cls.SLOT_SEQUENCE.size + width * height // 8
+        shared_memory = SharedMemory(create=True, size=cls.HEADER.size + 2 * slot_size)
+        # Both slots start as the complete, empty frame 0
+        shared_memory.buf[:shared_memory.size] = bytes(shared_memory.size)
+        cls.HEADER.pack_into(shared_memory.buf, 0, 0, width, height)
+        return cls(shared_memory)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shared_memory.name
+
+    def slot_offset(self, sequence):
+        """Offset of the slot counter of frame sequence, its pixels follow right after it."""
+        return self.HEADER.size + (sequence % 2) * (self.SLOT_SEQUENCE.size + self.frame_size)
+
+    def read_sequence(self):
+        return self.HEADER.unpack_from(self.shared_memory.buf, 0)[0]
+
+    def read_slot_sequence(self, slot_offset):
+        return self.SLOT_SEQUENCE.unpack_from(self.shared_memory.buf, slot_offset)[0]
+
+    def write(self, packed_pixels):
+        """Stores the packed pixels as the next frame and returns its sequence number."""
+        if len(packed_pixels) != self.frame_size:
+            raise ValueError("Frame has %i bytes instead of %i" % (len(packed_pixels), self.frame_size))
+        sequence = self.read_sequence() + 1
+        slot_offset = self.slot_offset(sequence)
+        pixels_offset = slot_offset + self.SLOT_SEQUENCE.size
+        self.SLOT_SEQUENCE.pack_into(self.shared_memory.buf, slot_offset, 2 * sequence - 1)
+        self.shared_memory.buf[pixels_offset:pixels_offset + self.frame_size] = packed_pixels
+        self.SLOT_SEQUENCE.pack_into(self.shared_memory.buf, slot_offset, 2 * sequence)
+        self.HEADER.pack_into(self.shared_memory.buf, 0, sequence, self.width, self.height)
+        return sequence
+
+    def write_image(self, picture):
+        if picture.mode != '1' or picture.size != (self.width, self.height):
+            raise ValueError("Expected a %ix%i 1-bit image, got %s %s" % (
+                self.width, self.height, picture.mode, picture.size))
+        return self.write(picture.tobytes())
+
+    def read(self):
+        """Returns (sequence, packed pixels) of the latest frame, or of a newer one written meanwhile."""
+        while True:
+            sequence = self.read_sequence()
+            slot_offset = self.slot_offset(sequence)
+            pixels_offset = slot_offset + self.SLOT_SEQUENCE.size
+            if self.read_slot_sequence(slot_offset) != 2 * sequence:
+                continue
+            packed_pixels = bytes(self.shared_memory.buf[pixels_offset:pixels_offset + self.frame_size])
+            if self.read_slot_sequence(slot_offset) == 2 * sequence:
+                return sequence, packed_pixels
+
+    def read_image(self):
+        sequence, packed_pixels = self.read()
+        return Image.frombytes('1', (self.width, self.height), packed_pixels)
+
+    def close(self):
+        self.shared_memory.close()
+
+    def unlink(self):
+        self.shared_memory.unlink()
+
+
+def packed_rows_to_pages(packed_pixels, width, height):
+    """Converts packed 1-bit rows (Image.tobytes()) into the page layout of an SSD1306.
+
+    The display memory has height / 8 pages of width bytes; each byte holds
+    8 vertically stacked pixels with the top one in the least significant
+    bit. Transposing the image turns those columns into packed rows with the
+    top pixel in the most significant bit, so only the bit order and the
+    byte order remain to be fixed, all without a per-pixel loop in Python.
+    """
+    columns = Image.frombytes('1', (width, height), packed_pixels).transpose(Image.TRANSPOSE).tobytes()
+    columns = columns.translate(BIT_REVERSAL)
+    pages = height // 8
+    return b''.join(columns[page::pages] for page in range(pages))
+
+
+def dirty_windows(previous_pages, pages, width):
+    """Windows (first_page, last_page, first_column, last_column) covering all bytes that differ.
+
+    pages and previous_pages are in the SSD1306 page layout. Every changed
+    page gets the narrowest column window around its changes, unless one
+    window around all changes is cheaper: each window costs the 6 bytes of
+    its addressing commands. Without previous_pages the whole display is
+    one window.
+    """
+    page_count = len(pages) // width
+    if previous_pages is None:
+        return [(0, page_count - 1, 0, width - 1)]
+    page_windows = []
+    for page in range(page_count):
+        start = page * width
+        previous_page, current_page = previous_pages[start:start + width], pages[start:start + width]
+        if previous_page == current_page:
+            continue
+        changed_columns = [column for column in range(width) if previous_page[column] != current_page[column]]
+        page_windows.append((page, page, changed_columns[0], changed_columns[-1]))
+    if len(page_windows) < 2:
+        return page_windows
+
+    bounding_window = (page_windows[0][0], page_windows[-1][1],
+                       min(window[2] for window in page_windows), max(window[3] for window in page_windows))
+    if window_cost(bounding_window) < sum(window_cost(window) for window in page_windows):
+        return [bounding_window]
+    return page_windows
+
+
+def window_cost(window):
+    """Bytes sent over SPI to write a window: the addressing commands and the data."""
+    first_page, last_page, first_column, last_column = window
+    return len(SSD1306_WINDOW_COMMANDS) + (last_page - first_page + 1) * (last_column - first_column + 1)
+
+
+class Ssd1306PageWriter(object):
+    """Writes frames to an SSD1306 over SPI, only the windows that changed since the last frame.
+
+    The display keeps what was written last, so only the dirty windows
+    found by dirty_windows() are addressed with the column and page address
+    commands and rewritten; in the horizontal addressing mode the data of a
+    window fills it page by page. The clock of the WatchScreen rewrites a
+    few dozen bytes per second instead of all 1024.
+
+    spi and gpio are the Adafruit_GPIO objects of the display, dc the pin
+    selecting between commands (low) and data (high).
+    """
+    def __init__(self, spi, gpio, dc, width, height):
+        self.spi = spi
+        self.gpio = gpio
+        self.dc = dc
+        self.width = width
+        self.height = height
+        self.displayed_pages = None
+        self.frames = 0
+        self.bytes_sent = 0
+
+    def mark_cleared(self):
+        """The display was cleared, so only the lit parts of the next frame are written."""
+        self.displayed_pages = bytes(self.width * self.height // 8)
+
+    def invalidate(self):
+        """The content of the display is unknown, the next frame is written completely."""
+        self.displayed_pages = None
+
+    def write_window(self, pages, window):
+        first_page, last_page, first_column, last_column = window
+        self.gpio.set_low(self.dc)
+        self.spi.write([SSD1306_COLUMNADDR, first_column, last_column, SSD1306_PAGEADDR, first_page, last_page])
+        data = b''.join(pages[page * self.width + first_column:page * self.width + last_column + 1]
+                        for page in range(first_page, last_page + 1))
+        self.gpio.set_high(self.dc)
+        self.spi.write(list(data))
+        return window_cost(window)
+
+    def write_frame(self, packed_pixels):
+        """Writes a frame of packed rows (Image.tobytes()), returns the number of bytes sent."""
+        pages = packed_rows_to_pages(packed_pixels, self.width, self.height)
+        bytes_sent = sum(self.write_window(pages, window)
+                         for window in dirty_windows(self.displayed_pages, pages, self.width))
+        self.displayed_pages = pages
+        self.frames += 1
+        self.bytes_sent += bytes_sent
+        return bytes_sent
@@ -1,28 +1,96 @@
+import functools
 import httplib2
+import json
 import os
 import re
 import string
+import threading
+import time
 from datetime import datetime, date
-from apiclient import discovery
-from oauth2client import client, tools
-from oauth2client.file import Storage
+from importlib import metadata
+# Only errors is imported here, it is small; discovery and oauth2client are imported
+# when the service is built.
+from googleapiclient import errors
 import logging
 
+from weightloss_gadget import sheets_worker, weight_history
+
+# Exceptions raised by the Sheets client when the spreadsheet cannot be reached
+NETWORK_ERRORS = (OSError, httplib2.HttpLib2Error, errors.HttpError)
+
+SCOPES = 'https://www.googleapis.com/auth/spreadsheets'
+DISCOVERY_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+# Bump when the layout of the discovery cache file changes
+DISCOVERY_CACHE_VERSION = 1
+
+
+def client_library_version():
+    try:
+        return metadata.version('google-api-python-client')
+    except metadata.PackageNotFoundError:
+        return None
+
+def column_id_to_nbr(column_id):
+    column_nbr = 0
+    for letter in column_id:
+        column_nbr = column_nbr * 26 + string.ascii_uppercase.index(letter) + 1
+    return column_nbr
+
+
+def column_nbr_to_id(column_nbr):
+    column_id = ""
+    while column_nbr > 0:
+        column_nbr, remainder = divmod(column_nbr - 1, 26)
+        column_id = string.ascii_uppercase[remainder] + column_id
+    return column_id
+
+
+A1_PATTERN = re.compile(r"^'?(?P<sheet_name>[^'!]+)'?!"
+                        r"(?P<first_column>[A-Z]*)(?P<first_row>[0-9]*)"
+                        r"(:(?P<last_column>[A-Z]*)(?P<last_row>[0-9]*))?$")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_a1_range(sheets_range):
+    """Splits an A1 range into (sheet_name, first_column, first_row, last_column, last_row).
+
+    Missing parts are None: "Sheet!2:5" are whole rows, "Sheet!C:D" whole
+    columns. Returns None for anything that is not an A1 range, like a
+    named range.
+    """
+    result = A1_PATTERN.match(sheets_range)
+    if result is None:
+        return None
+    if result.group('last_column') is None and not (result.group('first_column') and result.group('first_row')):
+        return None
+
+    def column(group_name):
+        return column_id_to_nbr(result.group(group_name)) if result.group(group_name) else None
+
+    def row(group_name):
+        return int(result.group(group_name)) if result.group(group_name) else None
+
+    first_column, first_row = column('first_column'), row('first_row')
+    if result.group('last_column') is None:
+        last_column, last_row = first_column, first_row
+    else:
+        last_column, last_row = column('last_column'), row('last_row')
+    if (first_column is None) != (last_column is None) or (first_row is None) != (last_row is None):
+        return None
+    return result.group('sheet_name'), first_column, first_row, last_column, last_row
+
+
 class CellReference(object):
     def __init__(self, sheet_name, column_nbr, row_nbr):
         self.sheet_name = sheet_name
         self.column_nbr = column_nbr
         self.row_nbr = row_nbr
-        self.column_id = string.ascii_uppercase[self.column_nbr-1]
-        self.sheets_range = "%s!%s%i" % (self.sheet_name, self.column_id, self.row_nbr)
+        self.column_id = column_nbr_to_id(self.column_nbr)
+        self.cell_id = "%s%i" % (self.column_id, self.row_nbr)
+        self.sheets_range = "%s!%s" % (self.sheet_name, self.cell_id)
 
     def FromSheetsRange(sheets_range):
-        pattern = re.compile("(?P<sheet_name>[\w ]+)!(?P<column_id>[A-Z]{1,2})(?P<row_nbr>[0-9]+)")
-        result = pattern.match(sheets_range)
-        sheet_name = result.group('sheet_name')
-        column_id = result.group('column_id')
-        row_nbr = int(result.group('row_nbr'))
-        column_nbr = string.ascii_uppercase.index(column_id[0])+1
+        sheet_name, column_nbr, row_nbr, _, _ = parse_a1_range(sheets_range)
         return CellReference(sheet_name, column_nbr, row_nbr)
 
     def FromCellReference(sheet_name, column_nbr, row_nbr):
@@ -34,42 +102,362 @@ class CellReference(object):
         else:
             return CellReference(self.sheet_name, self.column_nbr + column_delta, self.row_nbr + row_delta)
 
+    def to_range(self):
+        return SheetsRange(self.sheet_name, self.column_nbr, self.row_nbr, self.column_nbr, self.row_nbr)
+
+
+class SheetsRange(object):
+    """A rectangle in A1 notation; columns or rows set to None extend over whole rows or columns."""
+    def __init__(self, sheet_name, first_column, first_row, last_column, last_row):
+        self.sheet_name = sheet_name
+        self.first_column = first_column
+        self.first_row = first_row
+        self.last_column = last_column
+        self.last_row = last_row
+        first = "%s%s" % (column_nbr_to_id(first_column) if first_column else "", first_row or "")
+        last = "%s%s" % (column_nbr_to_id(last_column) if last_column else "", last_row or "")
+        self.sheets_range = "%s!%s:%s" % (sheet_name, first, last)
+
+    def FromSheetsRange(sheets_range):
+        parsed = parse_a1_range(sheets_range)
+        return SheetsRange(*parsed) if parsed is not None else None
+
+    def __eq__(self, other):
+        return isinstance(other, SheetsRange) and self.sheets_range == other.sheets_range
+
+    def __hash__(self):
+        return hash(self.sheets_range)
+
+    def __repr__(self):
+        return "SheetsRange(%s)" % self.sheets_range
+
+    def kind(self):
+        if self.first_column is None:
+            return 'rows'
+        if self.first_row is None:
+            return 'columns'
+        return 'rectangle'
+
+    def size(self):
+        if self.kind() != 'rectangle':
+            return None
+        return (self.last_column - self.first_column + 1) * (self.last_row - self.first_row + 1)
+
+    def contains(self, other):
+        if self.sheet_name != other.sheet_name:
+            return False
+        if self.first_column is not None and (other.first_column is None or other.first_column < self.first_column
+                                              or other.last_column > self.last_column):
+            return False
+        if self.first_row is not None and (other.first_row is None or other.first_row < self.first_row
+                                           or other.last_row > self.last_row):
+            return False
+        return True
+
+    def merge(self, other):
+        """The smallest range containing both ranges, which must be on the same sheet and of the same kind."""
+        def lower(first, second):
+            return None if first is None else min(first, second)
+
+        def upper(first, second):
+            return None if first is None else max(first, second)
+
+        return SheetsRange(self.sheet_name,
+                           lower(self.first_column, other.first_column), lower(self.first_row, other.first_row),
+                           upper(self.last_column, other.last_column), upper(self.last_row, other.last_row))
+
+    def extract(self, values, sub_range):
+        """Cuts the values of sub_range out of values returned for this range.
+
+        Trailing empty rows and cells the API leaves out are returned as
+        missing, like the API would for sub_range itself.
+        """
+        row_offset = (sub_range.first_row or 1) - (self.first_row or 1)
+        column_offset = (sub_range.first_column or 1) - (self.first_column or 1)
+        last_row_offset = None if sub_range.last_row is None else sub_range.last_row - (self.first_row or 1) + 1
+        width = None if sub_range.last_column is None else sub_range.last_column - (sub_range.first_column or 1) + 1
+
+        extracted = []
+        for row_values in values[row_offset:last_row_offset]:
+            row_values = row_values[column_offset:]
+            if width is not None:
+                row_values = row_values[:width]
+            extracted.append(row_values)
+        while extracted and not extracted[-1]:
+            extracted.pop()
+        return extracted
+
+
+class RequestPlanner(object):
+    """Plans the fewest A1 ranges for one batchGet that together cover all requested ranges.
+
+    Ranges on the same sheet and of the same kind are merged into their
+    bounding range as long as that fetches at most max_extra_cells cells
+    that nobody asked for; whole rows or columns are merged when they touch
+    or are at most max_gap apart. Rectangles inside a requested whole row
+    or column range are not fetched separately. Named ranges are passed
+    through unchanged.
+    """
+    def __init__(self, max_extra_cells=64, max_gap=2):
+        self.max_extra_cells = max_extra_cells
+        self.max_gap = max_gap
+
+    def can_merge(self, first, second):
+        if first.sheet_name != second.sheet_name or first.kind() != second.kind():
+            return False
+        merged = first.merge(second)
+        if merged.kind() == 'rows':
+            return second.first_row <= first.last_row + 1 + self.max_gap and first.first_row <= second.last_row + 1 + self.max_gap
+        if merged.kind() == 'columns':
+            return second.first_column <= first.last_column + 1 + self.max_gap and first.first_column <= second.last_column + 1 + self.max_gap
+        return merged.size() - first.size() - second.size() <= self.max_extra_cells
+
+    def plan(self, ranges):
+        """Returns (fetch_ranges, assignments): the ranges to request, and for each
+        requested range the index of the fetch range holding it, or of itself for
+        named ranges."""
+        fetch_ranges = []
+        parsed_ranges = []
+        for sheets_range in ranges:
+            parsed = SheetsRange.FromSheetsRange(sheets_range) if isinstance(sheets_range, str) else sheets_range
+            parsed_ranges.append(parsed)
+            if parsed is None:
+                continue
+            for index, fetch_range in enumerate(fetch_ranges):
+                if isinstance(fetch_range, SheetsRange) and (fetch_range.contains(parsed) or self.can_merge(fetch_range, parsed)):
+                    fetch_ranges[index] = fetch_range if fetch_range.contains(parsed) else fetch_range.merge(parsed)
+                    break
+            else:
+                fetch_ranges.append(parsed)
+
+        # Merging can make earlier separate fetch ranges redundant
+        fetch_ranges = [fetch_range for index, fetch_range in enumerate(fetch_ranges)
+                        if not any(other.contains(fetch_range) and (other != fetch_range or other_index < index)
+                                   for other_index, other in enumerate(fetch_ranges) if other_index != index)]
+
+        assignments = []
+        for sheets_range, parsed in zip(ranges, parsed_ranges):
+            if parsed is None:
+                fetch_ranges.append(sheets_range)
+                assignments.append(len(fetch_ranges) - 1)
+            else:
+                assignments.append(next(index for index, fetch_range in enumerate(fetch_ranges)
+                                        if isinstance(fetch_range, SheetsRange) and fetch_range.contains(parsed)))
+        return fetch_ranges, assignments
+
+
+class PersonSchema(object):
+    """Layout of a person's sheet: where the StartDate is and which columns the header row names."""
+    def __init__(self, start_date, start_date_reference, header_columns):
+        self.start_date = start_date
+        self.start_date_reference = start_date_reference
+        self.header_columns = header_columns
+        self.loaded_at = time.monotonic()
+
+    def row_for_date(self, date_object):
+        return self.start_date_reference.row_nbr + (date_object - self.start_date).days
+
+
+class DiscoveryCache(object):
+    """The Sheets v4 discovery document, kept on disk between runs.
+
+    The cached copy is used as long as it was written by the same cache
+    format and client library version and is younger than max_age seconds,
+    otherwise it is downloaded again.
+    """
+    def __init__(self, cache_path, max_age=7*24*3600):
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self.logger = logging.getLogger("DiscoveryCache")
+
+    def cache_key(self):
+        return {
+            'cache_version': DISCOVERY_CACHE_VERSION,
+            'library_version': client_library_version(),
+            'discovery_url': DISCOVERY_URL,
+        }
+
+    def read(self):
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path) as cache_file:
+                cached = json.load(cache_file)
+        except ValueError:
+            self.logger.warning("Ignoring damaged discovery cache %s", self.cache_path)
+            return None
+        if cached.get('key') != self.cache_key():
+            self.logger.info("Discovery cache was written by another version, refreshing it")
+            return None
+        if time.time() - cached.get('fetched_at', 0) >= self.max_age:
+            return None
+        return cached['document']
+
+    def write(self, document):
+        temporary_path = self.cache_path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({'key': self.cache_key(), 'fetched_at': time.time(), 'document': document}, cache_file)
+        os.replace(temporary_path, self.cache_path)
+
+    def fetch(self, http):
+        response, content = http.request(DISCOVERY_URL)
+        if response.status >= 400:
+            raise errors.HttpError(response, content, uri=DISCOVERY_URL)
+        return content.decode('utf-8')
+
+    def load(self, http):
+        document = self.read()
+        if document is None:
+            document = self.fetch(http)
+            self.write(document)
+        return document
+
+
+class TokenRefresher(threading.Thread):
+    """Refreshes the OAuth access token shortly before it expires.
+
+    Without it the first request after expiry pays for the token refresh.
+    The refresh uses its own Http object, so it never shares a connection
+    with the thread running the spreadsheet requests.
+
+    A token living shorter than refresh_margin is refreshed after half of
+    its remaining lifetime, and never sooner than min_refresh_interval
+    after the last refresh, so an expiry in the past cannot make it spin.
+    A failed refresh is retried with a delay doubling from retry_interval.
+    """
+    def __init__(self, credentials, http_timeout, refresh_margin=300, min_refresh_interval=10.0,
+                 retry_interval=60.0, max_retry_interval=900.0):
+        super().__init__(name="TokenRefresher", daemon=True)
+        self.credentials = credentials
+        self.http_timeout = http_timeout
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.backoff = sheets_worker.RetryBackoff(retry_interval, max_retry_interval)
+        self.last_refresh_time = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger("TokenRefresher")
+
+    def seconds_until_refresh(self):
+        if self.credentials.token_expiry is None:
+            return None
+        expires_in = (self.credentials.token_expiry - datetime.utcnow()).total_seconds()
+        seconds = max(expires_in - self.refresh_margin, expires_in / 2)
+        if self.last_refresh_time is not None:
+            seconds = max(seconds, self.last_refresh_time + self.min_refresh_interval - time.monotonic())
+        return max(0, seconds)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        from oauth2client import client
+        while not self.stop_event.wait(self.seconds_until_refresh()):
+            try:
+                self.credentials.refresh(httplib2.Http(timeout=self.http_timeout))
+            except NETWORK_ERRORS + (client.Error,) as exception:
+                self.logger.warning("Could not refresh access token, retrying in %.0f s: %s",
+                                    self.backoff.failed(), exception)
+                self.stop_event.wait(self.backoff.delay)
+                continue
+            self.backoff.succeeded()
+            self.last_refresh_time = time.monotonic()
+            self.logger.debug("Refreshed access token, valid until %s", self.credentials.token_expiry)
+
+
+class CredentialsError(Exception):
+    """No valid credentials are stored, authorize() has to be run in a terminal first."""
+
+
+def authorize(client_secret_file, application_name):
+    """Completes the OAuth2 flow on the terminal and stores the credentials GoogleSheetsInterface uses."""
+    from oauth2client import client, tools
+    from oauth2client.file import Storage
+    credential_path = GoogleSheetsInterface.get_credential_path(application_name)
+    flow = client.flow_from_clientsecrets(client_secret_file, SCOPES)
+    flow.user_agent = application_name
+    flags = tools.argparser.parse_args(['--noauth_local_webserver'])
+    credentials = tools.run_flow(flow, Storage(credential_path), flags)
+    logging.getLogger("GoogleSheetsInterface").info("Stored credentials in %s", credential_path)
+    return credentials
+
+
 class GoogleSheetsInterface(object):
-    def __init__(self, client_secret_file, application_name, sheet_id):
+    def __init__(self, client_secret_file, application_name, sheet_id, service=None, schema_max_age=3600,
+                 http_timeout=10, discovery_cache_path=None):
         self.client_secret_file = client_secret_file
         self.application_name = application_name
         self.sheet_id = sheet_id
-        self.header_columns = None
+        self.schemas = {}
+        self.schema_max_age = schema_max_age
+        self.last_filled_rows = {}
+        self.last_saved_weight_window = 31
+        self.request_planner = RequestPlanner()
+        self.mirror = None
         self.logger = logging.getLogger("GoogleSheetsInterface")
+        self.token_refresher = None
+        self.startup_timings = []
+
+        if service is None:
+            service = self.build_service(http_timeout, discovery_cache_path)
+        self.service = service
 
+    def time_startup_phase(self, phase, start_time):
+        self.startup_timings.append((phase, time.perf_counter() - start_time))
+        return time.perf_counter()
+
+    def startup_report(self):
+        return ", ".join("%s %.0f ms" % (phase, seconds * 1000) for phase, seconds in self.startup_timings)
+
+    def build_service(self, http_timeout, discovery_cache_path):
+        start_time = time.perf_counter()
         credentials = self.get_credentials()
-        http = credentials.authorize(httplib2.Http())
-        discovery_url = ('https://sheets.googleapis.com/$discovery/rest?'
-                        'version=v4')
-        self.service = discovery.build('sheets', 'v4', http=http, discoveryServiceUrl=discovery_url, cache_discovery=False)
+        start_time = self.time_startup_phase('credentials', start_time)
+
+        # A single Http object keeps its connection to the API host alive
+        # between requests, so only the first request pays for TCP and TLS.
+        http = credentials.authorize(httplib2.Http(timeout=http_timeout))
+        if discovery_cache_path is None:
+            discovery_cache_path = os.path.join(self.get_credential_dir(), 'sheets.googleapis.discovery.json')
+        document = DiscoveryCache(discovery_cache_path).load(http)
+        start_time = self.time_startup_phase('discovery document', start_time)
+
+        from googleapiclient import discovery
+        service = discovery.build_from_document(document, http=http)
+        start_time = self.time_startup_phase('build service', start_time)
+
+        self.token_refresher = TokenRefresher(credentials, http_timeout)
+        self.token_refresher.start()
+        self.logger.info("Startup timing: %s", self.startup_report())
+        return service
+
+    @staticmethod
+    def get_credential_dir():
+        home_dir = os.path.expanduser('~')
+        credential_dir = os.path.join(home_dir, '.credentials')
+        if not os.path.exists(credential_dir):
+            os.makedirs(credential_dir)
+        return credential_dir
+
+    @classmethod
+    def get_credential_path(cls, application_name):
+        return os.path.join(cls.get_credential_dir(), 'sheets.googleapis.%s.json'%application_name)
 
     def get_credentials(self):
         """Gets valid user credentials from storage.
 
-        If nothing has been stored, or if the stored credentials are invalid,
-        the OAuth2 flow is completed to obtain the new credentials.
+        This runs on the SheetsWorker thread, where nobody can answer the
+        OAuth2 flow, so missing or invalid credentials raise CredentialsError.
 
         Returns:
             Credentials, the obtained credential.
         """
-        home_dir = os.path.expanduser('~')
-        credential_dir = os.path.join(home_dir, '.credentials')
-        if not os.path.exists(credential_dir):
-            os.makedirs(credential_dir)
-        credential_path = os.path.join(credential_dir, 'sheets.googleapis.%s.json'%self.application_name)
+        from oauth2client.file import Storage
+        credential_path = self.get_credential_path(self.application_name)
 
-        store = Storage(credential_path)
-        credentials = store.get()
+        credentials = Storage(credential_path).get()
         if not credentials or credentials.invalid:
-            flow = client.flow_from_clientsecrets(self.client_secret_file, SCOPES)
-            flow.user_agent = self.application_name
-            credentials = tools.run_flow(flow, store, flags)
-            print('Storing credentials to ' + credential_path)
+            raise CredentialsError("No valid credentials in %s, run 'weightloss_gadget --authorize' in a terminal "
+                                   "to store them" % credential_path)
         return credentials
 
     def read_named_range_value_and_location(self, range):
@@ -90,7 +478,29 @@ class GoogleSheetsInterface(object):
         result = self.service.spreadsheets().values().get(
             spreadsheetId=self.sheet_id,
             range=range).execute()
-        values = result["values"]
+        return self.parse_last_updates(result["values"])
+
+    def read_last_updates_for_persons(self, persons):
+        """Reads the LastUpdates of all persons with one batchGet, returns a dict person -> last updates."""
+        persons = list(persons)
+        try:
+            all_values = self.read_ranges(["%s!LastUpdates" % person for person in persons])
+        except NETWORK_ERRORS as exception:
+            # Without network the mirror still has the ones read last time
+            if self.mirror is None:
+                raise
+            all_last_updates = {person: self.mirror.read_last_updates(person) for person in persons}
+            if None in all_last_updates.values():
+                raise
+            self.logger.warning("Could not read last updates, using the mirrored ones: %s", exception)
+            return all_last_updates
+        all_last_updates = {person: self.parse_last_updates(values) for person, values in zip(persons, all_values)}
+        if self.mirror is not None:
+            for person, last_updates in all_last_updates.items():
+                self.mirror.store_last_updates(person, last_updates)
+        return all_last_updates
+
+    def parse_last_updates(self, values):
         dict_result = {entry[0]:entry[1] for entry in values}
         dict_result["Last Set Day"] = datetime.strptime(dict_result["Last Set Day"], "%Y-%m-%d").date().isoformat() # @TODO: Change to builtin conversion method
         dict_result["Latest Measured Weight"] = float(dict_result["Latest Measured Weight"])
@@ -112,12 +522,92 @@ class GoogleSheetsInterface(object):
         else:
             return None
 
-    def read_startdate(self, person):
-        startdate_range_name = "%s!StartDate"%person
+    def read_range(self, range):
+        self.logger.debug("values().get(range=%s)", range)
+        result = self.service.spreadsheets().values().get(
+            spreadsheetId=self.sheet_id,
+            range=range).execute()
+        return result.get('values', [])
+
+    def read_value_ranges(self, ranges):
+        self.logger.debug("values().batchGet(ranges=%s)", ranges)
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.sheet_id,
+            ranges=ranges).execute()
+        return result.get('valueRanges', [])
+
+    def read_ranges(self, ranges):
+        return [value_range.get('values', []) for value_range in self.read_value_ranges(ranges)]
 
-        iso_string = self.read_single_cell(self.sheet_id, startdate_range_name)
-        startdate = self.convert_iso_string_to_date(iso_string)
-        return startdate
+    def read_planned_value_ranges(self, ranges):
+        """Like read_value_ranges, but lets the RequestPlanner merge the ranges first.
+
+        Still a single batchGet, but overlapping and neighbouring ranges are
+        fetched only once. Returns one value range dict per requested range.
+        """
+        fetch_ranges, assignments = self.request_planner.plan(ranges)
+        fetched = self.read_value_ranges([fetch_range.sheets_range if isinstance(fetch_range, SheetsRange) else fetch_range
+                                          for fetch_range in fetch_ranges])
+        value_ranges = []
+        for sheets_range, index in zip(ranges, assignments):
+            fetch_range = fetch_ranges[index]
+            if not isinstance(fetch_range, SheetsRange):
+                value_ranges.append(fetched[index])
+                continue
+            sub_range = SheetsRange.FromSheetsRange(sheets_range) if isinstance(sheets_range, str) else sheets_range
+            value_ranges.append({
+                'range': sub_range.sheets_range,
+                'values': fetch_range.extract(fetched[index].get('values', []), sub_range),
+            })
+        return value_ranges
+
+    def read_cells(self, cells):
+        """Reads a set of CellReferences with one batchGet, returns a dict sheets_range -> value or None."""
+        cells = list(cells)
+        value_ranges = self.read_planned_value_ranges([cell.to_range() for cell in cells])
+        result = {}
+        for cell, value_range in zip(cells, value_ranges):
+            values = value_range['values']
+            value = values[0][0] if values and values[0] else None
+            result[cell.sheets_range] = value if value != '' else None
+        return result
+
+    def get_schema(self, person):
+        schema = self.schemas.get(person)
+        if schema is None or time.monotonic() - schema.loaded_at >= self.schema_max_age:
+            self.load_schema(person)
+        return self.schemas[person]
+
+    def load_schema(self, person, additional_ranges=()):
+        """Reads StartDate and the header row of person, plus additional_ranges, in one batchGet.
+
+        Returns the values of additional_ranges.
+        """
+        value_ranges = self.read_planned_value_ranges(["%s!StartDate" % person, "%s!1:1" % person] + list(additional_ranges))
+        start_date_range, header_range = value_ranges[0], value_ranges[1]
+
+        start_date_values = start_date_range.get('values', [[]])
+        assert len(start_date_values)==1 and len(start_date_values[0])==1, 'Returned more than a single cell value'
+        start_date = self.convert_iso_string_to_date(start_date_values[0][0])
+        start_date_reference = CellReference.FromSheetsRange(start_date_range.get('range'))
+
+        header_columns = []
+        for header_column in header_range.get('values', [[]])[0]:
+            if not header_column:
+                break
+            header_columns.append(header_column)
+
+        self.schemas[person] = PersonSchema(start_date, start_date_reference, header_columns)
+        return [value_range.get('values', []) for value_range in value_ranges[2:]]
+
+    def invalidate_schema(self, person=None):
+        if person is None:
+            self.schemas = {}
+        else:
+            self.schemas.pop(person, None)
+
+    def read_startdate(self, person):
+        return self.get_schema(person).start_date
 
     def convert_datetime_to_iso_string(self, datetime_object):
         return datetime_object.isoformat()
@@ -133,33 +623,79 @@ class GoogleSheetsInterface(object):
             return None
 
     def read_last_saved_weight(self, person, datetime_object = date.today()):
-        start_date_string, start_date_reference = self.read_named_range_value_and_location("%s!StartDate"%person)
-        start_date = self.convert_iso_string_to_date(start_date_string)
-        offset_days = (datetime_object - start_date).days
-
-        current_date_reference = start_date_reference.add_delta(row_delta=offset_days)
-        value = None
-        while current_date_reference.row_nbr >= start_date_reference.row_nbr and value is None:
-            row = self.read_row(person, current_date_reference.row_nbr)
-            row['Weight in kg'] = self.convert_string_to_float(row['Weight in kg'])
-            row['Trend'] = self.convert_string_to_float(row['Trend'])
-            row['Variance'] = self.convert_string_to_float(row['Variance'])
-            value = row['Weight in kg']
-            current_date_reference = current_date_reference.add_delta(row_delta=-1)
+        if self.mirror is not None:
+            row = self.mirror.read_last_saved_row(person, datetime_object)
+            if row is not None:
+                row['Weight in kg'] = self.convert_string_to_float(row['Weight in kg'])
+                row['Trend'] = self.convert_string_to_float(row['Trend'])
+                row['Variance'] = self.convert_string_to_float(row['Variance'])
+                return row
+
+        schema = self.get_schema(person)
+        start_row = schema.start_date_reference.row_nbr
+        target_row = max(schema.row_for_date(datetime_object), start_row)
+
+        # Rows between a known filled row and the target are read in one go,
+        # otherwise a fixed window before the target and, only if that window
+        # is empty, everything before it.
+        last_filled_row = self.last_filled_rows.get(person)
+        if last_filled_row is not None and start_row <= last_filled_row <= target_row:
+            first_row = last_filled_row
+        else:
+            first_row = max(start_row, target_row - self.last_saved_weight_window + 1)
+
+        row = self.find_last_weight_row(person, first_row, target_row)
+        if row is None and first_row > start_row:
+            row = self.find_last_weight_row(person, start_row, first_row - 1)
+        if row is None:
+            row = self.read_row(person, start_row)
 
+        row['Weight in kg'] = self.convert_string_to_float(row['Weight in kg'])
+        row['Trend'] = self.convert_string_to_float(row['Trend'])
+        row['Variance'] = self.convert_string_to_float(row['Variance'])
         return row
 
+    def find_last_weight_row(self, person, first_row, last_row):
+        rows = self.read_rows(person, first_row, last_row)
+        for offset in range(len(rows) - 1, -1, -1):
+            if rows[offset]['Weight in kg'] is not None:
+                self.update_last_filled_row(person, first_row + offset)
+                return rows[offset]
+        return None
+
+    def update_last_filled_row(self, person, row_nbr):
+        if row_nbr > self.last_filled_rows.get(person, 0):
+            self.last_filled_rows[person] = row_nbr
+
     def read_row(self, person, row):
-        if self.header_columns is None:
-            self.collect_header_columns(person)
+        return self.read_rows(person, row, row)[0]
 
-        current_row_cell = CellReference(sheet_name=person, column_nbr=1,row_nbr=row)
-        row = {}
-        for header_column in self.header_columns:
-            value = self.read_single_cell(self.sheet_id, current_row_cell.sheets_range)
-            row[header_column]=value
-            current_row_cell = current_row_cell.add_delta(column_delta=1)
+    def read_rows(self, person, first_row, last_row):
+        """Reads the block of rows first_row..last_row with a single API call.
+
+        If the schema of person is not cached, it is fetched in the same
+        batchGet request as the rows.
+        """
+        schema = self.schemas.get(person)
+        if schema is None or time.monotonic() - schema.loaded_at >= self.schema_max_age:
+            rows_values, = self.load_schema(person, ["%s!%i:%i" % (person, first_row, last_row)])
+            schema = self.schemas[person]
+        else:
+            first_cell = CellReference(person, 1, first_row)
+            last_cell = CellReference(person, len(schema.header_columns), last_row)
+            rows_values = self.read_range("%s:%s" % (first_cell.sheets_range, last_cell.cell_id))
+
+        rows = []
+        for offset in range(last_row - first_row + 1):
+            row_values = rows_values[offset] if offset < len(rows_values) else []
+            rows.append(self.map_row_values(row_values, schema.header_columns))
+        return rows
 
+    def map_row_values(self, row_values, header_columns):
+        row = {}
+        for index, header_column in enumerate(header_columns):
+            value = row_values[index] if index < len(row_values) else None
+            row[header_column] = value if value != '' else None
         return row
 
     def read_weight_row(self, person, row):
@@ -170,61 +706,90 @@ class GoogleSheetsInterface(object):
         return raw_row
 
     def read_row_for_date(self, person, datetime_object):
-        if self.header_columns is None:
-            self.collect_header_columns(person)
+        if self.mirror is not None:
+            row = self.mirror.read_row_for_date(person, datetime_object)
+            if row is not None:
+                return row
 
-        start_date_string, start_date_reference = self.read_named_range_value_and_location("%s!StartDate"%person)
-        start_date = self.convert_iso_string_to_date(start_date_string)
-        offset_days = (datetime_object - start_date).days
+        return self.read_row(person, self.get_schema(person).row_for_date(datetime_object))
 
-        current_row_cell = start_date_reference.add_delta(row_delta=offset_days)
-        row = {}
-        for header_column in self.header_columns:
-            value = self.read_single_cell(self.sheet_id, current_row_cell.sheets_range)
-            row[header_column]=value
-            current_row_cell = current_row_cell.add_delta(column_delta=1)
+    def read_weight_history(self, person, end_date=None, page_size=366, history=None, resync_days=7):
+        """Streams the weight and trend columns of person into a WeightHistory.
 
-        return row
+        The rows from StartDate up to end_date (default: today) are read in
+        pages of page_size rows, only the weight and trend columns are
+        requested. If an existing history is passed in, only the days from
+        shortly before its last measurement onwards are read again.
+
+        With a mirror the history is built from its rows instead, which keeps
+        itself up to date the same way and is still there without network.
+        """
+        if end_date is None:
+            end_date = date.today()
+        if self.mirror is not None:
+            return self.mirror.read_weight_history(person, end_date)
+        schema = self.get_schema(person)
+        if history is None:
+            history = weight_history.WeightHistory(person, schema.start_date)
+            first_offset = 0
+        else:
+            last_measured_offset = history.last_measured_offset()
+            first_offset = 0 if last_measured_offset is None else max(0, last_measured_offset - resync_days)
+            history.truncate(first_offset)
+
+        weight_index = schema.header_columns.index('Weight in kg')
+        trend_index = schema.header_columns.index('Trend')
+        first_column_index = min(weight_index, trend_index)
+        start_row = schema.start_date_reference.row_nbr
+        last_row = schema.row_for_date(end_date)
+
+        for page_first_row in range(start_row + first_offset, last_row + 1, page_size):
+            page_last_row = min(page_first_row + page_size - 1, last_row)
+            first_cell = CellReference(person, first_column_index + 1, page_first_row)
+            last_cell = CellReference(person, max(weight_index, trend_index) + 1, page_last_row)
+            rows_values = self.read_range("%s:%s" % (first_cell.sheets_range, last_cell.cell_id))
+
+            for row_offset in range(page_last_row - page_first_row + 1):
+                row_values = rows_values[row_offset] if row_offset < len(rows_values) else []
+                row = self.map_row_values([None] * first_column_index + row_values, schema.header_columns)
+                weight = self.convert_string_to_float(row['Weight in kg'])
+                trend = self.convert_string_to_float(row['Trend'])
+                history.set_values(page_first_row + row_offset - start_row,
+                                   weight_history.NAN if weight is None else weight,
+                                   weight_history.NAN if trend is None else trend)
+        return history
 
     def collect_header_columns(self, person):
-        current_header_cell = CellReference(person, 1, 1)
-        self.header_columns = []
-        look_at_next_cell = True
-        while look_at_next_cell:
-            header_column = self.read_single_cell(self.sheet_id, current_header_cell.sheets_range)
-            if header_column:
-                self.header_columns.append(header_column)
-                current_header_cell = current_header_cell.add_delta(column_delta=1)
-            else:
-                look_at_next_cell = False
+        return self.get_schema(person).header_columns
 
     def write_weight(self, person, weight, date_object = date.today()):
-        if isinstance(date_object, str):
-            date_object = self.convert_iso_string_to_date(date_object)
-        start_date_string, start_date_reference = self.read_named_range_value_and_location("%s!StartDate" % person)
-        start_date = self.convert_iso_string_to_date(start_date_string)
-        offset_days = (date_object - start_date).days
-
-        current_date_reference = start_date_reference.add_delta(row_delta=offset_days, column_delta=2)
-
-        values = [
-            [
-                weight  # Cell values
-            ],
-            # Additional rows
-        ]
-
-        data = [
-            {
+        self.write_weights([(person, weight, date_object)])
+
+    def write_weights(self, entries):
+        """Writes a list of (person, weight, date) entries with a single batchUpdate."""
+        data = []
+        written_cells = []
+        for person, weight, date_object in entries:
+            if isinstance(date_object, str):
+                date_object = self.convert_iso_string_to_date(date_object)
+            schema = self.get_schema(person)
+            current_date_reference = schema.start_date_reference.add_delta(
+                row_delta=(date_object - schema.start_date).days, column_delta=2)
+            data.append({
                 'range': current_date_reference.sheets_range,
-                'values': values
-            },
-            # Additional ranges to update ...
-        ]
+                'values': [[weight]]
+            })
+            written_cells.append((person, weight, date_object, current_date_reference))
 
         body = {
             'valueInputOption': 'USER_ENTERED',
             'data': data
         }
         result = self.service.spreadsheets().values().batchUpdate(
-            spreadsheetId=self.sheet_id, body=body).execute()
\ No newline at end of file
+            spreadsheetId=self.sheet_id, body=body).execute()
+
+        for person, weight, date_object, current_date_reference in written_cells:
+            self.update_last_filled_row(person, current_date_reference.row_nbr)
+            if self.mirror is not None:
+                self.mirror.record_weight(person, weight, date_object)
+        return result
@@ -0,0 +1,149 @@
+import bisect
+import contextlib
+import json
+import logging
+import time
+from collections import namedtuple
+
+# Upper bounds in seconds of the histogram buckets, slower values go into a last overflow bucket
+BUCKET_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class InputEvent(namedtuple('InputEvent', ['action', 'created_time'])):
+    """A GuiActions value sent by a frontend, with the time.monotonic() it happened at."""
+
+
+class FrameShown(namedtuple('FrameShown', ['sequence', 'sent_time', 'input_time', 'received_time', 'shown_time'])):
+    """Sent back by a frontend once the frame of a FrameReady is on the display.
+
+    sent_time and input_time are copied from the FrameReady; all times are
+    time.monotonic(), which is the same clock in all processes of the gadget.
+    """
+
+
+class LatencyHistogram(object):
+    """Count, sum, min, max and fixed log-spaced buckets of durations in seconds."""
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, duration):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.minimum = duration if self.minimum is None else min(self.minimum, duration)
+        self.maximum = duration if self.maximum is None else max(self.maximum, duration)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of the values, at most the maximum."""
+        if not self.count:
+            return None
+        needed = fraction * self.count
+        seen = 0
+        for bucket_index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= needed and bucket_count and bucket_index < len(BUCKET_BOUNDS):
+                return min(BUCKET_BOUNDS[bucket_index], self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.minimum,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'max': self.maximum,
+            'buckets': list(self.buckets),
+        }
+
+
+class PipelineInstrumentation(object):
+    """Timing of the Controller pipeline, from an input event to the frame on the display.
+
+    Recorded histograms:
+    - render:<screen class>: render_frame() of a screen
+    - send: writing a frame to the framebuffer and notifying the frontend
+    - input_queue: from a frontend creating an InputEvent (the first of a RotaryTurn) to the controller handling it
+    - transport: from sending a frame to the frontend picking it up
+    - display: from the frontend picking up a frame to it being on the display
+    - input_to_photon: from an InputEvent to the first frame shown after it
+
+    report() returns all of them, log_summary() logs the main numbers and is
+    called every summary_interval seconds by the controller loop.
+    """
+    def __init__(self, summary_interval=300.0, clock=time.monotonic):
+        self.summary_interval = summary_interval
+        self.clock = clock
+        self.histograms = {}
+        self.unreflected_input_time = None
+        self.next_summary_time = clock() + summary_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def record(self, name, duration):
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        self.histograms[name].record(duration)
+
+    def record_input(self, input_event):
+        self.record('input_queue', self.clock() - input_event.created_time)
+        if self.unreflected_input_time is None:
+            self.unreflected_input_time = input_event.created_time
+
+    def take_input_time(self):
+        """Time of the earliest input not reflected by a frame yet, the next frame sent will reflect it."""
+        input_time, self.unreflected_input_time = self.unreflected_input_time, None
+        return input_time
+
+    def record_frame_shown(self, frame_shown):
+        self.record('transport', frame_shown.received_time - frame_shown.sent_time)
+        self.record('display', frame_shown.shown_time - frame_shown.received_time)
+        if frame_shown.input_time is not None:
+            self.record('input_to_photon', frame_shown.shown_time - frame_shown.input_time)
+
+    def report(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def dump(self, dump_path):
+        with open(dump_path, 'w') as dump_file:
+            json.dump(self.report(), dump_file, indent=2)
+
+    def summary_due(self):
+        return self.clock() >= self.next_summary_time
+
+    def log_summary(self):
+        self.next_summary_time = self.clock() + self.summary_interval
+        for name, summary in self.report().items():
+            self.logger.info("%s: %i, mean %.1f ms, p95 %.1f ms, max %.1f ms", name, summary['count'],
+                             summary['mean'] * 1000, summary['p95'] * 1000, summary['max'] * 1000)
+
+
+class StartupProfiler(object):
+    """Wall clock time of the phases of the process startup, reported by --profile-startup.
+
+    A disabled profiler still runs the phases, it only keeps no timings.
+    """
+    def __init__(self, enabled=True, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.timings = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start_time = self.clock()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.timings.append((name, self.clock() - start_time))
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self.timings.append((name, seconds))
+
+    def report(self):
+        # No total, screens are prepared in the background while the other phases run
+        return "\n".join("%-30s %8.1f ms" % (name, seconds * 1000) for name, seconds in self.timings)
@@ -1,41 +1,195 @@
+import bisect
 import time
-from math import floor
 
-class pixel(object):
-    def __init__(self, r, g, b):
-        self.r = r
-        self.g = g
-        self.b = b
+NUMBER_OF_LEDS = 8
+# One frame holds the r, g, b bytes of all LEDs
+FRAME_SIZE = NUMBER_OF_LEDS * 3
+FRAME_RATE = 25
 
-    def __str__(self):
-        color_string = "#%.2X%.2X%.2X" % (self.r, self.g, self.b)
-        return color_string
+OFF = bytes(FRAME_SIZE)
 
 
-class red_blinking_pattern(object):
-    def __init__(self):
-        self.counter = 0
+def solid(r, g, b):
+    """A frame with all LEDs set to the same color."""
+    return bytes((r, g, b)) * NUMBER_OF_LEDS
 
-        self.start_time = time.clock()
-        self.next_update_time = floor(self.start_time)
+
+def led_colors(frame):
+    """The "#RRGGBB" colors of the LEDs of a frame, as used by Tk."""
+    return ["#%.2X%.2X%.2X" % tuple(frame[index:index + 3]) for index in range(0, FRAME_SIZE, 3)]
+
+
+def linear(progress):
+    return progress
+
+
+def ease_in_out(progress):
+    return progress * progress * (3 - 2 * progress)
+
+
+def hold(progress):
+    """Keeps the color of a keyframe until the next one."""
+    return 0.0
+
+
+class KeyframeTable(object):
+    """An LED animation precomputed into one bytearray of FRAME_SIZE bytes per frame.
+
+    keyframes is a list of (seconds, frame) with the first one at 0 seconds;
+    the frames in between are interpolated with the easing function, which
+    maps the progress between two keyframes (0 to 1) to the progress of the
+    colors. The animation lasts until the last keyframe; one that does not
+    loop stays on the last keyframe from then on. change_indexes
+    holds the indexes of the frames that differ from the frame before, so
+    an animation only needs to wake up when the LEDs actually change.
+    """
+    def __init__(self, keyframes, easing=linear, loop=True, frame_rate=FRAME_RATE):
+        self.loop = loop
+        self.frame_rate = frame_rate
+        # The last keyframe is the first frame of the next loop, without a loop it is the final frame
+        self.frame_count = max(1, int(round(keyframes[-1][0] * frame_rate)) + (0 if loop else 1))
+        self.frames = bytearray(self.frame_count * FRAME_SIZE)
+        keyframe_times = [seconds for seconds, frame in keyframes]
+        for index in range(self.frame_count):
+            seconds = index / frame_rate
+            if not loop and index == self.frame_count - 1:
+                seconds = keyframe_times[-1]
+            keyframe_index = max(0, bisect.bisect_right(keyframe_times, seconds) - 1)
+            start_time, start_frame = keyframes[keyframe_index]
+            if keyframe_index + 1 < len(keyframes):
+                end_time, end_frame = keyframes[keyframe_index + 1]
+                progress = easing((seconds - start_time) / (end_time - start_time))
+            else:
+                end_frame, progress = start_frame, 0.0
+            offset = index * FRAME_SIZE
+            self.frames[offset:offset + FRAME_SIZE] = bytes(
+                int(round(start_value + (end_value - start_value) * progress))
+                for start_value, end_value in zip(start_frame, end_frame))
+
+        self.change_indexes = [index for index in range(1, self.frame_count) if self.frame(index) != self.frame(index - 1)]
+        if self.loop and self.frame(0) != self.frame(self.frame_count - 1):
+            self.change_indexes.insert(0, 0)
+
+    def frame(self, index):
+        return bytes(self.frame_view(index))
+
+    def frame_view(self, index):
+        """The frame at index without copying it."""
+        offset = index * FRAME_SIZE
+        return memoryview(self.frames)[offset:offset + FRAME_SIZE]
+
+    def frame_index(self, position):
+        if self.loop:
+            return position % self.frame_count
+        return min(position, self.frame_count - 1)
+
+    def frame_position(self, elapsed):
+        """Number of frames played after elapsed seconds, including those of earlier loops."""
+        return int(elapsed * self.frame_rate)
+
+    def frame_at(self, position):
+        return self.frame(self.frame_index(position))
+
+    def next_change(self, position):
+        """Position of the next frame after position that differs from the one before, None if there is none."""
+        if self.loop:
+            cycle, index = divmod(position, self.frame_count)
+        elif position >= self.frame_count - 1:
+            return None
+        else:
+            cycle, index = 0, position
+        next_index = bisect.bisect_right(self.change_indexes, index)
+        if next_index < len(self.change_indexes):
+            return cycle * self.frame_count + self.change_indexes[next_index]
+        if self.loop and self.change_indexes:
+            return (cycle + 1) * self.frame_count + self.change_indexes[0]
+        return None
+
+
+class LedAnimation(object):
+    """Plays a KeyframeTable on the monotonic clock.
+
+    does_need_update() is True once the frame due now differs from the last
+    one handed out by create_led_pattern(), so only changed frames are
+    copied out of the table and sent to the frontend, as 24 bytes instead
+    of a list of pixel objects.
+    """
+    def __init__(self, table, clock=time.monotonic):
+        self.table = table
+        self.clock = clock
+        self.start_time = clock()
+        self.last_frame = None
         self.is_running = True
 
+    def position(self):
+        return self.table.frame_position(self.clock() - self.start_time)
+
     def does_need_update(self):
-        if self.is_running and self.next_update_time < time.clock():
-            self.next_update_time += 2.0
-            return True
-        else:
+        if not self.is_running:
             return False
+        return self.table.frame_view(self.table.frame_index(self.position())) != self.last_frame
+
+    def next_update_deadline(self):
+        if not self.is_running:
+            return None
+        if self.last_frame is None:
+            return self.start_time
+        next_change = self.table.next_change(self.position())
+        if next_change is None:
+            return None
+        return self.start_time + next_change / self.table.frame_rate
 
     def stop(self):
         self.is_running = False
 
     def create_led_pattern(self):
-        self.counter += 1
-        if self.counter % 2:
-            return [pixel(0,255,0) for x in range(8)]
-        else:
-            return [pixel(0, 0, 0) for x in range(8)]
+        self.last_frame = self.table.frame_at(self.position())
+        return self.last_frame
 
     def end_led_pattern(self):
-        return [pixel(0, 0, 0) for x in range(8)]
\ No newline at end of file
+        return OFF
+
+
+def pulse(color, seconds, repeats=1):
+    """Keyframes fading the LEDs from off to color and back, repeats times."""
+    keyframes = [(0.0, OFF)]
+    for repeat in range(repeats):
+        keyframes.append(((repeat + 0.5) * seconds, solid(*color)))
+        keyframes.append(((repeat + 1) * seconds, OFF))
+    return keyframes
+
+
+def spinner(color, seconds, tail=3):
+    """Keyframes of a lit LED running around with a fading tail."""
+    keyframes = []
+    for step in range(NUMBER_OF_LEDS):
+        frame = bytearray(FRAME_SIZE)
+        for distance in range(tail):
+            led = (step - distance) % NUMBER_OF_LEDS
+            brightness = 1.0 / (distance + 1)
+            frame[led * 3:led * 3 + 3] = bytes(int(value * brightness) for value in color)
+        keyframes.append((step * seconds / NUMBER_OF_LEDS, bytes(frame)))
+    keyframes.append((seconds, keyframes[0][1]))
+    return keyframes
+
+
+BLINKING = KeyframeTable([(0.0, solid(0, 255, 0)), (2.0, OFF), (4.0, OFF)], easing=hold)
+WEIGHT_LOSS = KeyframeTable(pulse((0, 255, 0), 1.5, repeats=3), easing=ease_in_out, loop=False)
+WEIGHT_GAIN = KeyframeTable(pulse((255, 0, 0), 1.5, repeats=3), easing=ease_in_out, loop=False)
+SYNCING = KeyframeTable(spinner((0, 0, 255), 0.8), easing=hold)
+
+
+def red_blinking_pattern():
+    return LedAnimation(BLINKING)
+
+
+def weight_loss_pattern():
+    return LedAnimation(WEIGHT_LOSS)
+
+
+def weight_gain_pattern():
+    return LedAnimation(WEIGHT_GAIN)
+
+
+def syncing_pattern():
+    return LedAnimation(SYNCING)
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from weightloss_gadget import instrumentation
+from weightloss_gadget.gui_actions import GuiActions
+
+TURN_DIRECTIONS = {GuiActions.LEFT: -1, GuiActions.RIGHT: 1}
+
+
+class RotaryTurn(namedtuple('RotaryTurn', ['delta', 'detents', 'created_time', 'last_time'])):
+    """Consecutive LEFT and RIGHT InputEvents merged into one turn.
+
+    delta is the net number of detents (RIGHT positive), detents the number
+    of events merged, created_time the time of the first one and last_time
+    that of the last one, all time.monotonic().
+    """
+
+
+def coalesce_turns(received_objects):
+    """Merges each run of LEFT and RIGHT InputEvents into a RotaryTurn, everything else is kept in order."""
+    coalesced = []
+    for received_object in received_objects:
+        direction = None
+        if isinstance(received_object, instrumentation.InputEvent):
+            direction = TURN_DIRECTIONS.get(received_object.action)
+        if direction is None:
+            coalesced.append(received_object)
+            continue
+        previous = coalesced[-1] if coalesced else None
+        if isinstance(previous, RotaryTurn):
+            coalesced[-1] = RotaryTurn(previous.delta + direction, previous.detents + 1,
+                                       previous.created_time, received_object.created_time)
+        else:
+            coalesced.append(RotaryTurn(direction, 1, received_object.created_time, received_object.created_time))
+    return coalesced
+
+
+class RotaryAcceleration(object):
+    """Change per detent depending on how fast the encoder is turned.
+
+    The speed is measured in detents per second over a turn, together with
+    the gap to the previous turn unless the hand paused for longer than
+    pause seconds in between. From fast_speed on, every detent changes the
+    value by fast_step instead of slow_step.
+    """
+    def __init__(self, slow_step=0.1, fast_step=1.0, fast_speed=12.0, pause=0.3):
+        self.slow_step = slow_step
+        self.fast_step = fast_step
+        self.fast_speed = fast_speed
+        self.pause = pause
+        self.last_time = None
+
+    def speed(self, turn):
+        if self.last_time is not None and turn.created_time - self.last_time < self.pause:
+            detents, duration = turn.detents, turn.last_time - self.last_time
+        else:
+            # The first detent after a pause only starts the measurement
+            detents, duration = turn.detents - 1, turn.last_time - turn.created_time
+        self.last_time = turn.last_time
+        if detents == 0:
+            return 0.0
+        if duration <= 0:
+            return float('inf')
+        return detents / duration
+
+    def change(self, turn):
+        """The signed change of the value for turn."""
+        step = self.fast_step if self.speed(turn) >= self.fast_speed else self.slow_step
+        return turn.delta * step
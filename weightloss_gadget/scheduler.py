@@ -0,0 +1,53 @@
+import logging
+import threading
+import time
+from multiprocessing import Pipe, connection
+
+
+def earliest_deadline(deadlines):
+    """The earliest of the given monotonic deadlines, None if there is none."""
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+
+class DeadlineScheduler(object):
+    """Blocks the controller loop until input arrives or the next deadline is due.
+
+    Screens and LED patterns declare the time.monotonic() deadline of their
+    next update; wait() sleeps on the input connections until the earliest
+    one, so an idle gadget does not wake up at all and an input event is
+    handled as soon as it arrives. Other threads (the SheetsWorker, the
+    JournalFlusher) call wake_up() after they changed something the loop has
+    to look at.
+
+    Must be created in the process that runs the loop.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.wakeup_reader, self.wakeup_writer = Pipe(duplex=False)
+        self.wakeup_lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def wake_up(self):
+        with self.wakeup_lock:
+            self.wakeup_writer.send_bytes(b'\0')
+
+    def drain_wakeups(self):
+        while self.wakeup_reader.poll():
+            self.wakeup_reader.recv_bytes()
+
+    def timeout_until(self, deadline):
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def wait(self, connections, deadlines):
+        """Waits until one of connections is readable, wake_up() is called or the earliest deadline.
+
+        Returns the readable connections out of connections.
+        """
+        timeout = self.timeout_until(earliest_deadline(deadlines))
+        ready = connection.wait(list(connections) + [self.wakeup_reader], timeout)
+        if self.wakeup_reader in ready:
+            self.drain_wakeups()
+        return [ready_connection for ready_connection in ready if ready_connection is not self.wakeup_reader]
@@ -1,28 +1,25 @@
-import json
+import math
+import os
 import socket
 import time
-import urllib.request
-from datetime import date, datetime, timedelta
+from datetime import date, timedelta
 from enum import Enum
 import logging
 
-from PIL import Image, ImageDraw, ImageFont
-
-from weightloss_gadget import google_sheets_interface
 from weightloss_gadget.gui_actions import GuiActions
 import weightloss_gadget.led_patterns as led_patterns
+from weightloss_gadget import aggregate_index, trend_engine, text_rendering, framebuffer, weather_cache, rotary_input, sheets_worker
 
 SCREEN_WIDTH = 128
 SCREEN_HEIGHT = 64
 
 
-# interface = google_sheets_interface.GoogleSheetsInterface(
-#     client_secret_file=r'C:\Users\michael.meer\PycharmProjects\WeightlossGadget\client_secret_1082141044520-n0cg7u76fd8pvvagh929o91538u1val1.apps.googleusercontent.com.json',
-#     application_name='dailycalories',
-#     sheet_id='1VHbeWIq21ib7MndwwCHRon52of1MI4z9RVproZ_kpCk'
-# )
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'resources', 'Roboto-Bold.ttf')
+
 
-fnt = ImageFont.truetype(r'../resources/Roboto-Bold.ttf', 14)
+def text_renderer():
+    """The TextRenderer of the screen font, loaded when the first frame is drawn rather than at import."""
+    return text_rendering.text_renderer_for(FONT_PATH, 14)
 
 
 class Color(Enum):
@@ -31,9 +28,16 @@ class Color(Enum):
 
 
 class AbstractScreen(object):
+    # Screens with slow setup (like a network request) set this and do the setup in prepare()
+    needs_preparation = False
+
     def __init__(self, controller, config):
         self.controller = controller
         self.config = config
+        # Drawn on again for every frame, the controller copies each frame before the next one
+        self.canvas = text_rendering.Canvas(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.frame_cache = framebuffer.FrameCache()
+        self.is_prepared = not self.needs_preparation
         self.get_logger()
 
     def get_logger(self):
@@ -54,158 +58,276 @@ class AbstractScreen(object):
     def does_need_update(self):
         return False
 
+    def next_update_deadline(self):
+        """time.monotonic() at which does_need_update() turns True, None if only events change the screen."""
+        return None
+
+    def render_inputs(self):
+        """Hashable values create_image() draws from, None if every frame has to be rendered."""
+        return None
+
+    def prepare(self):
+        """Slow setup, run by the controller on a background thread; is_prepared is set once it returned."""
+
+    def preload(self):
+        """Starts loading the data create_image() draws while the screen is next to the current one, True once loaded."""
+        return True
+
+    def frame_inputs(self):
+        """render_inputs() of a prepared screen, None while the placeholder is shown."""
+        return self.render_inputs() if self.is_prepared else None
+
+    def placeholder_image(self):
+        im = self.canvas.clear(0)
+        text_renderer().draw_text(im, (0, 0), self.__class__.__name__, 1)
+        text_renderer().draw_text(im, (0, 28), "Loading...", 1)
+        return im
+
+    def render_frame(self):
+        """The finished frame, taken from the frame cache if it was rendered from the same inputs before."""
+        if not self.is_prepared:
+            return self.placeholder_image()
+        render_inputs = self.render_inputs()
+        if render_inputs is None:
+            return self.create_image()
+        return self.frame_cache.get_frame(render_inputs, self.create_image)
+
 
 class WatchScreen(AbstractScreen):
     def __init__(self, controller, config):
         super().__init__(controller, config)
-        self.counter = 0
+        self.next_update_time = time.monotonic()
 
     def does_need_update(self):
         if not self.controller.is_led_pattern_set():
             self.controller.set_led_pattern(led_patterns.red_blinking_pattern)
-        self.counter += 1
-        return self.counter % 5 == 0
+        now = time.monotonic()
+        if now < self.next_update_time:
+            return False
+        # Redraw right after the next full second of the wall clock
+        self.next_update_time = now + 1.0 - time.time() % 1.0
+        return True
+
+    def next_update_deadline(self):
+        return self.next_update_time
 
     def create_image(self):
-        im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), 128)
-        draw = ImageDraw.Draw(im)
+        im = self.canvas.clear(1)
 
         t = time.localtime()
         time_text = time.strftime("%H:%M:%S", t)
         weekday_text = time.strftime("%A", t)
         date_text = time.strftime('%Y-%m-%d', t)
 
-        draw.text((0, 0), time_text, font=fnt)
-        draw.text((0, 18), weekday_text, font=fnt)
-        draw.text((0, 36), date_text, font=fnt)
+        text_renderer().draw_text(im, (0, 0), time_text, 0)
+        text_renderer().draw_text(im, (0, 18), weekday_text, 0)
+        text_renderer().draw_text(im, (0, 36), date_text, 0)
         self.logger.debug("time used in picture: %s" % time_text)
-        del draw
         return im
 
 class IpAddressScreen(AbstractScreen):
     def __init__(self, controller, config):
         super().__init__(controller, config)
-        self.counter = 0
-       
+        self.address = None
+
+    def resolve(self):
+        """(ip address, hostname), looked up only once since gethostbyname() blocks until the resolver answers."""
+        if self.address is None:
+            hostname = socket.gethostname()
+            self.address = socket.gethostbyname(hostname), hostname
+        return self.address
+
     def does_need_update(self):
-        self.counter += 1
-        return self.counter <= 1
+        needs_update = self.address is None
+        self.resolve()
+        return needs_update
+
+    def preload(self):
+        self.resolve()
+        return True
+
+    def render_inputs(self):
+        return self.address
 
     def create_image(self):
-        im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), color = 0)
-        draw = ImageDraw.Draw(im)
-        ip_address = socket.gethostbyname(socket.gethostname())
-        hostname = socket.gethostname()
-        draw.text((0, 0), ip_address, font=fnt, fill=1)
-        draw.text((0, 20), hostname, font=fnt, fill=1)
-
-        del draw
+        im = self.canvas.clear(0)
+        ip_address, hostname = self.resolve()
+        text_renderer().draw_text(im, (0, 0), ip_address, 1)
+        text_renderer().draw_text(im, (0, 20), hostname, 1)
+
         return im
 
 
 class WeatherScreen(AbstractScreen):
-    zip_code_query_template = "http://api.openweathermap.org/data/2.5/weather?appid={API_KEY}&zip={zip_code},{country_code}&units=metric"
-
     """
     Find black / white weather icons here:
     https://erikflowers.github.io/weather-icons/
     
     """
+    needs_preparation = True
+
     def __init__(self, controller, config):
         super().__init__(controller, config)
         self.api_key = self.config['api_key']
         self.zip_code = self.config['zip_code']
         self.country_code = self.config['country_code']
-        self.current_weather_data = self.fetch_current_data()
-
-    def fetch_current_data(self):
-        zip_code_query = self.zip_code_query_template.format(
-            API_KEY=self.api_key,
-            zip_code=self.zip_code,
-            country_code=self.country_code)
-        self.logger.debug("Weather Query: %s"%zip_code_query)
-
-        url_request = urllib.request.urlopen(zip_code_query)
-        raw_content = url_request.read()
-        encoding = url_request.info().get_content_charset('utf-8')
-        parsed_weather_data = json.loads(raw_content.decode(encoding))
-        self.logger.debug("Current Weather Data: %s", parsed_weather_data)
-        return parsed_weather_data
+        self.weather_cache = weather_cache.WeatherCache(
+            weather_cache.QUERY_URL_TEMPLATE.format(
+                API_KEY=self.api_key, zip_code=self.zip_code, country_code=self.country_code),
+            place="%s,%s" % (self.zip_code, self.country_code),
+            cache_path=self.config.get('cache_path', '../weather_cache.json'),
+            ttl=float(self.config.get('ttl', '600')),
+            http_timeout=float(self.config.get('http_timeout', '10')))
+        self.weather_refresher = None
+        self.shown_inputs = None
+
+    def prepare(self):
+        self.weather_cache.load()
+        # Without a cached reading the refresher fetches one right away and retries until it gets one
+        if self.weather_refresher is None:
+            self.weather_refresher = weather_cache.WeatherRefresher(
+                self.weather_cache, on_update=self.controller.wake_up)
+            self.weather_refresher.start()
+
+    def does_need_update(self):
+        # A new reading or the next minute of its age
+        frame_inputs = self.frame_inputs()
+        needs_update = frame_inputs != self.shown_inputs
+        self.shown_inputs = frame_inputs
+        return needs_update
+
+    def next_update_deadline(self):
+        age = self.weather_cache.age()
+        if not self.is_prepared or age is None:
+            return None
+        return time.monotonic() + 60 - age % 60
+
+    def render_inputs(self):
+        current_weather_data, fetched_at = self.weather_cache.reading()
+        if current_weather_data is None:
+            return "Weather", "No reading yet", ""
+        current_temperature = current_weather_data['main']['temp']
+        city = current_weather_data['name']
+        return city, "%.1f C"%current_temperature, weather_cache.format_age(self.weather_cache.age())
 
     def create_image(self):
-        im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), color = 0)
-        draw = ImageDraw.Draw(im)
+        im = self.canvas.clear(0)
+        city, temperature, age = self.render_inputs()
+        text_renderer().draw_text(im, (0, 0), city, 1)
+        text_renderer().draw_text(im, (0, 15), temperature, 1)
+        text_renderer().draw_text(im, (0, 30), age, 1)
 
-        current_temperature = self.current_weather_data['main']['temp']
-        city = self.current_weather_data['name']
-        sunrise_timestamp = self.current_weather_data['sys']['sunrise']
-        sunrise = datetime.fromtimestamp(sunrise_timestamp)
-        sunset_timestamp = self.current_weather_data['sys']['sunset']
-        sunset = datetime.fromtimestamp(sunset_timestamp)
+        return im
 
-        temperature = "%.1f C"%current_temperature
-        draw.text((0, 0), city, font=fnt, fill=1)
-        draw.text((0, 15), temperature, font=fnt, fill=1)
 
-        del draw
-        return im
+class HistoryLoader(object):
+    """Loads the WeightHistory of a person on the controller's SheetsWorker.
+
+    check() is called from the controller loop and returns True once a newly
+    loaded history is available in self.history. A failed load is retried
+    with a growing delay, retry_deadline() tells the loop when.
+    """
+    def __init__(self, screen, person):
+        self.screen = screen
+        self.person = person
+        self.history = None
+        self.history_future = None
+        self.refresh_requested = True
+        self.backoff = sheets_worker.RetryBackoff()
+
+    def refresh(self):
+        self.refresh_requested = True
+
+    def retry_deadline(self):
+        return self.backoff.retry_time
+
+    def check(self):
+        if self.refresh_requested and self.history_future is None and self.backoff.is_due():
+            self.refresh_requested = False
+            self.backoff.started()
+            # The worker extends a copy, the current history keeps being rendered meanwhile
+            previous_history = self.history.copy() if self.history is not None else None
+            self.history_future = self.screen.controller.get_sheets_worker().submit(
+                'read_weight_history', self.person, history=previous_history)
+
+        if self.history_future is None or not self.history_future.done():
+            return False
+
+        # Already imported by the worker that read the history
+        from weightloss_gadget import google_sheets_interface
+        future, self.history_future = self.history_future, None
+        try:
+            self.history = future.result()
+        except google_sheets_interface.NETWORK_ERRORS as exception:
+            self.screen.logger.warning("Could not read weight history of %s, retrying in %.0f s: %s",
+                                       self.person, self.backoff.failed(), exception)
+        except Exception:
+            # A changed sheet layout, logged with its traceback
+            self.screen.logger.exception("Could not read weight history of %s, retrying in %.0f s",
+                                         self.person, self.backoff.failed())
+        else:
+            self.backoff.succeeded()
+            return True
+        self.refresh_requested = True
+        return False
 
 
 class WeightChartScreen(AbstractScreen):
+    """
+    Chart of the weight history of one person
+
+    Configuration:
+    - person: name of the person's sheet
+    - days: number of days shown, or "all" for the whole history (default 30)
+
+    The history is loaded once in the background, afterwards the chart is
+    rendered from memory.
+    """
     def __init__(self, controller, config):
         super().__init__(controller, config)
-        self.data_points = [66.6,
-            66.5,
-            66.4,
-            66.3,
-            66.2,
-            66.1,
-            66.0,
-            65.9,
-            65.8,
-            65.7,
-            65.6,
-            65.5,
-            65.4,
-            65.3,
-            65.2,
-            65.1,
-            65.0,
-            64.9,
-            64.8,
-            64.7,
-            64.6,
-            64.6,
-            64.6,
-            64.9,
-            64.3,
-            64.1,
-            64.0,
-            63.9,
-            63.8,
-            63.7,
-            63.6,
-        ]
+        self.person = self.config['person']
+        days = self.config.get('days', '30')
+        self.days = None if days == 'all' else int(days)
+        self.history_loader = HistoryLoader(self, self.person)
 
-    def create_image(self):
-        FG = 0
-        BG = 1
-        im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), color=BG)
-        draw = ImageDraw.Draw(im)
+    def refresh_current_data(self):
+        self.history_loader.refresh()
 
-        min_weight = min(self.data_points)
-        max_weight = max(self.data_points)
-        number_of_elements = len(self.data_points)
-        self.logger.info("min_weight %i, max_weight %i, number_of_elements %i", min_weight, max_weight, number_of_elements)
+    def does_need_update(self):
+        return self.history_loader.check()
 
-        """
-        30 elements, 128 pixels
-        """
-        x_multiplicator = SCREEN_WIDTH // number_of_elements
+    def preload(self):
+        self.history_loader.check()
+        return self.history_loader.history is not None
+
+    def next_update_deadline(self):
+        return self.history_loader.retry_deadline()
 
-        lines = [(x*x_multiplicator, SCREEN_HEIGHT - (current_weight - min_weight) / (max_weight - min_weight) * SCREEN_HEIGHT) for x, current_weight in enumerate(self.data_points)]
+    def create_image(self):
+        FG = 0
+        BG = 1
+        im = self.canvas.clear(BG)
+        draw = self.canvas.draw
+
+        history = self.history_loader.history
+        if history is None:
+            text_renderer().draw_text(im, (0, 0), self.person, FG)
+            text_renderer().draw_text(im, (0, 28), "Loading...", FG)
+            return im
+
+        first_date, weights, trends = history.window(self.days, date.today())
+        values = [value for value in list(weights) + list(trends) if not math.isnan(value)]
+        if not values:
+            text_renderer().draw_text(im, (0, 0), self.person, FG)
+            text_renderer().draw_text(im, (0, 28), "No data", FG)
+            return im
+
+        min_weight = min(values)
+        max_weight = max(values)
+        if max_weight - min_weight < 1.0:
+            min_weight, max_weight = min_weight - 0.5, max_weight + 0.5
+        self.logger.debug("min_weight %.1f, max_weight %.1f, number_of_elements %i", min_weight, max_weight, len(weights))
 
-        draw.line(lines, fill=FG)
         """
         0   max_y
         
@@ -219,8 +341,88 @@ class WeightChartScreen(AbstractScreen):
         screen_height - (current_y - min_y) / (max_y - min_y) * screen_height
         
         """
+        x_multiplicator = (SCREEN_WIDTH - 1) / max(len(weights) - 1, 1)
+
+        def point(x, weight):
+            return (x * x_multiplicator,
+                    SCREEN_HEIGHT - 1 - (weight - min_weight) / (max_weight - min_weight) * (SCREEN_HEIGHT - 1))
+
+        # The trend is drawn as a line that is interrupted by gaps, the weights as dots
+        segment = []
+        for x, trend in enumerate(list(trends) + [math.nan]):
+            if math.isnan(trend):
+                if len(segment) > 1:
+                    draw.line(segment, fill=FG)
+                elif segment:
+                    draw.point(segment, fill=FG)
+                segment = []
+            else:
+                segment.append(point(x, trend))
+
+        draw.point([point(x, weight) for x, weight in enumerate(weights) if not math.isnan(weight)], fill=FG)
+
+        return im
+
+
+class StatisticsScreen(AbstractScreen):
+    """
+    Summary numbers of one person
+
+    - Starting weight
+    - Loss since start
+    - Loss in the last 30 days (of the trend)
+    - Lowest weight this year
+
+    The numbers come from an AggregateIndex built once from the history, a
+    weight entered on a WeightInputScreen is added to it directly.
+    """
+    def __init__(self, controller, config):
+        super().__init__(controller, config)
+        self.person = self.config['person']
+        self.history_loader = HistoryLoader(self, self.person)
+        self.index = None
+        self.data_changed = False
+
+    def refresh_current_data(self):
+        self.history_loader.refresh()
+
+    def record_weight(self, weight, date_object):
+        if self.index is not None:
+            self.index.add_weight(date_object, weight)
+            self.data_changed = True
+
+    def next_update_deadline(self):
+        return self.history_loader.retry_deadline()
+
+    def does_need_update(self):
+        if self.history_loader.check():
+            self.index = aggregate_index.AggregateIndex(self.history_loader.history.copy())
+            self.data_changed = True
+        data_changed, self.data_changed = self.data_changed, False
+        return data_changed
+
+    def preload(self):
+        self.does_need_update()
+        return self.index is not None
+
+    def create_image(self):
+        FG = 0
+        BG = 1
+        im = self.canvas.clear(BG)
+
+        if self.index is None:
+            text_renderer().draw_text(im, (0, 0), self.person, FG)
+            text_renderer().draw_text(im, (0, 28), "Loading...", FG)
+        else:
+            today = date.today()
+            starting_weight = self.index.starting_weight()
+            year_bucket = self.index.bucket('year', today)
+            text_renderer().draw_text(im, (0, 0), "Start: %5.1f" % starting_weight, FG)
+            text_renderer().draw_text(im, (0, 14), "Total: %+5.1f" % (self.index.latest_weight() - starting_weight), FG)
+            text_renderer().draw_text(im, (0, 28), "30 days: %+5.1f" % self.index.change(today - timedelta(days=30), today), FG)
+            if year_bucket is not None:
+                text_renderer().draw_text(im, (0, 42), "Year min: %5.1f" % year_bucket.minimum, FG)
 
-        del draw
         return im
 
 
@@ -244,22 +446,58 @@ class WeightInputScreen(AbstractScreen):
     def __init__(self, controller, config):
         super().__init__(controller, config)
         self.person = self.config['person']
-        self.update_frequency = 0.5
+        self.blink_interval = 0.2
+        self.next_blink_time = None
         self.counter = 0
         self.input_mode = False
 
+        self.current_weight = None
+        self.last_date = None
+        self.current_trend_weight = None
+        self.current_variance = None
+        self.trend_engine = trend_engine.TrendEngine(float(self.config.get('trend_smoothing', '0.1')))
+        self.person_trend = None
+        self.data_changed = False
+        # 0.1 kg per detent when turned slowly, 1 kg when spun quickly
+        self.acceleration = rotary_input.RotaryAcceleration(
+            slow_step=float(self.config.get('slow_step', '0.1')), fast_step=float(self.config.get('fast_step', '1.0')))
         self.refresh_current_data()
 
     def refresh_current_data(self):
-        last_updates = interface.read_last_updates(self.person)
-        self.current_weight = last_updates["Latest Measured Weight"]
+        # Only flags the refresh, the controller collects the flags of all
+        # weight screens and reads their LastUpdates in a single request
+        self.refresh_requested = True
+
+    def set_last_updates(self, last_updates):
+        if not self.input_mode:
+            self.current_weight = last_updates["Latest Measured Weight"]
         self.last_date = last_updates["Last Set Day"]
         self.current_trend_weight = last_updates["Latest Trend Weight"]
         self.current_variance = last_updates["Latest Variance"]
+        self.person_trend = trend_engine.PersonTrend(
+            self.trend_engine,
+            date.fromisoformat(self.last_date),
+            last_updates["Latest Measured Weight"],
+            self.current_trend_weight)
+        self.data_changed = True
+
+    def is_pending(self):
+        return self.current_weight is None
 
     def does_need_update(self):
-        self.counter += 1
-        return self.counter % 2 == 0
+        data_changed, self.data_changed = self.data_changed, False
+        now = time.monotonic()
+        if self.next_blink_time is not None and now >= self.next_blink_time:
+            self.counter += 1
+            self.next_blink_time += self.blink_interval
+            if self.next_blink_time <= now:
+                self.next_blink_time = now + self.blink_interval
+            return True
+        return data_changed
+
+    def next_update_deadline(self):
+        # Only the blinking weight of the input mode changes on its own
+        return self.next_blink_time
 
     def formatted_last_date(self):
         today = date.today()
@@ -271,48 +509,76 @@ class WeightInputScreen(AbstractScreen):
         else:
             return self.last_date
 
+    def render_inputs(self):
+        if self.is_pending():
+            return ('pending', self.person)
+        elif self.input_mode:
+            weight_str = "Weight: %5.1f"%self.current_weight
+            if self.counter%3 == 0:
+                # The last digit blinks
+                weight_str = weight_str[:-1]+' '
+            return ('input', self.person, weight_str)
+        else:
+            return ('display', self.person, self.formatted_last_date(),
+                    "Weight: %5.1f" % self.current_weight, "Trend: %5.1f" % self.current_variance)
+
     def create_image(self):
-        if self.input_mode:
+        render_inputs = self.render_inputs()
+        if render_inputs[0] == 'pending':
+            FG = 0
+            BG = 1
+            im = self.canvas.clear(BG)
+            text_renderer().draw_text(im, (0, 0), self.person, FG)
+            text_renderer().draw_text(im, (0, 28), "Loading...", FG)
+
+        elif render_inputs[0] == 'input':
             FG = 1
             BG = 0
-            im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), color=BG)
-            draw = ImageDraw.Draw(im)
-            draw.text((0, 0), self.person, font=fnt, fill=FG)
-            weight_str = "Weight: %5.1f"%self.current_weight
-            self.logger.debug("Counter: %i", self.counter)
-            if self.input_mode and self.counter%3 == 0:
-                weight_str = weight_str[:-1]+' '
-            draw.text((30, 20), weight_str, font=fnt, fill=FG)
+            im = self.canvas.clear(BG)
+            mode, person, weight_str = render_inputs
+            text_renderer().draw_text(im, (0, 0), person, FG)
+            text_renderer().draw_text(im, (30, 20), weight_str, FG)
 
         else:
             FG = 0
             BG = 1
-            im = Image.new('1', (SCREEN_WIDTH, SCREEN_HEIGHT), color=BG)
-            draw = ImageDraw.Draw(im)
+            im = self.canvas.clear(BG)
 
-            weight_str = "Weight: %5.1f" % self.current_weight
-            variance_str = "Trend: %5.1f" % self.current_variance
-            draw.text((0, 0), self.person, font=fnt, fill=FG)
-            draw.text((0, 14), self.formatted_last_date(), font=fnt, fill=FG)
-            draw.text((0, 28), weight_str, font=fnt, fill=FG)
-            draw.text((0, 42), variance_str, font=fnt, fill=FG)
+            mode, person, date_str, weight_str, variance_str = render_inputs
+            text_renderer().draw_text(im, (0, 0), person, FG)
+            text_renderer().draw_text(im, (0, 14), date_str, FG)
+            text_renderer().draw_text(im, (0, 28), weight_str, FG)
+            text_renderer().draw_text(im, (0, 42), variance_str, FG)
 
-        del draw
         return im
 
     def handles_input(self):
         return True
 
     def set_input_mode(self, mode):
+        if mode and self.is_pending():
+            return
         self.input_mode = mode
+        self.next_blink_time = time.monotonic() + self.blink_interval if mode else None
 
     def input_mode(self, mode):
         return self.input_mode
 
     def handle_input(self, input):
-        if input.value == GuiActions.ACTION.value:
-            interface.write_weight(self.person, self.current_weight)
-            self.refresh_current_data()
+        if isinstance(input, rotary_input.RotaryTurn):
+            self.current_weight = round(self.current_weight + self.acceleration.change(input), 1)
+        elif input.value == GuiActions.ACTION.value:
+            weight = round(self.current_weight, 1)
+            self.controller.save_weight(self.person, weight, date.today())
+            self.last_date = date.today().isoformat()
+            # Show the new trend right away, the spreadsheet's values replace
+            # it once the journal has been flushed and LastUpdates re-read
+            new_trend = self.person_trend.add_weight(date.today(), weight)
+            if new_trend is not None:
+                self.current_trend_weight, self.current_variance = new_trend
+                # Green below the trend, red above it
+                self.controller.set_led_pattern(led_patterns.weight_loss_pattern if self.current_variance < 0
+                                                else led_patterns.weight_gain_pattern)
             self.set_input_mode(False)
         elif input.value == GuiActions.LEFT.value:
             self.current_weight += -0.1
@@ -0,0 +1,239 @@
+import json
+import logging
+import sqlite3
+import time
+from datetime import timedelta
+
+from weightloss_gadget import google_sheets_interface, weight_history
+
+
+class SheetMirror(object):
+    """Local SQLite copy of the per-person weight sheets.
+
+    A person's sheet is loaded once with a bulk range read, afterwards only the
+    rows from shortly before the last filled row onwards are re-read and the
+    rows that actually changed are written to the database. Reads are served
+    from the database; if the data is older than max_age seconds a sync is
+    attempted first, and if the network is not available the stale data is
+    used.
+
+    The LastUpdates of every person are kept as last read, so a start
+    without network still finds them.
+
+    Like the rest of the interface it is only used from the SheetsWorker
+    thread, the journal flusher goes through a BlockingInterfaceProxy, so
+    the connection keeps SQLite's check that it stays on one thread.
+    """
+    def __init__(self, interface, database_path, max_age=300, resync_rows=7):
+        self.interface = interface
+        self.database_path = database_path
+        self.max_age = max_age
+        self.resync_rows = resync_rows
+        self.connection = None
+        self.get_logger()
+
+    def get_logger(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def __getstate__(self):
+        self_dict = dict(self.__dict__)
+        del self_dict['logger']
+        self_dict['connection'] = None
+        return self_dict
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.get_logger()
+
+    @staticmethod
+    def last_column_id(header_columns):
+        """Column id of the last column with a header, the rows are read up to it."""
+        return google_sheets_interface.column_nbr_to_id(len(header_columns))
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.database_path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_schema ("
+                "person TEXT PRIMARY KEY, start_date TEXT, start_row INTEGER, "
+                "header_columns TEXT, synced_at REAL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                "person TEXT, date TEXT, row_nbr INTEGER, weight REAL, row_values TEXT, "
+                "PRIMARY KEY (person, date))")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS last_updates ("
+                "person TEXT PRIMARY KEY, last_updates TEXT, read_at REAL)")
+            self.connection.commit()
+        return self.connection
+
+    def read_schema(self, person):
+        cursor = self.get_connection().execute(
+            "SELECT start_date, start_row, header_columns, synced_at FROM sheet_schema WHERE person=?", (person,))
+        result = cursor.fetchone()
+        if result is None:
+            return None
+        start_date, start_row, header_columns, synced_at = result
+        return {
+            'start_date': self.interface.convert_iso_string_to_date(start_date),
+            'start_row': start_row,
+            'header_columns': json.loads(header_columns),
+            'synced_at': synced_at,
+        }
+
+    def is_loaded(self, person):
+        return self.read_schema(person) is not None
+
+    def is_fresh(self, person):
+        schema = self.read_schema(person)
+        return schema is not None and time.time() - schema['synced_at'] < self.max_age
+
+    def invalidate(self, person):
+        connection = self.get_connection()
+        connection.execute("UPDATE sheet_schema SET synced_at=0 WHERE person=?", (person,))
+        connection.commit()
+
+    def load(self, person):
+        self.interface.invalidate_schema(person)
+        schema = self.interface.get_schema(person)
+        start_row = schema.start_date_reference.row_nbr
+        rows_values = self.interface.read_range(
+            "%s!A%i:%s" % (person, start_row, self.last_column_id(schema.header_columns)))
+
+        connection = self.get_connection()
+        connection.execute("DELETE FROM sheet_rows WHERE person=?", (person,))
+        connection.execute(
+            "INSERT OR REPLACE INTO sheet_schema VALUES (?, ?, ?, ?, ?)",
+            (person, schema.start_date.isoformat(), start_row, json.dumps(schema.header_columns), 0))
+        connection.commit()
+
+        changed_rows = self.store_rows(person, start_row, rows_values)
+        self.logger.info("Loaded %i rows for %s", changed_rows, person)
+        return changed_rows
+
+    def sync(self, person):
+        schema = self.read_schema(person)
+        if schema is None:
+            return self.load(person)
+
+        connection = self.get_connection()
+        last_filled_row = connection.execute(
+            "SELECT MAX(row_nbr) FROM sheet_rows WHERE person=? AND weight IS NOT NULL", (person,)).fetchone()[0]
+        first_row = schema['start_row']
+        if last_filled_row is not None:
+            first_row = max(first_row, last_filled_row - self.resync_rows)
+
+        rows_values = self.interface.read_range(
+            "%s!A%i:%s" % (person, first_row, self.last_column_id(schema['header_columns'])))
+        changed_rows = self.store_rows(person, first_row, rows_values)
+        self.logger.debug("Synced %s from row %i, %i rows changed", person, first_row, changed_rows)
+        return changed_rows
+
+    def store_rows(self, person, first_row, rows_values):
+        schema = self.read_schema(person)
+        header_columns = schema['header_columns']
+        connection = self.get_connection()
+
+        changed_rows = 0
+        for offset, row_values in enumerate(rows_values):
+            row_nbr = first_row + offset
+            row_date = schema['start_date'] + timedelta(days=row_nbr - schema['start_row'])
+            row = self.interface.map_row_values(row_values, header_columns)
+            serialized_row = json.dumps(row, sort_keys=True)
+
+            stored = connection.execute(
+                "SELECT row_values FROM sheet_rows WHERE person=? AND date=?",
+                (person, row_date.isoformat())).fetchone()
+            if stored is not None and stored[0] == serialized_row:
+                continue
+
+            weight = self.interface.convert_string_to_float(row.get('Weight in kg'))
+            connection.execute(
+                "INSERT OR REPLACE INTO sheet_rows VALUES (?, ?, ?, ?, ?)",
+                (person, row_date.isoformat(), row_nbr, weight, serialized_row))
+            changed_rows += 1
+
+        connection.execute("UPDATE sheet_schema SET synced_at=? WHERE person=?", (time.time(), person))
+        connection.commit()
+        return changed_rows
+
+    def record_weight(self, person, weight, date_object):
+        """Applies a weight written to the sheet to the local copy.
+
+        The row is marked stale as well, so the next read picks up the values
+        the spreadsheet formulas derive from it.
+        """
+        connection = self.get_connection()
+        result = connection.execute(
+            "SELECT row_values FROM sheet_rows WHERE person=? AND date=?",
+            (person, date_object.isoformat())).fetchone()
+        if result is not None:
+            row = json.loads(result[0])
+            row['Weight in kg'] = str(weight)
+            connection.execute(
+                "UPDATE sheet_rows SET weight=?, row_values=? WHERE person=? AND date=?",
+                (float(weight), json.dumps(row, sort_keys=True), person, date_object.isoformat()))
+            connection.commit()
+        self.invalidate(person)
+
+    def ensure_fresh(self, person):
+        if self.is_fresh(person):
+            return
+        try:
+            self.sync(person)
+        except google_sheets_interface.NETWORK_ERRORS as exception:
+            if not self.is_loaded(person):
+                raise
+            self.logger.warning("Could not sync %s, serving cached rows: %s", person, exception)
+
+    def read_row_for_date(self, person, date_object):
+        self.ensure_fresh(person)
+        result = self.get_connection().execute(
+            "SELECT row_values FROM sheet_rows WHERE person=? AND date=?",
+            (person, date_object.isoformat())).fetchone()
+        if result is None:
+            return None
+        return json.loads(result[0])
+
+    def read_last_saved_row(self, person, date_object):
+        self.ensure_fresh(person)
+        result = self.get_connection().execute(
+            "SELECT row_values FROM sheet_rows WHERE person=? AND date<=? AND weight IS NOT NULL "
+            "ORDER BY date DESC LIMIT 1",
+            (person, date_object.isoformat())).fetchone()
+        if result is None:
+            return None
+        return json.loads(result[0])
+
+    def read_weight_history(self, person, end_date):
+        """The WeightHistory of person up to end_date, built from the local rows after ensure_fresh()."""
+        self.ensure_fresh(person)
+        schema = self.read_schema(person)
+        history = weight_history.WeightHistory(person, schema['start_date'])
+        rows = self.get_connection().execute(
+            "SELECT date, weight, row_values FROM sheet_rows WHERE person=? AND date<=? ORDER BY date",
+            (person, end_date.isoformat()))
+        for row_date, weight, row_values in rows:
+            trend = self.interface.convert_string_to_float(json.loads(row_values).get('Trend'))
+            history.set_day(self.interface.convert_iso_string_to_date(row_date),
+                            weight_history.NAN if weight is None else weight,
+                            weight_history.NAN if trend is None else trend)
+        # Like a read from the sheet, the history reaches up to end_date
+        end_offset = history.offset_for_date(end_date)
+        if end_offset >= len(history):
+            history.set_values(end_offset, weight_history.NAN)
+        return history
+
+    def store_last_updates(self, person, last_updates):
+        connection = self.get_connection()
+        connection.execute("INSERT OR REPLACE INTO last_updates VALUES (?, ?, ?)",
+                           (person, json.dumps(last_updates, sort_keys=True), time.time()))
+        connection.commit()
+
+    def read_last_updates(self, person):
+        """The LastUpdates of person as last read from the sheet, None if they were never read."""
+        result = self.get_connection().execute(
+            "SELECT last_updates FROM last_updates WHERE person=?", (person,)).fetchone()
+        if result is None:
+            return None
+        return json.loads(result[0])
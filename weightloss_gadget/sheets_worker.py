@@ -0,0 +1,91 @@
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SheetsWorker(object):
+    """Runs GoogleSheetsInterface calls on a background thread.
+
+    The interface is created by interface_factory on the worker thread the
+    first time it is needed, so neither the OAuth/discovery setup nor any
+    spreadsheet request ever runs on the controller loop. A single worker
+    thread is used because the underlying httplib2 connection is not thread
+    safe; calls are executed in the order they were submitted.
+
+    on_done, if given, is called on the worker thread after every call has
+    finished, so the controller loop can wake up and pick up the result.
+    """
+    def __init__(self, interface_factory, on_done=None):
+        self.interface_factory = interface_factory
+        self.on_done = on_done
+        self.interface = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SheetsWorker")
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def get_interface(self):
+        if self.interface is None:
+            self.interface = self.interface_factory()
+        return self.interface
+
+    def invoke(self, method_name, args, kwargs):
+        self.logger.debug("Running %s%s", method_name, args)
+        return getattr(self.get_interface(), method_name)(*args, **kwargs)
+
+    def submit(self, method_name, *args, **kwargs):
+        """Schedules interface.method_name(*args, **kwargs) and returns its Future."""
+        future = self.executor.submit(self.invoke, method_name, args, kwargs)
+        if self.on_done is not None:
+            future.add_done_callback(lambda finished_future: self.on_done())
+        return future
+
+    def call(self, method_name, *args, **kwargs):
+        """Runs interface.method_name on the worker thread and waits for the result."""
+        return self.submit(method_name, *args, **kwargs).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class BlockingInterfaceProxy(object):
+    """Looks like a GoogleSheetsInterface, but runs every method through SheetsWorker.call.
+
+    For background threads (like the JournalFlusher) that may block, but must
+    not use the interface concurrently with the worker thread.
+    """
+    def __init__(self, sheets_worker):
+        self.sheets_worker = sheets_worker
+
+    def __getattr__(self, method_name):
+        return functools.partial(self.sheets_worker.call, method_name)
+
+
+class RetryBackoff(object):
+    """When to retry a failed read, with a delay doubling from retry_interval up to max_retry_interval.
+
+    failed() schedules the retry at a time.monotonic() deadline, which the
+    controller loop includes in its deadlines; succeeded() resets the delay.
+    """
+    def __init__(self, retry_interval=5.0, max_retry_interval=300.0, clock=time.monotonic):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.clock = clock
+        self.delay = None
+        self.retry_time = None
+
+    def failed(self):
+        """Schedules the next retry and returns its delay in seconds."""
+        self.delay = min(self.max_retry_interval, self.delay * 2 if self.delay else self.retry_interval)
+        self.retry_time = self.clock() + self.delay
+        return self.delay
+
+    def started(self):
+        """A retry is running, so there is no deadline until it has failed again."""
+        self.retry_time = None
+
+    def succeeded(self):
+        self.delay = None
+        self.retry_time = None
+
+    def is_due(self):
+        return self.retry_time is None or self.clock() >= self.retry_time
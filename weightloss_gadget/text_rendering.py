@@ -0,0 +1,151 @@
+import functools
+import string
+from collections import namedtuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Rasterized when the atlas is created, anything else on first use
+PRELOADED_CHARACTERS = string.digits + string.ascii_letters + string.punctuation + ' '
+
+Glyph = namedtuple('Glyph', ['mask', 'x', 'y', 'advance'])
+
+
+class GlyphAtlas(object):
+    """The glyphs of one font at one size, rasterized once from the TrueType outlines.
+
+    Each glyph is stored as a 1-bit mask cropped to its ink, with the offset
+    of the ink from the pen position and from the top of the line as placed
+    by ImageDraw.text. Rendered on its own, PIL places a glyph relative to
+    the ink of the whole string, which moves short glyphs like "r" up by a
+    row. Every glyph is therefore rasterized behind a full height "|" that
+    is cut off again, so all glyphs share the baseline they get in text.
+
+    Inside a string the hinting moves a glyph by a pixel depending on the
+    glyph before it (and on kerning). pair_offset() measures that shift
+    once per pair of characters by comparing the pair as drawn by PIL with
+    the composed one, so composed text matches ImageDraw.text.
+    """
+    CONTEXT = '|'
+
+    def __init__(self, font):
+        self.font = font
+        ascent, descent = font.getmetrics()
+        self.line_height = ascent + descent
+        # Everything right of the "|" ink belongs to the glyph, even ink left of its pen position
+        self.context_right = self.rasterize(self.CONTEXT).getbbox()[2]
+        self.context_advance = int(font.getlength(self.CONTEXT))
+        self.glyphs = {}
+        self.pair_offsets = {}
+        for character in PRELOADED_CHARACTERS:
+            self.glyph(character)
+
+    def rasterize(self, text):
+        mask = Image.new('1', (int(self.font.getlength(text)) + self.line_height, self.line_height), color=0)
+        ImageDraw.Draw(mask).text((0, 0), text, font=self.font, fill=1)
+        return mask
+
+    def glyph(self, character):
+        if character not in self.glyphs:
+            with_context = self.rasterize(self.CONTEXT + character)
+            ink = with_context.crop((self.context_right, 0) + with_context.size)
+            bounding_box = ink.getbbox()
+            advance = int(self.font.getlength(character))
+            if bounding_box is None:
+                self.glyphs[character] = Glyph(None, 0, 0, advance)
+            else:
+                self.glyphs[character] = Glyph(ink.crop(bounding_box),
+                                               self.context_right + bounding_box[0] - self.context_advance,
+                                               bounding_box[1], advance)
+        return self.glyphs[character]
+
+    def draw_placements(self, placements, size):
+        """A mask of size with the glyphs of the (character, pen) placements."""
+        mask = Image.new('1', size, color=0)
+        for character, pen in placements:
+            glyph = self.glyph(character)
+            if glyph.mask is not None:
+                mask.paste(1, (pen + glyph.x, glyph.y), glyph.mask)
+        return mask
+
+    def pair_offset(self, previous, character):
+        """Pixels the pen moves before character on top of the advance of previous, which is None at the start."""
+        pair = (previous, character)
+        if pair not in self.pair_offsets:
+            self.pair_offsets[pair] = self.measure_pair_offset(previous, character)
+        return self.pair_offsets[pair]
+
+    def measure_pair_offset(self, previous, character):
+        if previous is None:
+            placements, text, pen = [], character, 0
+        else:
+            placements, text, pen = [(previous, 0)], previous + character, self.glyph(previous).advance
+        last_character = character
+        if self.glyph(character).mask is None:
+            # Without ink the shift only shows in where the next glyph goes
+            text += self.CONTEXT
+            pen += self.glyph(character).advance + self.pair_offset(character, self.CONTEXT)
+            last_character = self.CONTEXT
+        drawn = self.rasterize(text)
+        for offset in (0, 1, -1, 2, -2):
+            composed = self.draw_placements(placements + [(last_character, pen + offset)], drawn.size)
+            if composed.tobytes() == drawn.tobytes():
+                return offset
+        return 0
+
+
+class TextRenderer(object):
+    """Draws text onto 1-bit images from a GlyphAtlas and an LRU cache of composed strings.
+
+    A string seen before is a single paste of its cached bitmap; a new one
+    (like the next second of the clock) is composed from the atlas, so the
+    TrueType rasterizer only runs for characters never seen before.
+    """
+    def __init__(self, font, cache_size=256):
+        self.atlas = GlyphAtlas(font)
+        self.text_bitmap = functools.lru_cache(maxsize=cache_size)(self.compose)
+
+    def compose(self, text):
+        """Returns (mask, (x, y)) of text, the offset of the mask from the text position; mask is None without ink."""
+        placements = []
+        pen = 0
+        previous = None
+        for character in text:
+            glyph = self.atlas.glyph(character)
+            pen += self.atlas.pair_offset(previous, character)
+            if glyph.mask is not None:
+                placements.append((glyph.mask, pen + glyph.x, glyph.y))
+            pen += glyph.advance
+            previous = character
+        if not placements:
+            return None, (0, 0)
+
+        left = min(x for mask, x, y in placements)
+        top = min(y for mask, x, y in placements)
+        right = max(x + mask.width for mask, x, y in placements)
+        bottom = max(y + mask.height for mask, x, y in placements)
+        bitmap = Image.new('1', (right - left, bottom - top), color=0)
+        for mask, x, y in placements:
+            bitmap.paste(1, (x - left, y - top), mask)
+        return bitmap, (left, top)
+
+    def draw_text(self, image, position, text, fill):
+        mask, (x, y) = self.text_bitmap(text)
+        if mask is not None:
+            image.paste(fill, (position[0] + x, position[1] + y), mask)
+
+
+@functools.lru_cache(maxsize=None)
+def text_renderer_for(font_path, size):
+    """The shared TextRenderer, and so the glyph atlas, of a font at a size."""
+    return TextRenderer(ImageFont.truetype(font_path, size))
+
+
+class Canvas(object):
+    """A 1-bit image that is cleared and drawn on again for every frame instead of allocating a new one."""
+    def __init__(self, width, height):
+        self.image = Image.new('1', (width, height), color=0)
+        self.draw = ImageDraw.Draw(self.image)
+
+    def clear(self, color):
+        self.image.paste(color, (0, 0) + self.image.size)
+        return self.image
@@ -0,0 +1,70 @@
+import math
+from array import array
+
+NAN = float('nan')
+
+
+class TrendEngine(object):
+    """Exponentially smoothed trend of daily weights, as used in The Hacker's Diet.
+
+    trend = previous_trend + smoothing * (weight - previous_trend)
+    variance = weight - trend
+
+    Days without a weight (NaN) keep the trend of the previous day and have
+    no variance, so a gap neither pulls the trend down nor up.
+    """
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+
+    def next_trend(self, previous_trend, weight):
+        if previous_trend is None or math.isnan(previous_trend):
+            return weight
+        return previous_trend + self.smoothing * (weight - previous_trend)
+
+    def previous_trend(self, trend, weight):
+        """Inverse of next_trend: the trend of the day before, given a day's trend and weight."""
+        return (trend - self.smoothing * weight) / (1 - self.smoothing)
+
+    def day_trend(self, previous_trend, weight):
+        """The trend after a day with weight, a day without one (NaN) keeps previous_trend."""
+        if math.isnan(weight):
+            return previous_trend
+        return self.next_trend(previous_trend, weight)
+
+    def compute(self, weights):
+        """Returns (trends, variances) as array('f') for a whole history of daily weights.
+
+        Each day continues from the stored trend of the day before, so trends
+        appended one day at a time with day_trend() come out the same.
+        """
+        trends = array('f', bytes(4 * len(weights)))
+        variances = array('f', bytes(4 * len(weights)))
+        for offset, weight in enumerate(weights):
+            trends[offset] = self.day_trend(trends[offset - 1] if offset else NAN, weight)
+            variances[offset] = weight - trends[offset]
+        return trends, variances
+
+
+class PersonTrend(object):
+    """The latest trend of one person, updated in O(1) when a new weight is entered."""
+    def __init__(self, engine, last_date, last_weight, last_trend):
+        self.engine = engine
+        self.last_date = last_date
+        self.last_trend = last_trend
+        self.trend_before_last = engine.previous_trend(last_trend, last_weight)
+
+    def add_weight(self, date_object, weight):
+        """Returns (trend, variance) after weight was measured on date_object.
+
+        Entering a weight for the day of the last measurement again replaces
+        that measurement. Weights for earlier days would need the history in
+        between and return None.
+        """
+        if date_object > self.last_date:
+            self.trend_before_last = self.last_trend
+        elif date_object < self.last_date:
+            return None
+
+        self.last_date = date_object
+        self.last_trend = self.engine.next_trend(self.trend_before_last, weight)
+        return self.last_trend, weight - self.last_trend
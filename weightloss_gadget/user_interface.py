@@ -6,16 +6,18 @@ import time
 from functools import partial
 from tkinter import *
 from tkinter.ttk import *
-from multiprocessing import Process, Pipe
+from multiprocessing import Process, Pipe, Lock
 from PIL import Image, ImageTk
 
 from weightloss_gadget.gui_actions import GuiActions
+from weightloss_gadget import framebuffer, instrumentation, led_patterns
 
 
 class TkinterApp(object):
-    def __init__(self, pipe):
+    def __init__(self, pipe, frame_buffer):
         self.logger = logging.getLogger("TkinterApp")
         self.pipe = pipe
+        self.frame_buffer = frame_buffer
 
         self.top = Tk()
         self.top.title("Weightloss Tracker")
@@ -57,37 +59,52 @@ class TkinterApp(object):
 
         self.top.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-        self.top.after(100, self.check_pipe_poll)
+        # Tk cannot block on the pipe, a short poll keeps the frame latency low
+        self.poll_interval_ms = 10
+        self.top.after(self.poll_interval_ms, self.check_pipe_poll)
 
     def on_closing(self):
-        self.pipe.send(GuiActions.EXIT_PROGRAM)
+        self.button_callback(GuiActions.EXIT_PROGRAM)
         self.top.destroy()
 
     def button_callback(self, action):
-        self.pipe.send(action)
+        self.pipe.send(instrumentation.InputEvent(action, time.monotonic()))
+
+    def show_led_frame(self, frame):
+        """Colors the LED widgets from a frame of r, g, b bytes as sent by the controller."""
+        for led_widget, led_color in zip(self.leds, led_patterns.led_colors(frame)):
+            led_widget.configure(bg=led_color)
 
     def check_pipe_poll(self):
-        self.logger.debug("check_pipe_poll")
-        if self.pipe.poll():
+        frame_ready = None
+        while self.pipe.poll():
             object  = self.pipe.recv()
-            if isinstance(object, Image.Image):
-                tk_image = ImageTk.PhotoImage(object)
-                self.image_label.configure(image=tk_image)
-                self.image_label.image = tk_image
-                self.image_label.pack(side=TOP)
-            elif isinstance(object, list):
-                for led_widget, led_state in zip(self.leds, object):
-                    led_widget.configure(bg=str(led_state))
+            if isinstance(object, framebuffer.FrameReady):
+                frame_ready = object
+                received_time = time.monotonic()
+            elif isinstance(object, bytes):
+                self.show_led_frame(object)
             else:
                 raise Exception("Received unknown object: %s (type: %s)"%(object, type(object)))
-        self.top.after(100, self.check_pipe_poll)
+        if frame_ready is not None:
+            # Frames that were replaced before this poll are never shown
+            tk_image = ImageTk.PhotoImage(self.frame_buffer.read_image())
+            self.image_label.configure(image=tk_image)
+            self.image_label.image = tk_image
+            self.image_label.pack(side=TOP)
+            self.pipe.send(instrumentation.FrameShown(
+                frame_ready.sequence, frame_ready.sent_time, frame_ready.input_time, received_time, time.monotonic()))
+        self.top.after(self.poll_interval_ms, self.check_pipe_poll)
 
 class Ssd1306App(Process):
-    def __init__(self, pipe):
+    def __init__(self, pipe, frame_buffer):
         ### DISPLAY PART ###
         super().__init__()    
         self.logger = logging.getLogger("Ssd1306App")
         self.pipe = pipe
+        self.frame_buffer = frame_buffer
+        # The GPIO callbacks and run() both send to the controller
+        self.send_lock = Lock()
         # Raspberry Pi pin configuration:
         self.RST = 14
         # Note the following are only used with SPI:
@@ -102,8 +119,11 @@ class Ssd1306App(Process):
         # Clear display.
         self.disp.clear()
         self.disp.display()
+        # Frames are written straight over SPI, only the windows that changed
+        self.page_writer = framebuffer.Ssd1306PageWriter(
+            self.disp._spi, self.disp._gpio, self.disp._dc, self.disp.width, self.disp.height)
+        self.page_writer.mark_cleared()
 
-        self.update_frequency = 0.1
         
         ### ROTARY ENCODER INPUT ###
         GPIO.setwarnings(True)
@@ -132,7 +152,14 @@ class Ssd1306App(Process):
     
     def button_interrupt(self, button):
         self.logger.debug("Button pressed")
-        self.pipe.send(GuiActions.ACTION)
+        self.send_action(GuiActions.ACTION)
+
+    def send_action(self, action):
+        self.send(instrumentation.InputEvent(action, time.monotonic()))
+
+    def send(self, message):
+        with self.send_lock:
+            self.pipe.send(message)
         
     def rotary_interrupt(self, A_or_B):
         Switch_A = GPIO.input(self.Enc_A)
@@ -147,19 +174,28 @@ class Ssd1306App(Process):
         if (Switch_A and Switch_B):
           if A_or_B == self.Enc_B:                     # Turning direction depends on 
             self.logger.debug("Rotary Encoder turns right")
-            self.pipe.send(GuiActions.RIGHT )
+            self.send_action(GuiActions.RIGHT)
           else:
             self.logger.debug("Rotary Encoder turns left")
-            self.pipe.send(GuiActions.LEFT )
+            self.send_action(GuiActions.LEFT)
         
     def run(self):
-        self.logger.debug("check_pipe_poll")
-
+        # Blocks until the controller sends the next frame
         while True:
-            if self.pipe.poll():
-                pil_image = self.pipe.recv()
-                self.disp.image(pil_image)
-                self.disp.display()
-            time.sleep(self.update_frequency)
+            try:
+                received_object = self.pipe.recv()
+            except EOFError:
+                break
+            if isinstance(received_object, framebuffer.FrameReady):
+                received_time = time.monotonic()
+                self.display_latest_frame()
+                self.send(instrumentation.FrameShown(
+                    received_object.sequence, received_object.sent_time, received_object.input_time,
+                    received_time, time.monotonic()))
+
+    def display_latest_frame(self):
+        sequence, packed_pixels = self.frame_buffer.read()
+        bytes_sent = self.page_writer.write_frame(packed_pixels)
+        self.logger.debug("Frame %i: %i bytes over SPI", sequence, bytes_sent)
 
 
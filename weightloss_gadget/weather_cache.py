@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+QUERY_URL_TEMPLATE = "http://api.openweathermap.org/data/2.5/weather?appid={API_KEY}&zip={zip_code},{country_code}&units=metric"
+
+
+def format_age(seconds):
+    """Short text for the age of a reading, as shown on the WeatherScreen."""
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return "%i min ago" % (seconds // 60)
+    return "%i h ago" % (seconds // 3600)
+
+
+class WeatherCache(object):
+    """The latest current weather reading of one place, kept on disk between runs.
+
+    The reading is stored with the wall clock time it was fetched at, so
+    after a reboot the last reading is shown at once, together with its age,
+    until a new one has been fetched. A reading cached for another place is
+    ignored. It is stale once it is ttl seconds old.
+    """
+    def __init__(self, query_url, place, cache_path=None, ttl=600, http_timeout=10, clock=time.time):
+        self.query_url = query_url
+        self.place = place
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.http_timeout = http_timeout
+        self.clock = clock
+        self.data = None
+        self.fetched_at = None
+        self.lock = threading.Lock()
+        self.get_logger()
+
+    def get_logger(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def __getstate__(self):
+        self_dict = dict(self.__dict__)
+        del self_dict['logger']
+        del self_dict['lock']
+        return self_dict
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.get_logger()
+
+    def reading(self):
+        """(data, fetched_at) of the latest reading, (None, None) before the first one."""
+        with self.lock:
+            return self.data, self.fetched_at
+
+    def age(self):
+        data, fetched_at = self.reading()
+        if data is None:
+            return None
+        return max(0.0, self.clock() - fetched_at)
+
+    def seconds_until_stale(self):
+        age = self.age()
+        if age is None:
+            return 0.0
+        return max(0.0, self.ttl - age)
+
+    def load(self):
+        """Takes the reading from the cache file, if there is one for this place."""
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as cache_file:
+                cached = json.load(cache_file)
+            place, data, fetched_at = cached.get('place'), cached['data'], float(cached['fetched_at'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as exception:
+            self.logger.warning("Ignoring damaged weather cache %s: %s", self.cache_path, exception)
+            return
+        if place != self.place:
+            self.logger.info("Weather cache is for another place, ignoring it")
+            return
+        with self.lock:
+            self.data, self.fetched_at = data, fetched_at
+
+    def write(self, data, fetched_at):
+        if self.cache_path is None:
+            return
+        temporary_path = self.cache_path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({'place': self.place, 'fetched_at': fetched_at, 'data': data}, cache_file)
+        os.replace(temporary_path, self.cache_path)
+
+    def fetch(self):
+        with urllib.request.urlopen(self.query_url, timeout=self.http_timeout) as response:
+            raw_content = response.read()
+            encoding = response.info().get_content_charset('utf-8')
+        data = json.loads(raw_content.decode(encoding))
+        if 'name' not in data or 'temp' not in data.get('main', {}):
+            raise ValueError("Weather response without name and temperature: %r" % data)
+        return data
+
+    def refresh(self):
+        """Fetches a new reading and stores it; raises OSError or ValueError if the fetch fails.
+
+        A cache file that cannot be written is only logged, the new reading
+        is kept in memory all the same.
+        """
+        data = self.fetch()
+        fetched_at = self.clock()
+        with self.lock:
+            self.data, self.fetched_at = data, fetched_at
+        try:
+            self.write(data, fetched_at)
+        except OSError as exception:
+            self.logger.warning("Could not write the weather cache %s: %s", self.cache_path, exception)
+        self.logger.debug("Current Weather Data: %s", data)
+        return data
+
+
+class WeatherRefresher(threading.Thread):
+    """Fetches a new reading into a WeatherCache whenever the cached one turns stale.
+
+    A failed fetch is retried after retry_interval seconds. on_update is
+    called after every new reading, from this thread.
+    """
+    def __init__(self, cache, retry_interval=60.0, on_update=None):
+        super().__init__(name="WeatherRefresher", daemon=True)
+        self.cache = cache
+        self.retry_interval = retry_interval
+        self.on_update = on_update
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.cache.seconds_until_stale()):
+            try:
+                self.cache.refresh()
+            except (OSError, ValueError) as exception:
+                self.logger.warning("Could not refresh the weather: %s", exception)
+                self.stop_event.wait(self.retry_interval)
+                continue
+            if self.on_update is not None:
+                self.on_update()
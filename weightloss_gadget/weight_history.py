@@ -0,0 +1,69 @@
+import math
+from array import array
+from datetime import timedelta
+
+NAN = float('nan')
+
+
+class WeightHistory(object):
+    """Daily weight and trend of one person in two compact float arrays.
+
+    Index i holds the values of start_date + i days; days without a value are
+    NaN. 4 bytes per value keep ten years of history below 30 kB, so charts
+    of any window can be rendered from memory.
+    """
+    def __init__(self, person, start_date):
+        self.person = person
+        self.start_date = start_date
+        self.weights = array('f')
+        self.trends = array('f')
+
+    def copy(self):
+        history = WeightHistory(self.person, self.start_date)
+        history.weights = array('f', self.weights)
+        history.trends = array('f', self.trends)
+        return history
+
+    def __len__(self):
+        return len(self.weights)
+
+    def end_date(self):
+        return self.start_date + timedelta(days=len(self.weights) - 1)
+
+    def offset_for_date(self, date_object):
+        return (date_object - self.start_date).days
+
+    def truncate(self, length):
+        del self.weights[length:]
+        del self.trends[length:]
+
+    def set_values(self, offset, weight, trend=NAN):
+        while len(self.weights) <= offset:
+            self.weights.append(NAN)
+            self.trends.append(NAN)
+        self.weights[offset] = weight
+        self.trends[offset] = trend
+
+    def set_day(self, date_object, weight, trend=NAN):
+        self.set_values(self.offset_for_date(date_object), weight, trend)
+
+    def last_measured_offset(self):
+        for offset in range(len(self.weights) - 1, -1, -1):
+            if not math.isnan(self.weights[offset]):
+                return offset
+        return None
+
+    def window(self, days=None, end_date=None):
+        """Returns (first_date, weights, trends) of the days up to end_date, all days if days is None.
+
+        The arrays are empty if end_date is before start_date.
+        """
+        end_offset = len(self.weights) - 1 if end_date is None else self.offset_for_date(end_date)
+        end_offset = min(end_offset, len(self.weights) - 1)
+        if end_offset < 0:
+            # A negative offset would slice from the end of the arrays
+            return self.start_date, array('f'), array('f')
+        first_offset = 0 if days is None else max(0, end_offset - days + 1)
+        return (self.start_date + timedelta(days=first_offset),
+                self.weights[first_offset:end_offset + 1],
+                self.trends[first_offset:end_offset + 1])
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+import uuid
+
+from weightloss_gadget import google_sheets_interface
+
+
+class WriteJournal(object):
+    """Append-only file of weights that still have to be written to the spreadsheet.
+
+    Every entry is one JSON line, flushed and fsynced before append returns,
+    so an entered weight survives a power cut or a missing network. Entries
+    that have been written to the spreadsheet are removed by rewriting the
+    file with the remaining ones.
+    """
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.get_logger()
+
+    def get_logger(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def __getstate__(self):
+        self_dict = dict(self.__dict__)
+        del self_dict['logger']
+        del self_dict['lock']
+        return self_dict
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.get_logger()
+
+    def append(self, person, weight, date_object):
+        entry = {
+            'id': uuid.uuid4().hex,
+            'person': person,
+            'weight': weight,
+            'date': date_object.isoformat(),
+        }
+        with self.lock:
+            with open(self.journal_path, 'a') as journal_file:
+                journal_file.write(json.dumps(entry) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        self.logger.debug("Journaled weight %s for %s on %s", weight, person, entry['date'])
+        return entry
+
+    def read_entries(self, damaged_lines=None):
+        """The decodable entries; lines that cannot be decoded are added to damaged_lines if it is given."""
+        if not os.path.exists(self.journal_path):
+            return []
+        entries = []
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a power loss during append
+                    self.logger.warning("Skipping damaged journal line: %r", line)
+                    if damaged_lines is not None:
+                        damaged_lines.append(line.rstrip('\n'))
+        return entries
+
+    def pending_entries(self):
+        with self.lock:
+            return self.read_entries()
+
+    def depth(self):
+        return len(self.pending_entries())
+
+    def rewrite(self, remaining_entries, damaged_lines):
+        """Replaces the journal by remaining_entries, damaged lines are kept in the quarantine file."""
+        if damaged_lines:
+            self.append_to_quarantine(damaged_lines)
+        temporary_path = self.journal_path + '.tmp'
+        with open(temporary_path, 'w') as journal_file:
+            for entry in remaining_entries:
+                journal_file.write(json.dumps(entry) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(temporary_path, self.journal_path)
+
+    def remove(self, entry_ids):
+        entry_ids = set(entry_ids)
+        damaged_lines = []
+        with self.lock:
+            remaining_entries = [entry for entry in self.read_entries(damaged_lines)
+                                 if not isinstance(entry, dict) or entry.get('id') not in entry_ids]
+            self.rewrite(remaining_entries, damaged_lines)
+        return len(remaining_entries)
+
+    def quarantine_path(self):
+        return self.journal_path + '.quarantine'
+
+    def append_to_quarantine(self, lines):
+        with open(self.quarantine_path(), 'a') as quarantine_file:
+            for line in lines:
+                quarantine_file.write(line + '\n')
+            quarantine_file.flush()
+            os.fsync(quarantine_file.fileno())
+
+    def quarantine(self, entries):
+        """Moves entries that can never be written out of the journal into the quarantine file next to it."""
+        damaged_lines = []
+        with self.lock:
+            self.append_to_quarantine(json.dumps(entry) for entry in entries)
+            remaining_entries = [entry for entry in self.read_entries(damaged_lines) if entry not in entries]
+            self.rewrite(remaining_entries, damaged_lines)
+        return len(remaining_entries)
+
+
+class JournalFlushError(Exception):
+    """Some journal entries could not be written and are retried with the next flush."""
+
+
+class JournalFlusher(threading.Thread):
+    """Background thread writing the journal to the spreadsheet.
+
+    All pending entries are coalesced, only the latest weight per person and
+    day is kept, and sent in one batchUpdate. If that fails, the flush is
+    retried with a growing delay up to max_retry_interval seconds. After a
+    successful flush on_flush is called with the set of persons written.
+
+    If the batch fails for another reason than the network (an unknown
+    person, a damaged entry), every person and day is written on its own;
+    entries that fail like that in max_failures flushes are moved to the
+    journal's quarantine file, so they no longer hold up the others.
+    """
+    def __init__(self, journal, interface, retry_interval=5.0, max_retry_interval=300.0, on_flush=None,
+                 max_failures=3):
+        super().__init__(name="JournalFlusher", daemon=True)
+        self.journal = journal
+        self.interface = interface
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.on_flush = on_flush
+        self.max_failures = max_failures
+        self.failures = {}
+        self.wake_up_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def wake_up(self):
+        self.wake_up_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_up_event.set()
+
+    def journal_depth(self):
+        return self.journal.depth()
+
+    def coalesce(self, entries):
+        latest_entries = {}
+        for entry in entries:
+            latest_entries[(entry['person'], entry['date'])] = entry
+        return list(latest_entries.values())
+
+    def group_entries(self, entries):
+        """Entries grouped by person and day; an entry without them is a group of its own."""
+        groups = {}
+        for index, entry in enumerate(entries):
+            if isinstance(entry, dict) and 'person' in entry and 'date' in entry:
+                key = (entry['person'], entry['date'])
+            else:
+                key = index
+            groups.setdefault(key, []).append(entry)
+        return list(groups.values())
+
+    def write_entries(self, entries):
+        writes = [(entry['person'], entry['weight'], entry['date']) for entry in self.coalesce(entries)]
+        self.interface.write_weights(writes)
+        remaining = self.journal.remove(entry['id'] for entry in entries)
+        self.logger.info("Flushed %i journal entries in one batchUpdate, journal depth now %i",
+                         len(writes), remaining)
+        if self.on_flush is not None:
+            self.on_flush(set(person for person, weight, date_string in writes))
+        return len(writes)
+
+    def flush(self):
+        entries = self.journal.pending_entries()
+        if not entries:
+            return 0
+        try:
+            return self.write_entries(entries)
+        except google_sheets_interface.NETWORK_ERRORS:
+            raise
+        except Exception:
+            self.logger.exception("Writing %i journal entries in one batch failed, writing them one by one",
+                                  len(entries))
+        return self.flush_groups(self.group_entries(entries))
+
+    def flush_groups(self, groups):
+        written = 0
+        failed_groups = 0
+        for group in groups:
+            try:
+                written += self.write_entries(group)
+            except google_sheets_interface.NETWORK_ERRORS:
+                raise
+            except Exception:
+                failure_key = json.dumps(group, sort_keys=True)
+                self.failures[failure_key] = self.failures.get(failure_key, 0) + 1
+                if self.failures[failure_key] < self.max_failures:
+                    failed_groups += 1
+                    self.logger.exception("Could not write journal entries %s", group)
+                    continue
+                del self.failures[failure_key]
+                self.logger.exception("Could not write journal entries %s %i times, moving them to %s",
+                                      group, self.max_failures, self.journal.quarantine_path())
+                self.journal.quarantine(group)
+        if failed_groups:
+            raise JournalFlushError("%i of %i journal entry groups could not be written" % (failed_groups, len(groups)))
+        return written
+
+    def run(self):
+        delay = None
+        while not self.stop_event.is_set():
+            self.wake_up_event.wait(timeout=delay)
+            self.wake_up_event.clear()
+            if self.stop_event.is_set():
+                break
+            try:
+                self.flush()
+                delay = None
+            except google_sheets_interface.NETWORK_ERRORS as exception:
+                delay = min(self.max_retry_interval, delay * 2 if delay else self.retry_interval)
+                self.logger.warning("Flushing the journal failed (depth %i), retrying in %.0f s: %s",
+                                    self.journal_depth(), delay, exception)
+            except Exception:
+                # Anything else must not end the thread, the weights would never be written
+                delay = min(self.max_retry_interval, delay * 2 if delay else self.retry_interval)
+                self.logger.exception("Flushing the journal failed, retrying in %.0f s", delay)